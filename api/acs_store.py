@@ -0,0 +1,152 @@
+# api/acs_store.py
+import os
+import time
+
+import numpy as np
+
+from . import cache_db
+
+# Variables pulled into the local snapshot (name → ACS 5‑year code).
+# Add a row here and re‑run `manage.py ingest_acs` to expose a new metric.
+ACS_VARIABLES = {
+    "population":        "B01003_001E",   # Total population
+    "median_income":     "B19013_001E",   # Median household income
+    "per_capita_income": "B19301_001E",   # Per capita income
+    "median_age":        "B01002_001E",   # Median age
+    "households":        "B11001_001E",   # Total households
+    "median_gross_rent": "B25064_001E",   # Median gross rent
+}
+# Seconds between checks for a newer ingest (e.g. `ingest_acs` run from another process)
+ACS_RECHECK_INTERVAL = int(os.getenv("ACS_RECHECK_INTERVAL", 300))
+
+cache_db.ensure_schema(
+    """CREATE TABLE IF NOT EXISTS acs_snapshot (
+           year      INTEGER NOT NULL,
+           variable  TEXT    NOT NULL,
+           zcta      TEXT    NOT NULL,
+           value     REAL,
+           loaded_at INTEGER NOT NULL,
+           PRIMARY KEY (year, variable, zcta)
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_acs_loaded ON acs_snapshot(year, loaded_at)",
+)
+
+
+def acs_value(raw):
+    """ACS values arrive as strings; negatives are 'not available' sentinels (e.g. -666666666)."""
+    try:
+        val = float(raw)
+    except (TypeError, ValueError):
+        return None
+    return val if val >= 0 else None
+
+
+def save_snapshot(year: int, rows) -> int:
+    """Replace the stored values for every (variable, zcta) in `rows` = [(variable, zcta, value), …]."""
+    now = int(time.time())
+    conn = cache_db.connect()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO acs_snapshot VALUES (?,?,?,?,?)",
+            [(year, var, zcta, val, now) for var, zcta, val in rows],
+        )
+    invalidate()
+    return len(rows)
+
+
+class AcsSnapshot:
+    """
+    In‑memory, column‑oriented view of one ACS year:
+    a sorted array of ZCTAs and a (n_zcta, n_variable) float matrix (NaN = missing),
+    plus which cells were ingested at all (a NaN may be the Census' own "not available").
+    """
+
+    def __init__(self, zctas: np.ndarray, variables: list, values: np.ndarray, present: np.ndarray = None):
+        self.zctas = zctas
+        self.variables = variables
+        self.values = values
+        self.present = ~np.isnan(values) if present is None else present
+        self._col = {v: i for i, v in enumerate(variables)}
+
+    @classmethod
+    def from_db(cls, year: int):
+        rows = cache_db.connect().execute(
+            "SELECT variable, zcta, value FROM acs_snapshot WHERE year=?", (year,)
+        ).fetchall()
+        variables = sorted({r[0] for r in rows})
+        zctas = np.array(sorted({r[1] for r in rows}), dtype="U5")
+        values = np.full((len(zctas), len(variables)), np.nan)
+        present = np.zeros(values.shape, dtype=bool)
+        if rows:
+            col = {v: i for i, v in enumerate(variables)}
+            var_arr, zcta_arr, val_arr = zip(*rows)
+            r = np.searchsorted(zctas, np.array(zcta_arr, dtype="U5"))
+            c = np.fromiter((col[v] for v in var_arr), dtype=np.int64, count=len(rows))
+            values[r, c] = np.array([np.nan if v is None else v for v in val_arr], dtype=float)
+            present[r, c] = True
+        return cls(zctas, variables, values, present)
+
+    def __len__(self):
+        return len(self.zctas)
+
+    def rows_for(self, zip_codes) -> np.ndarray:
+        """Row index per ZIP, -1 where the ZCTA is not in the snapshot."""
+        keys = np.asarray(list(zip_codes), dtype="U5")
+        if not len(self.zctas) or not len(keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        pos = np.searchsorted(self.zctas, keys)
+        pos[pos >= len(self.zctas)] = 0
+        return np.where(self.zctas[pos] == keys, pos, -1)
+
+    def lookup(self, zip_codes, variables=None) -> dict:
+        """
+        {zip: {name: value|None}} by ACS_VARIABLES name, for every ZIP the snapshot has all
+        the requested variables for (None = ingested as not available). ZIPs missing
+        any of them are left out, so callers fall back to the Census API.
+        """
+        names = list(variables or ACS_VARIABLES)
+        cols = [self._col.get(ACS_VARIABLES[n], -1) for n in names]
+        if min(cols, default=0) < 0:
+            return {}                            # a variable was never ingested
+        zip_codes = list(zip_codes)
+        rows = self.rows_for(zip_codes)
+        out = {}
+        for zip_code, r in zip(zip_codes, rows):
+            if r < 0 or not self.present[r, cols].all():
+                continue
+            rec = {}
+            for name, c in zip(names, cols):
+                v = self.values[r, c]
+                rec[name] = None if np.isnan(v) else (int(v) if float(v).is_integer() else float(v))
+            out[zip_code] = rec
+        return out
+
+
+_snapshots = {}          # year → (snapshot, newest loaded_at it contains, checked_at)
+
+
+def _loaded_at(year: int):
+    return cache_db.connect().execute(
+        "SELECT MAX(loaded_at) FROM acs_snapshot WHERE year=?", (year,)
+    ).fetchone()[0]
+
+
+def get_snapshot(year: int) -> AcsSnapshot:
+    """
+    Snapshot for `year`, kept in memory. Every ACS_RECHECK_INTERVAL seconds the
+    process checks for a newer ingest and reloads only if there is one.
+    """
+    entry, now = _snapshots.get(year), time.time()
+    if entry is not None and now - entry[2] < ACS_RECHECK_INTERVAL:
+        return entry[0]
+    stamp = _loaded_at(year)
+    if entry is not None and entry[1] == stamp:
+        _snapshots[year] = (entry[0], stamp, now)
+        return entry[0]
+    snap = AcsSnapshot.from_db(year)
+    _snapshots[year] = (snap, stamp, now)
+    return snap
+
+
+def invalidate() -> None:
+    _snapshots.clear()
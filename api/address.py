@@ -0,0 +1,112 @@
+# api/address.py
+import time
+from typing import Optional
+
+from . import cache_db
+from .boundaries import resolve_offline
+from .fetcher import CACHE_TTL, GOOGLE_API_KEY, cached_get
+from .geo_utils import reverse_geocode
+from .lru import TTLCache
+
+GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+ADDRESS_TTL = CACHE_TTL
+
+cache_db.ensure_schema(
+    """CREATE TABLE IF NOT EXISTS address_cache (
+           location_key TEXT PRIMARY KEY,    -- ZCTA, or rounded "lat,lng" when no ZCTA is known
+           json_result  TEXT NOT NULL,
+           created_at   INTEGER NOT NULL
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_address_age ON address_cache(created_at)",
+)
+_MEMO = TTLCache(maxsize=50_000, ttl=ADDRESS_TTL)
+
+EMPTY_ADDRESS = {"neighborhood": None, "city": None, "city_short": None, "state": None, "zip": None}
+
+
+def parse_geocode(data: dict) -> dict:
+    """Pull neighborhood / city / state / ZIP out of one Google geocode response."""
+    record = dict(EMPTY_ADDRESS)
+    for result in data.get("results", []):
+        for comp in result.get("address_components", []):
+            types = comp.get("types", [])
+            if record["neighborhood"] is None and {"neighborhood", "sublocality", "locality"} & set(types):
+                record["neighborhood"] = comp["long_name"]
+            if "locality" in types and record["city"] is None:
+                record["city"] = comp["long_name"]
+                record["city_short"] = comp["short_name"]
+            if "administrative_area_level_1" in types and record["state"] is None:
+                record["state"] = comp["short_name"]
+            if "postal_code" in types and record["zip"] is None:
+                record["zip"] = comp["short_name"]
+    return record
+
+
+def _location_key(lat: float, lng: float, zip_code: Optional[str]) -> str:
+    return str(zip_code) if zip_code else f"{round(lat, 5)},{round(lng, 5)}"
+
+
+def resolve_address(lat: float, lng: float, zip_code: Optional[str] = None) -> dict:
+    """
+    Structured address for a point: {"neighborhood", "city", "city_short", "state", "zip"}.
+
+    Geocodes at most once per ZCTA (or per rounded point when `zip_code` is not given):
+    the record is memoized in memory and persisted in address_cache. Points covered by
+    the local boundary files (neighborhood + city) never leave the process; otherwise
+    Google is asked, with Nominatim as the last resort for neighborhood / city.
+    Missing fields are None.
+    The returned dict is shared — don't mutate it.
+    """
+    record = resolve_local(lat, lng, zip_code)
+    if record is not None:
+        return record
+
+    try:
+        data = cached_get(GEOCODE_URL, {"latlng": f"{lat},{lng}", "key": GOOGLE_API_KEY})
+    except Exception as e:
+        print(f"[ERROR] resolve_address failed for ({lat}, {lng}): {e}")
+        return EMPTY_ADDRESS
+    return finish_address(lat, lng, zip_code, parse_geocode(data))
+
+
+def resolve_local(lat: float, lng: float, zip_code: Optional[str] = None) -> Optional[dict]:
+    """The address from memory, address_cache or the boundary files; None if Google is needed."""
+    key = _location_key(lat, lng, zip_code)
+    record = _MEMO.get(key)
+    if record is not None:
+        return record
+
+    row = cache_db.connect().execute(
+        "SELECT json_result, created_at FROM address_cache WHERE location_key = ?", (key,)
+    ).fetchone()
+    if row and int(time.time()) - row[1] < ADDRESS_TTL:
+        record = cache_db.decode(row[0])
+        _MEMO.put(key, record, created_at=row[1])
+        return record
+
+    offline = resolve_offline(lat, lng)
+    if offline["neighborhood"] and offline["city"] and offline["state"]:
+        record = dict(EMPTY_ADDRESS, city_short=offline["city"], **offline)
+        if zip_code:
+            record["zip"] = str(zip_code)
+        _MEMO.put(key, record)
+        return record
+    return None
+
+
+def finish_address(lat: float, lng: float, zip_code: Optional[str], record: dict) -> dict:
+    """Fill a parsed geocode record (Nominatim fallback, ZIP) and cache it if it has a city."""
+    if record["city"] is None:
+        neighborhood, city = reverse_geocode(lat, lng)
+        if city != "Unknown":
+            record.update(city=city, city_short=city, neighborhood=record["neighborhood"] or neighborhood)
+
+    if zip_code and record["zip"] is None:
+        record["zip"] = str(zip_code)
+
+    if record["city"] is not None:           # don't pin a failed lookup for a whole TTL
+        key, now = _location_key(lat, lng, zip_code), int(time.time())
+        cache_db.write("INSERT OR REPLACE INTO address_cache VALUES (?,?,?)",
+                       [(key, cache_db.encode(record), now)])
+        _MEMO.put(key, record, created_at=now)
+    return record
@@ -0,0 +1,114 @@
+# api/analysis_store.py
+import os
+import threading
+import time
+from contextlib import contextmanager
+import uuid
+from typing import Optional
+
+from . import cache_db
+from .lru import TTLCache
+from .scoring import ZoneTable
+
+# How long a finished analysis can be re‑weighted by its result_id
+ANALYSIS_TTL = int(os.getenv("ANALYSIS_TTL", 7 * 24 * 3600))
+# How long a new request for the same area reuses an earlier analysis
+AREA_TTL = int(os.getenv("AREA_CACHE_TTL", 24 * 3600))
+AREA_GRID_DEG = float(os.getenv("AREA_GRID_DEG", 0.005))   # centre snapped to ~500 m cells
+AREA_RADIUS_STEP_KM = 0.1
+
+cache_db.ensure_schema(
+    """CREATE TABLE IF NOT EXISTS analysis_result (
+           result_id    TEXT PRIMARY KEY,
+           json_result  TEXT NOT NULL,      -- {"meta": {...}, "zones": [unweighted zone dicts]}
+           created_at   INTEGER NOT NULL
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_analysis_age ON analysis_result(created_at)",
+    # (snapped centre, radius, business type) → latest analysis of that area
+    """CREATE TABLE IF NOT EXISTS area_result (
+           area_key    TEXT PRIMARY KEY,
+           result_id   TEXT NOT NULL,
+           created_at  INTEGER NOT NULL
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_area_age ON area_result(created_at)",
+)
+_TABLES = TTLCache(maxsize=256, ttl=ANALYSIS_TTL)      # result_id → (meta, ZoneTable)
+_AREAS = TTLCache(maxsize=4096, ttl=AREA_TTL)           # area_key → result_id
+_AREA_LOCKS = {}                                       # area_key → [Lock, users], one computation per area
+_AREA_LOCKS_GUARD = threading.Lock()
+
+
+def save_analysis(table: ZoneTable, meta: dict) -> str:
+    """Persist the raw (unweighted) zones of one analysis; returns its result_id."""
+    result_id, now = uuid.uuid4().hex, int(time.time())
+    cache_db.write("INSERT INTO analysis_result VALUES (?,?,?)",
+                   [(result_id, cache_db.encode({"meta": meta, "zones": table.zones}), now)])
+    _TABLES.put(result_id, (meta, table), created_at=now)
+    return result_id
+
+
+def load_analysis(result_id: str) -> Optional[tuple]:
+    """(meta, ZoneTable) for a stored analysis, or None if unknown / expired."""
+    hit = _TABLES.get(result_id)
+    if hit is not None:
+        return hit
+    row = cache_db.connect().execute(
+        "SELECT json_result, created_at FROM analysis_result WHERE result_id = ?", (result_id,)
+    ).fetchone()
+    if not row or int(time.time()) - row[1] >= ANALYSIS_TTL:
+        return None
+    stored = cache_db.decode(row[0])
+    hit = (stored["meta"], ZoneTable(stored["zones"]))
+    _TABLES.put(result_id, hit, created_at=row[1])
+    return hit
+
+
+#################################################
+# Area cache: same neighbourhood, radius and business type → same analysis
+#################################################
+def snap_area(lat: float, lng: float, radius_km: float):
+    """(lat, lng, radius_km) snapped to the area‑cache grid."""
+    def snap(v, step):
+        return round(round(float(v) / step) * step, 6)
+    return snap(lat, AREA_GRID_DEG), snap(lng, AREA_GRID_DEG), snap(radius_km, AREA_RADIUS_STEP_KM)
+
+
+def area_key(lat: float, lng: float, radius_km: float, business_type: str) -> str:
+    lat, lng, radius_km = snap_area(lat, lng, radius_km)
+    return f"{lat},{lng}|{radius_km}|{' '.join(str(business_type).lower().split())}"
+
+
+def find_area(key: str) -> Optional[str]:
+    """result_id of a fresh analysis for this area, or None."""
+    result_id = _AREAS.get(key)
+    if result_id is not None:
+        return result_id
+    row = cache_db.connect().execute(
+        "SELECT result_id, created_at FROM area_result WHERE area_key = ?", (key,)
+    ).fetchone()
+    if row and int(time.time()) - row[1] < AREA_TTL:
+        _AREAS.put(key, row[0], created_at=row[1])
+        return row[0]
+    return None
+
+
+def remember_area(key: str, result_id: str) -> None:
+    now = int(time.time())
+    _AREAS.put(key, result_id, created_at=now)
+    cache_db.write("INSERT OR REPLACE INTO area_result VALUES (?,?,?)", [(key, result_id, now)])
+
+
+@contextmanager
+def area_lock(key: str):
+    """Serialize computations of one area so concurrent identical requests run it once."""
+    with _AREA_LOCKS_GUARD:
+        entry = _AREA_LOCKS.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _AREA_LOCKS_GUARD:
+            entry[1] -= 1
+            if entry[1] == 0:
+                _AREA_LOCKS.pop(key, None)
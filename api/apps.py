@@ -1,6 +1,15 @@
+import os
+
 from django.apps import AppConfig
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Optional background cache sweeper: CACHE_SWEEP_INTERVAL=<seconds>
+        interval = float(os.getenv("CACHE_SWEEP_INTERVAL", 0))
+        if interval:
+            from .cache_maintenance import CACHE_MAX_MB, start_sweeper
+            start_sweeper(interval, int(CACHE_MAX_MB * 1024 * 1024) if CACHE_MAX_MB else None)
@@ -0,0 +1,266 @@
+# api/async_fetcher.py
+import asyncio
+import os
+import random
+import weakref
+
+import httpx
+
+from . import metrics
+from .concurrency import UPSTREAM_LIMITS
+from .fetcher import (
+    CACHE_TTL,
+    CENSUS_BATCH_SIZE,
+    CENSUS_URL,
+    CENSUS_VARS,
+    CENSUS_YEAR,
+    GOOGLE_API_KEY,
+    NEARBY_MAX_RESULTS,
+    NEARBY_URL,
+    RATE_KEYS,
+    TRAFFIC_TYPES,
+    _cache_load,
+    _cache_store,
+    _cache_store_many,
+    _census_key,
+    _census_params,
+    _fresh,
+    _mk_cache_key,
+    _negative_get,
+    _negative_put,
+    _parse_census_rows,
+    _upstream_for,
+    get_snapshot,
+    is_throttled,
+    route_url,
+)
+from .places_tiles import covered_count, record_search
+from .ratelimit import aacquire, key_id, throttled
+
+# Connection pool / timeout / retry tuning
+HTTP_TIMEOUT = httpx.Timeout(float(os.getenv("HTTP_READ_TIMEOUT", 10)), connect=3.0, pool=5.0)
+HTTP_LIMITS = httpx.Limits(
+    max_connections=sum(UPSTREAM_LIMITS.values()),
+    max_keepalive_connections=sum(UPSTREAM_LIMITS.values()),
+    keepalive_expiry=30.0,
+)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5     # seconds; full‑jitter exponential backoff
+BACKOFF_CAP = 8.0
+
+# One client, one set of per‑upstream semaphores and one in‑flight table per event loop
+# (httpx clients and asyncio primitives are bound to the loop that created them).
+_loop_state = weakref.WeakKeyDictionary()
+
+
+def _state():
+    loop = asyncio.get_running_loop()
+    st = _loop_state.get(loop)
+    if st is None:
+        client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+        sems = {name: asyncio.Semaphore(n) for name, n in UPSTREAM_LIMITS.items()}
+        st = _loop_state[loop] = (client, sems, {})
+    return st
+
+
+async def aclose() -> None:
+    """Close the current loop's HTTP client (call on shutdown)."""
+    st = _loop_state.pop(asyncio.get_running_loop(), None)
+    if st:
+        await st[0].aclose()
+
+
+def _retry_delay(attempt: int, resp=None) -> float:
+    if resp is not None:
+        retry_after = resp.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), BACKOFF_CAP)
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+async def request(url: str, params: dict, upstream: str, timeout=None) -> httpx.Response:
+    """
+    GET `url` through the shared pooled client and rate limiter, holding one `upstream`
+    slot per attempt. Throttled replies cut the shared rate and wait on the limiter;
+    transport errors and other RETRY_STATUSES retry with jittered backoff.
+    Raises on final failure.
+    """
+    client, sems, _ = _state()
+    rate_key = RATE_KEYS.get(upstream, "default")
+    for attempt in range(MAX_RETRIES + 1):
+        resp = None
+        try:
+            await aacquire(upstream, rate_key)
+            metrics.inc("upstream_requests_total", api=upstream)
+            async with sems[upstream]:
+                with metrics.span("upstream", api=upstream):
+                    resp = await client.get(route_url(url), params=params, timeout=timeout or HTTP_TIMEOUT)
+            if is_throttled(resp):
+                metrics.inc("upstream_errors_total", api=upstream, reason="throttled")
+                await asyncio.to_thread(throttled, upstream, rate_key)
+                if attempt < MAX_RETRIES:
+                    continue                  # the limiter decides when to try again
+            elif resp.status_code >= 400:
+                metrics.inc("upstream_errors_total", api=upstream, reason=str(resp.status_code))
+            if resp.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                resp.raise_for_status()
+                return resp
+        except httpx.TransportError:
+            metrics.inc("upstream_errors_total", api=upstream, reason="transport")
+            if attempt == MAX_RETRIES:
+                raise
+        await asyncio.sleep(_retry_delay(attempt, resp))
+
+
+async def async_cached_get(endpoint: str, params: dict, ttl: int = CACHE_TTL) -> dict:
+    """
+    Async twin of fetcher.cached_get: same cache table, same keys, same caching rules,
+    same negative cache; concurrent misses on one key share a single upstream call.
+    """
+    key = _mk_cache_key(endpoint, params)
+
+    # ---- lookup
+    data = await asyncio.to_thread(_cache_load, key, ttl)
+    if data is not None:
+        metrics.cache_result("places", True)
+        return data
+
+    neg = _negative_get(key)
+    if neg is not None:
+        if isinstance(neg, Exception):
+            raise _fresh(neg)
+        return neg
+
+    # ---- single‑flight
+    inflight = _state()[2]
+    flight = inflight.get(key)
+    if flight is not None:
+        return await asyncio.shield(flight)
+
+    flight = inflight[key] = asyncio.get_running_loop().create_future()
+    try:
+        metrics.cache_result("places", False)
+
+        # ---- miss → hit Google
+        resp = await request(endpoint, params, _upstream_for(endpoint), timeout=5)
+        data = resp.json()
+
+        # cache only successful responses (status=OK | ZERO_RESULTS); remember deterministic failures briefly
+        if data.get("status") in {"OK", "ZERO_RESULTS"}:
+            await asyncio.to_thread(_cache_store, key, data)
+        else:
+            metrics.inc("upstream_errors_total", api=_upstream_for(endpoint), reason=str(data.get("status")))
+            _negative_put(key, data)
+        flight.set_result(data)
+        return data
+    except Exception as e:
+        _negative_put(key, e)
+        flight.set_exception(e)
+        flight.exception()            # mark retrieved so an unawaited flight doesn't warn
+        raise
+    finally:
+        inflight.pop(key, None)
+
+
+async def async_fetch_census_batch(zip_codes) -> dict:
+    """Async twin of fetcher.fetch_census_batch; uncached chunks are fetched concurrently."""
+    zip_codes = list(dict.fromkeys(str(z) for z in zip_codes))
+    out = get_snapshot(CENSUS_YEAR).lookup(zip_codes, CENSUS_VARS)
+
+    rest = [z for z in zip_codes if z not in out]
+    hits = await asyncio.to_thread(lambda: {z: _cache_load(_census_key(z)) for z in rest})
+    out.update({z: rec for z, rec in hits.items() if rec is not None})
+    missing = [z for z in rest if hits[z] is None]
+    metrics.cache_result("census", True, len(zip_codes) - len(missing))
+    metrics.cache_result("census", False, len(missing))
+
+    async def _fetch(chunk):
+        try:
+            response = await request(CENSUS_URL, _census_params(chunk), "census", timeout=15)
+            rows = response.json() if response.status_code != 204 else []
+        except Exception as e:
+            print(f"Error fetching Census batch ({len(chunk)} ZIPs): {e}")
+            return {}
+        return _parse_census_rows(rows)
+
+    chunks = [missing[i:i + CENSUS_BATCH_SIZE] for i in range(0, len(missing), CENSUS_BATCH_SIZE)]
+    for fetched in await asyncio.gather(*(_fetch(c) for c in chunks)):
+        out.update(fetched)
+        if fetched:
+            await asyncio.to_thread(_cache_store_many, {_census_key(z): rec for z, rec in fetched.items()})
+    return out
+
+
+async def anearby_count(lat: float, lng: float, radius_m: int, place_type: str, paginate: bool = False) -> int:
+    """Async twin of fetcher.nearby_count (same tile store, same Places cache)."""
+    local = await asyncio.to_thread(covered_count, lat, lng, radius_m, place_type, CACHE_TTL)
+    metrics.cache_result("places_tile", local is not None)
+    if local is not None:
+        return local
+
+    params = {
+        "location": f"{lat},{lng}",
+        "radius": radius_m,
+        "type": place_type,
+        "key": GOOGLE_API_KEY
+    }
+    results, complete = [], False
+    while True:
+        res = await async_cached_get(NEARBY_URL, dict(params))
+        status = res.get("status")
+        if paginate and status != "OK":
+            if status != "ZERO_RESULTS":
+                print(f"Google Places API Error: {status}")
+            complete = status == "ZERO_RESULTS"
+            break
+
+        results.extend(res.get("results", []))
+        complete = (status in {"OK", "ZERO_RESULTS"} and "next_page_token" not in res
+                    and len(results) < NEARBY_MAX_RESULTS)
+
+        if paginate and "next_page_token" in res:
+            await asyncio.sleep(2)            # Google needs a moment before the token is valid
+            params["pagetoken"] = res["next_page_token"]
+        else:
+            break
+
+    record_search(lat, lng, radius_m, place_type, results, complete)
+    return len(results)
+
+
+async def afetch_location_metrics(lat: float, lng: float, radius_m: int = 300,
+                                  competitor_types=(), base: bool = True) -> dict:
+    """Async twin of fetcher.fetch_location_metrics."""
+    jobs = [("competitors", t, True) for t in competitor_types]
+    if base:
+        jobs += [("traffic_score", t, False) for t in TRAFFIC_TYPES] + [("parking_score", "parking", False)]
+    counts = await asyncio.gather(*(anearby_count(lat, lng, radius_m, t, paginate) for _, t, paginate in jobs))
+
+    out = {"competitors": {}}
+    if base:
+        out["traffic_score"], out["parking_score"] = 0, 0
+    for (field, t, _), n in zip(jobs, counts):
+        if field == "competitors":
+            out["competitors"][t] = n
+        else:
+            out[field] += n
+    return out
+
+
+async def ainvoke_llm(model, prompt):
+    """`await model.ainvoke(prompt)` under the shared OpenAI rate limit and this loop's slots."""
+    rate_key = key_id(os.getenv("OPENAI_API_KEY"))
+    await aacquire("openai", rate_key)
+    metrics.inc("upstream_requests_total", api="openai")
+    try:
+        async with _state()[1]["openai"]:
+            with metrics.span("llm"):
+                return await model.ainvoke(prompt)
+    except Exception as e:
+        if type(e).__name__ == "RateLimitError":       # openai.RateLimitError (HTTP 429)
+            metrics.inc("upstream_errors_total", api="openai", reason="throttled")
+            await asyncio.to_thread(throttled, "openai", rate_key)
+        else:
+            metrics.inc("upstream_errors_total", api="openai", reason=type(e).__name__)
+        raise
@@ -0,0 +1,241 @@
+# api/async_pipeline.py
+#
+# Async twin of the rank_and_store pipeline in location_utils: the same caches,
+# the same scoring and the same stored results, but every upstream call is a
+# coroutine (httpx / ChatOpenAI.ainvoke), so one event loop can keep hundreds
+# of analyses in flight. Only SQLite access and CPU work (candidate lookup,
+# scoring) are pushed to threads.
+import asyncio
+import weakref
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from .address import GEOCODE_URL, EMPTY_ADDRESS, finish_address, parse_geocode, resolve_local
+from .analysis_store import area_key, find_area, load_analysis, remember_area, save_analysis, snap_area
+from .async_fetcher import afetch_location_metrics, ainvoke_llm, async_cached_get, async_fetch_census_batch
+from .fetcher import GOOGLE_API_KEY
+from .insight_cache import load_insight, save_insight
+from .scoring import METRIC_KEYS, ZoneTable
+from .zip_cache import load_zip, save_zip
+from . import location_utils, metrics, rent_agent
+
+# area_key → Future of (result_id, ZoneTable), per event loop: concurrent requests
+# for one area share a single analysis
+_area_flights = weakref.WeakKeyDictionary()
+
+
+#################################################
+# Addresses + rent
+#################################################
+async def aresolve_address(lat: float, lng: float, zip_code: Optional[str] = None) -> dict:
+    """Async twin of address.resolve_address."""
+    record = await asyncio.to_thread(resolve_local, lat, lng, zip_code)
+    if record is not None:
+        return record
+    try:
+        data = await async_cached_get(GEOCODE_URL, {"latlng": f"{lat},{lng}", "key": GOOGLE_API_KEY})
+    except Exception as e:
+        print(f"[ERROR] resolve_address failed for ({lat}, {lng}): {e}")
+        return EMPTY_ADDRESS
+    return await asyncio.to_thread(finish_address, lat, lng, zip_code, parse_geocode(data))
+
+
+async def aget_rent_affordability_scores(pairs) -> dict:
+    """Async twin of rent_agent.get_rent_affordability_scores; prompt batches run concurrently."""
+    pairs, keys, labels, todo = await asyncio.to_thread(rent_agent._pending_pairs, pairs)
+    batches = [todo[i:i + rent_agent.RENT_BATCH_SIZE] for i in range(0, len(todo), rent_agent.RENT_BATCH_SIZE)]
+
+    async def _classify(batch):
+        try:
+            response = await ainvoke_llm(rent_agent.llm, rent_agent._build_batch_prompt(batch))
+            return rent_agent._remember_labels(batch, keys, rent_agent._parse_batch_labels(response.content, len(batch)))
+        except Exception as e:
+            print(f"Error fetching affordability scores for {len(batch)} neighborhoods: {e}")
+            rent_agent._remember_failed(batch, keys)
+            return {}
+
+    for fresh in await asyncio.gather(*(_classify(b) for b in batches)):
+        labels.update(fresh)
+    return {pair: rent_agent.label_to_score.get(labels.get(keys[pair]), 0.5) for pair in pairs}
+
+
+async def aget_rent_score_from_coordinates(lat: float, lng: float, zip_code: str = None) -> float:
+    try:
+        pair = rent_agent._rent_pair(await aresolve_address(lat, lng, zip_code))
+        return (await aget_rent_affordability_scores([pair]))[pair]
+    except Exception as e:
+        print(f"Error resolving rent score for ({lat}, {lng}): {e}")
+        return 0.5
+
+
+async def aprefetch_rent_scores(locations) -> None:
+    """Async twin of rent_agent.prefetch_rent_scores."""
+    addresses = await asyncio.gather(*(aresolve_address(*loc) for loc in locations))
+    await aget_rent_affordability_scores([rent_agent._rent_pair(a) for a in addresses if a])
+
+
+#################################################
+# Per‑ZIP metrics
+#################################################
+async def _timed(name: str, awaitable, **labels):
+    with metrics.span(name, **labels):
+        return await awaitable
+
+
+async def aevaluate_zip(zip_code: str, lat: float, lng: float,
+                        place_type: str = "restaurant", radius_m: int = 1000) -> Optional[Dict]:
+    """Async twin of location_utils.evaluate_zip (takes the ZIP and its centroid)."""
+    with metrics.span("evaluate_zip"):
+        return await _aevaluate_zip(zip_code, lat, lng, place_type, radius_m)
+
+
+async def _aevaluate_zip(zip_code: str, lat: float, lng: float, place_type: str, radius_m: int) -> Optional[Dict]:
+    try:
+        cached = await asyncio.to_thread(load_zip, zip_code)
+        if cached is None:
+            census, places, rent = await asyncio.gather(
+                _timed("zip_metric", async_fetch_census_batch([zip_code]), metric="census"),
+                _timed("zip_metric", afetch_location_metrics(lat, lng, radius_m, competitor_types=[place_type]),
+                       metric="places"),
+                _timed("zip_metric", aget_rent_score_from_coordinates(lat, lng, zip_code), metric="rent"),
+            )
+            census = census.get(zip_code, {})
+            cached = {
+                "zip":           zip_code,
+                "lat":           lat,
+                "lng":           lng,
+                "population":    census.get("population"),
+                "median_income": census.get("median_income"),
+                "rent_cost":     rent,
+                "traffic_score": places["traffic_score"],
+                "parking_score": places["parking_score"],
+                "competitors":   places["competitors"],
+            }
+            save_zip(zip_code, cached)
+        elif place_type not in cached["competitors"]:
+            with metrics.span("zip_metric", metric="competitors"):
+                places = await afetch_location_metrics(lat, lng, radius_m, competitor_types=[place_type], base=False)
+            cached["competitors"].update(places["competitors"])
+            save_zip(zip_code, cached)
+
+        with metrics.span("zip_metric", metric="city"):
+            address = await aresolve_address(lat, lng, zip_code)
+        return {
+            "zip":              zip_code,
+            "lat":              cached["lat"],
+            "lng":              cached["lng"],
+            "population":       cached["population"],
+            "median_income":    cached["median_income"],
+            "rent_cost":        cached["rent_cost"],
+            "competitor_count": cached["competitors"][place_type],
+            "traffic_score":    cached["traffic_score"],
+            "parking_score":    cached["parking_score"],
+            "city":             address["city"],
+        }
+    except Exception as e:
+        print(f"[ERROR] evaluate_zip {zip_code}: {e}")
+        return None
+
+
+def _candidates(lat: float, lng: float, radius_km: float) -> List[Tuple[str, float, float]]:
+    with metrics.span("candidates"):
+        frame = location_utils.get_zip_codes_within_radius(lat, lng, radius_km)
+    return [(row["ZCTA5CE20"], row.geometry.centroid.y, row.geometry.centroid.x) for _, row in frame.iterrows()]
+
+
+async def acollect_zones(center_lat: float, center_lng: float, radius_km: float,
+                         place_type: str = "restaurant") -> Tuple[List[Dict], int]:
+    """Async twin of location_utils.collect_zones: (zones, failed)."""
+    candidates = await asyncio.to_thread(_candidates, center_lat, center_lng, radius_km)
+
+    # Census for every candidate in one ACS request, rent for every candidate in one LLM round
+    await asyncio.gather(
+        _timed("census_batch", async_fetch_census_batch([z for z, _, _ in candidates])),
+        _timed("rent_batch", aprefetch_rent_scores([(lat, lng, z) for z, lat, lng in candidates])),
+    )
+
+    results = await asyncio.gather(*(aevaluate_zip(z, lat, lng, place_type) for z, lat, lng in candidates))
+    zones = [r for r in results if r and all(r.get(k) is not None for k in METRIC_KEYS)]
+
+    def _links():
+        for z in zones:
+            with metrics.span("loopnet_url"):
+                z["loopnet_url"] = location_utils.construct_loopnet_url(z["zip"], z["lat"], z["lng"])
+    await asyncio.to_thread(_links)            # addresses are cached by now: no upstream calls
+    return zones, sum(r is None for r in results)
+
+
+#################################################
+# Ranking
+#################################################
+async def _analyze_area(key: str, center_lat: float, center_lng: float, radius_km: float,
+                        place_type: str, top_n: int) -> Tuple[str, ZoneTable]:
+    lat, lng, radius = snap_area(center_lat, center_lng, radius_km)
+    zones, failed = await acollect_zones(lat, lng, radius, place_type)
+    with metrics.span("scoring"):
+        table = await asyncio.to_thread(ZoneTable, zones)
+    meta = {"lat": lat, "lng": lng, "radius_km": radius, "business_type": place_type, "top_n": top_n}
+    result_id = save_analysis(table, meta)
+    if zones and not failed:
+        remember_area(key, result_id)
+    else:
+        print(f"[WARN] area {key}: {failed} ZIP(s) failed, {len(zones)} scorable; not cached")
+    return result_id, table
+
+
+async def arank_and_store(center_lat: float, center_lng: float, radius_km: float, weights: Dict[str, float],
+                          place_type: str = "restaurant", top_n: int = 5,
+                          use_cache: bool = True) -> Tuple[str, List[Dict]]:
+    """Async twin of location_utils.rank_and_store (same area cache, same stored results)."""
+    key = area_key(center_lat, center_lng, radius_km, place_type)
+    if use_cache:
+        result_id = await asyncio.to_thread(find_area, key)
+        stored = await asyncio.to_thread(load_analysis, result_id) if result_id else None
+        metrics.cache_result("area", stored is not None)
+        if stored is not None:
+            with metrics.span("ranking"):
+                return result_id, stored[1].rank(weights, top_n)
+
+    flights = _area_flights.setdefault(asyncio.get_running_loop(), {})
+    flight = flights.get(key)
+    if flight is None:
+        flight = flights[key] = asyncio.ensure_future(
+            _analyze_area(key, center_lat, center_lng, radius_km, place_type, top_n))
+        flight.add_done_callback(lambda _: flights.pop(key, None))
+    result_id, table = await asyncio.shield(flight)
+    with metrics.span("ranking"):
+        return result_id, table.rank(weights, top_n)
+
+
+#################################################
+# Insights
+#################################################
+async def afetch_lifestyle_fit(zone: Dict, business_type: str) -> Optional[str]:
+    """Async twin of location_utils.fetch_lifestyle_fit."""
+    cached = await asyncio.to_thread(load_insight, zone, business_type)
+    if cached is not None:
+        return cached
+
+    neighborhood = (await aresolve_address(zone["lat"], zone["lng"], zone.get("zip")))["neighborhood"]
+    zone_name = neighborhood or f"ZIP code {zone.get('zip', 'Unknown')}"
+    try:
+        response = await ainvoke_llm(location_utils.insight_llm,
+                                     location_utils.insight_prompt(zone, business_type, zone_name))
+        insight = response.content.strip()
+        save_insight(zone, business_type, insight)
+        return insight
+    except Exception as e:
+        print(f"Error fetching lifestyle fit: {e}")
+        return None
+
+
+async def agenerate_insights(zones: List[Dict], business_type: str) -> List[Optional[str]]:
+    return list(await asyncio.gather(*(afetch_lifestyle_fit(z, business_type) for z in zones)))
+
+
+async def aiter_insights(zones: List[Dict], business_type: str) -> AsyncIterator[Tuple[int, Optional[str]]]:
+    """Yield (zone index, insight) for every zone as soon as each one is ready."""
+    async def _one(i, zone):
+        return i, await afetch_lifestyle_fit(zone, business_type)
+
+    for fut in asyncio.as_completed([_one(i, z) for i, z in enumerate(zones)]):
+        yield await fut
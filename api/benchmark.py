@@ -0,0 +1,453 @@
+# api/benchmark.py
+"""
+Offline benchmark for the ranking pipeline (rank_and_store / arank_and_store).
+
+    python manage.py benchmark --record [--seed api/places_cache.sqlite]   # build the fixture
+    python manage.py benchmark --save-baseline                             # store the reference numbers
+    python manage.py benchmark                                             # compare; exits 1 on regressions
+                                                                           # or a missing baseline
+
+Every sample runs in a fresh process against a private copy of the fixture
+(recorded places_cache + acs_snapshot rows), with the Google / Census / Nominatim
+endpoints answered by api.upstream_stub and both LLMs replaced by FakeChatModel,
+so runs are deterministic and never leave the machine. Derived caches (ZIP
+metrics, addresses, rent labels, insights, analyses) start empty each sample.
+"""
+import asyncio
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import os
+import platform
+import re
+import resource
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Dict, List, Optional
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_DIR = os.path.join(BASE_DIR, "data", "benchmark")
+FIXTURE_PATH = os.path.join(BENCH_DIR, "fixture.sqlite")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+# Recorded upstream responses; everything else is derived and rebuilt by the pipeline
+FIXTURE_TABLES = ("places_cache", "acs_snapshot")
+
+METROS = {
+    "nyc":     (40.7128, -74.0060),
+    "la":      (34.0522, -118.2437),
+    "chicago": (41.8781, -87.6298),
+    "houston": (29.7604, -95.3698),
+    "sf":      (37.7749, -122.4194),
+}
+RADII_KM = (2, 5, 10)
+BUSINESS_TYPES = ("restaurant", "cafe", "barbershop")
+# Default suite: every metro, radius and type at least once, without the full product
+DEFAULT_SUITE = [
+    ("nyc", 5, "restaurant"), ("nyc", 10, "cafe"),
+    ("la", 5, "barbershop"), ("la", 10, "restaurant"),
+    ("chicago", 2, "cafe"), ("chicago", 5, "restaurant"),
+    ("houston", 10, "barbershop"), ("sf", 2, "restaurant"),
+]
+BENCH_WEIGHTS = {"traffic": 0.2, "parking": 0.1, "population": 0.3,
+                 "median_income": 0.1, "rent_cost": 0.2, "competition": 0.1}
+
+REPEAT = 3                    # cold samples (processes) per scenario
+WARM_RUNS = 5                 # area‑cache hits timed per sample
+UPSTREAM_LATENCY_MS = 50      # stub delay for requests the fixture doesn't cover
+LLM_LATENCY_MS = 100          # FakeChatModel delay per call
+LATENCY_TOLERANCE = float(os.getenv("BENCH_LATENCY_TOLERANCE", 0.25))   # +25 % p50 → regression
+MEMORY_TOLERANCE = float(os.getenv("BENCH_MEMORY_TOLERANCE", 0.15))     # +15 % peak RSS → regression
+MIN_LATENCY_DELTA_MS = 5.0    # ignore slowdowns smaller than this (timer noise on fast paths)
+
+
+def scenarios(metros=None, radii=None, types=None) -> List[dict]:
+    """DEFAULT_SUITE, or the full product of whichever dimensions are given (the rest: all)."""
+    if metros is None and radii is None and types is None:
+        combos = DEFAULT_SUITE
+    else:
+        combos = itertools.product(metros or METROS, radii or RADII_KM, types or BUSINESS_TYPES)
+    out = []
+    for metro, radius, place_type in combos:
+        if metro not in METROS:
+            raise ValueError(f"Unknown metro {metro!r} (known: {', '.join(METROS)})")
+        lat, lng = METROS[metro]
+        out.append({"name": f"{metro}-{radius:g}km-{place_type}", "lat": lat, "lng": lng,
+                    "radius_km": float(radius), "business_type": place_type})
+    return out
+
+
+#################################################
+# Fake LLM backend
+#################################################
+class FakeMessage:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class FakeChatModel:
+    """
+    Stands in for ChatOpenAI: rent prompts get a label per listed neighbourhood
+    (a hash of its name, so stable across runs), insight prompts a fixed text.
+    """
+    _LISTING = re.compile(r"^\s+(\d+)\. '(.*)', (.*)$", re.M)
+    _LABELS = ("affordable", "moderate", "expensive")
+
+    def __init__(self, latency_ms: float = LLM_LATENCY_MS):
+        self.latency = latency_ms / 1000.0
+
+    def _reply(self, prompt: str) -> FakeMessage:
+        listing = self._LISTING.findall(prompt)
+        if listing:
+            labels = {i: self._LABELS[int(hashlib.sha1(f"{n}|{c}".encode()).hexdigest(), 16) % 3]
+                      for i, n, c in listing}
+            return FakeMessage(json.dumps(labels))
+        return FakeMessage("Strong foot traffic and a solid residential base.\n\n"
+                           "Rents and nearby competition are the main risks.\n\n"
+                           "A good fit if the concept stands out from existing options.")
+
+    def invoke(self, prompt):
+        time.sleep(self.latency)
+        return self._reply(prompt)
+
+    async def ainvoke(self, prompt):
+        await asyncio.sleep(self.latency)
+        return self._reply(prompt)
+
+
+#################################################
+# Fixture
+#################################################
+def fixture_signature(path: str) -> Optional[str]:
+    if not os.path.exists(path):
+        return None
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()[:16]
+
+
+def export_fixture(source_db: str, dest: str) -> Dict[str, int]:
+    """Copy FIXTURE_TABLES from a cache database into a fresh fixture file; {table: rows}."""
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    tmp = f"{dest}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    src = sqlite3.connect(source_db)
+    out = sqlite3.connect(tmp)
+    counts = {}
+    try:
+        for table in FIXTURE_TABLES:
+            ddl = src.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()
+            if ddl is None:
+                continue
+            out.execute(ddl[0])
+            rows = src.execute(f"SELECT * FROM {table}").fetchall()
+            if rows:
+                out.executemany(f"INSERT INTO {table} VALUES ({','.join('?' * len(rows[0]))})", rows)
+            counts[table] = len(rows)
+        out.commit()
+        out.execute("VACUUM")
+    finally:
+        src.close()
+        out.close()
+    os.replace(tmp, dest)
+    return counts
+
+
+def _copy_fixture(fixture: Optional[str], dest: str) -> None:
+    """Private working copy of the fixture, with recorded rows made fresh (cache TTLs start now)."""
+    if fixture and os.path.exists(fixture):
+        src, dst = sqlite3.connect(fixture), sqlite3.connect(dest)
+        try:
+            src.backup(dst)
+            if dst.execute("SELECT 1 FROM sqlite_master WHERE name='places_cache'").fetchone():
+                dst.execute("UPDATE places_cache SET created_at = ?", (int(time.time()),))
+            dst.commit()
+        finally:
+            src.close()
+            dst.close()
+
+
+#################################################
+# One sample (runs in a fresh process)
+#################################################
+def _sandbox(workdir: str, db_path: str, upstream_url: str) -> dict:
+    env = {
+        "PLACES_CACHE_DB": db_path,
+        "RATE_LIMIT_DB": os.path.join(workdir, "ratelimit.sqlite"),
+        "UPSTREAM_BASE_URL": upstream_url,
+        "CACHE_SWEEP_INTERVAL": "0",
+        "OPENAI_API_KEY": "benchmark",
+        "GOOGLE_API_KEY": "benchmark",
+        "CENSUS_API_KEY": "benchmark",
+    }
+    for api in ("PLACES", "GEOCODE", "CENSUS", "OPENAI", "NOMINATIM"):
+        env[f"{api}_QPS"] = "1000000"           # nothing real is called: don't pace the stub
+    return env
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _boot(fixture: Optional[str], workdir: str, upstream_latency_ms: float, llm_latency_ms: float):
+    """Point this process at a private cache copy + the stub, start Django, install the fake LLMs."""
+    from . import upstream_stub
+
+    db_path = os.path.join(workdir, "cache.sqlite")
+    _copy_fixture(fixture, db_path)
+    server, base = upstream_stub.serve_in_thread(latency_ms=upstream_latency_ms)
+    os.environ.update(_sandbox(workdir, db_path, base))
+
+    import django
+    django.setup()
+
+    from . import location_utils, rent_agent
+    from .acs_store import get_snapshot
+    from .boundaries import get_layers
+    from .fetcher import CENSUS_YEAR
+
+    rent_agent.llm = FakeChatModel(llm_latency_ms)
+    location_utils.insight_llm = FakeChatModel(llm_latency_ms)
+
+    # process start‑up costs, not per‑request work
+    location_utils.get_zip_index()
+    get_layers()
+    get_snapshot(CENSUS_YEAR)
+    return server
+
+
+def _rank(scenario: dict, pipeline: str, use_cache: bool):
+    from . import async_fetcher, async_pipeline, location_utils
+
+    args = (scenario["lat"], scenario["lng"], scenario["radius_km"], BENCH_WEIGHTS, scenario["business_type"])
+    if pipeline == "async":
+        async def _run():
+            try:
+                return await async_pipeline.arank_and_store(*args, top_n=5, use_cache=use_cache)
+            finally:
+                await async_fetcher.aclose()
+        return asyncio.run(_run())
+    return location_utils.rank_and_store(*args, top_n=5, use_cache=use_cache)
+
+
+def _insights(zones: List[dict], business_type: str, pipeline: str):
+    from . import async_fetcher, async_pipeline, location_utils
+
+    if pipeline == "async":
+        async def _run():
+            try:
+                return await async_pipeline.agenerate_insights(zones, business_type)
+            finally:
+                await async_fetcher.aclose()
+        return asyncio.run(_run())
+    return location_utils.generate_insights(zones, business_type)
+
+
+def _ms(t0: float) -> float:
+    return (time.perf_counter() - t0) * 1000
+
+
+def run_sample(scenario: dict, fixture: Optional[str], pipeline: str = "sync", warm_runs: int = WARM_RUNS,
+               upstream_latency_ms: float = UPSTREAM_LATENCY_MS, llm_latency_ms: float = LLM_LATENCY_MS) -> dict:
+    """
+    One cold analysis of `scenario` (+ its insights), one recompute with the ZIP‑level
+    caches warm, and `warm_runs` area‑cache hits. Call in a fresh process.
+    """
+    workdir = tempfile.mkdtemp(prefix="firestore-bench-")
+    try:
+        server = _boot(fixture, workdir, upstream_latency_ms, llm_latency_ms)
+        from . import cache_db, metrics
+
+        rss_before = _peak_rss_mb()
+        with contextlib.redirect_stdout(io.StringIO()):
+            metrics.reset()
+            with metrics.collect_timings() as timings:
+                t0 = time.perf_counter()
+                _, zones = _rank(scenario, pipeline, use_cache=True)
+                cold = _ms(t0)
+            t0 = time.perf_counter()
+            _insights(zones, scenario["business_type"], pipeline)
+            insights = _ms(t0)
+            counters = metrics.snapshot()["counters"]
+
+            t0 = time.perf_counter()
+            _rank(scenario, pipeline, use_cache=False)
+            recompute = _ms(t0)
+
+            warm = []
+            for _ in range(warm_runs):
+                t0 = time.perf_counter()
+                _rank(scenario, pipeline, use_cache=True)
+                warm.append(_ms(t0))
+            cache_db.flush()
+
+        upstream = {}
+        for series, n in counters.items():
+            match = re.match(r'upstream_requests_total\{api="(\w+)"\}', series)
+            if match:
+                upstream[match.group(1)] = int(n)
+        server.shutdown()
+        return {
+            "zones": len(zones),
+            "cold_ms": cold,
+            "insights_ms": insights,
+            "recompute_ms": recompute,
+            "warm_ms": warm,
+            "upstream": upstream,
+            "stages_ms": {name: s["ms"] for name, s in timings.as_dict()["spans"].items()},
+            "peak_rss_mb": _peak_rss_mb(),
+            "rss_growth_mb": _peak_rss_mb() - rss_before,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def record_fixture(scenario_list: List[dict], dest: str, seed: Optional[str] = None,
+                   pipeline: str = "sync") -> Dict[str, int]:
+    """
+    Run every scenario once on a copy of `seed` (a places_cache.sqlite snapshot, or
+    empty); requests the seed doesn't cover are answered by the stub. The recorded
+    upstream tables become the fixture. Call in a fresh process.
+    """
+    workdir = tempfile.mkdtemp(prefix="firestore-bench-")
+    try:
+        if seed:                  # only the recorded responses: derived rows would skip upstream work
+            export_fixture(seed, os.path.join(workdir, "seed.sqlite"))
+            seed = os.path.join(workdir, "seed.sqlite")
+        server = _boot(seed, workdir, 0, 0)
+        from . import cache_db
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            for scenario in scenario_list:
+                _, zones = _rank(scenario, pipeline, use_cache=False)
+                _insights(zones, scenario["business_type"], pipeline)
+            cache_db.flush()
+        server.shutdown()
+        return export_fixture(os.path.join(workdir, "cache.sqlite"), dest)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def in_fresh_process(fn, *args, **kwargs):
+    """fn(*args, **kwargs) in a newly spawned interpreter (no caches, no shared memory peak)."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(fn, *args, **kwargs).result()
+
+
+#################################################
+# Suite
+#################################################
+def _percentiles(values) -> dict:
+    a = np.asarray(values, dtype=float)
+    return {"p50": round(float(np.percentile(a, 50)), 2),
+            "p95": round(float(np.percentile(a, 95)), 2),
+            "max": round(float(a.max()), 2)}
+
+
+def summarize(samples: List[dict]) -> dict:
+    stages = {}
+    for s in samples:
+        for name, ms in s["stages_ms"].items():
+            stages.setdefault(name, []).append(ms)
+    apis = sorted({api for s in samples for api in s["upstream"]})
+    return {
+        "samples": len(samples),
+        "zones": samples[0]["zones"],
+        "cold_ms": _percentiles([s["cold_ms"] for s in samples]),
+        "insights_ms": _percentiles([s["insights_ms"] for s in samples]),
+        "recompute_ms": _percentiles([s["recompute_ms"] for s in samples]),
+        "warm_ms": _percentiles([ms for s in samples for ms in s["warm_ms"]]),
+        "upstream": {api: max(s["upstream"].get(api, 0) for s in samples) for api in apis},
+        "stages_ms": {name: round(float(np.median(v)), 2) for name, v in sorted(stages.items())},
+        "peak_rss_mb": round(max(s["peak_rss_mb"] for s in samples), 1),
+        "rss_growth_mb": round(max(s["rss_growth_mb"] for s in samples), 1),
+    }
+
+
+def run_suite(scenario_list: List[dict], fixture: str = FIXTURE_PATH, pipeline: str = "sync",
+              repeat: int = REPEAT, warm_runs: int = WARM_RUNS,
+              upstream_latency_ms: float = UPSTREAM_LATENCY_MS, llm_latency_ms: float = LLM_LATENCY_MS,
+              progress=None) -> dict:
+    """{"meta": {...}, "scenarios": {name: summary}}; `repeat` fresh processes per scenario."""
+    results = {}
+    for scenario in scenario_list:
+        samples = []
+        for i in range(repeat):
+            samples.append(in_fresh_process(run_sample, scenario, fixture, pipeline, warm_runs,
+                                            upstream_latency_ms, llm_latency_ms))
+            if progress:
+                progress(scenario["name"], i + 1, samples[-1])
+        results[scenario["name"]] = summarize(samples)
+    return {
+        "meta": {
+            "fixture": fixture_signature(fixture),
+            "pipeline": pipeline,
+            "repeat": repeat,
+            "warm_runs": warm_runs,
+            "upstream_latency_ms": upstream_latency_ms,
+            "llm_latency_ms": llm_latency_ms,
+            "python": platform.python_version(),
+            "machine": f"{platform.system()} {platform.machine()}",
+            "created_at": int(time.time()),
+        },
+        "scenarios": results,
+    }
+
+
+#################################################
+# Baseline
+#################################################
+def load_baseline(path: str = BASELINE_PATH) -> Optional[dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_baseline(report: dict, path: str = BASELINE_PATH) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def compare(report: dict, baseline: dict, latency_tolerance: float = LATENCY_TOLERANCE,
+            memory_tolerance: float = MEMORY_TOLERANCE) -> List[str]:
+    """
+    Regressions of `report` against `baseline`, one message each: a p50 latency above
+    baseline × (1 + tolerance) (and by more than MIN_LATENCY_DELTA_MS), any upstream
+    API called more often, or peak RSS above baseline × (1 + memory tolerance).
+    Scenarios missing from either side are skipped.
+    """
+    problems = []
+    for name, cur in report["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        for metric in ("cold_ms", "recompute_ms", "warm_ms", "insights_ms"):
+            now, before = cur[metric]["p50"], base[metric]["p50"]
+            if now > before * (1 + latency_tolerance) and now - before > MIN_LATENCY_DELTA_MS:
+                problems.append(f"{name}: {metric} p50 {before:.1f} → {now:.1f} ms "
+                                f"(+{(now / before - 1) * 100 if before else float('inf'):.0f} %)")
+        for api in sorted(set(cur["upstream"]) | set(base["upstream"])):
+            now, before = cur["upstream"].get(api, 0), base["upstream"].get(api, 0)
+            if now > before:
+                problems.append(f"{name}: {api} upstream calls {before} → {now}")
+        now, before = cur["peak_rss_mb"], base["peak_rss_mb"]
+        if now > before * (1 + memory_tolerance):
+            problems.append(f"{name}: peak RSS {before:.0f} → {now:.0f} MB")
+    return problems
@@ -0,0 +1,107 @@
+# api/boundaries.py
+import glob
+import os
+import threading
+from typing import Optional
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# api/data/boundaries/places/*        TIGER place polygons (tl_2020_XX_place.shp): cities / towns / CDPs
+# api/data/boundaries/neighborhoods/* any polygon layer with a name column (city open‑data exports, Zillow, …)
+BOUNDARIES_DIR = os.path.join(BASE_DIR, "data", "boundaries")
+_EXTENSIONS = ("*.shp", "*.geojson", "*.json", "*.gpkg")
+_NAME_FIELDS = ("neighborhood", "NEIGHBORHOOD", "nhood", "ntaname", "NTAName", "NAME", "name", "label")
+
+STATE_FIPS = {
+    "01": "AL", "02": "AK", "04": "AZ", "05": "AR", "06": "CA", "08": "CO", "09": "CT", "10": "DE",
+    "11": "DC", "12": "FL", "13": "GA", "15": "HI", "16": "ID", "17": "IL", "18": "IN", "19": "IA",
+    "20": "KS", "21": "KY", "22": "LA", "23": "ME", "24": "MD", "25": "MA", "26": "MI", "27": "MN",
+    "28": "MS", "29": "MO", "30": "MT", "31": "NE", "32": "NV", "33": "NH", "34": "NJ", "35": "NM",
+    "36": "NY", "37": "NC", "38": "ND", "39": "OH", "40": "OK", "41": "OR", "42": "PA", "44": "RI",
+    "45": "SC", "46": "SD", "47": "TN", "48": "TX", "49": "UT", "50": "VT", "51": "VA", "53": "WA",
+    "54": "WV", "55": "WI", "56": "WY", "72": "PR",
+}
+
+
+class BoundaryLayer:
+    """Named polygons behind an STRtree; `lookup` returns the smallest polygon containing a point."""
+
+    def __init__(self, names, geometries, states=None):
+        self.names = np.asarray(names, dtype=object)
+        self.geometries = np.asarray(geometries, dtype=object)
+        self.states = np.asarray(states, dtype=object) if states is not None else None
+        self.areas = shapely.area(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+        shapely.prepare(self.geometries)          # indexed edges → fast point‑in‑polygon tests
+
+    @classmethod
+    def from_files(cls, paths, with_state: bool = False):
+        names, geoms, states = [], [], []
+        for path in paths:
+            gdf = gpd.read_file(path)
+            if gdf.crs is not None and gdf.crs != "EPSG:4326":
+                gdf = gdf.to_crs(epsg=4326)
+            field = next((f for f in _NAME_FIELDS if f in gdf.columns), None)
+            if field is None:
+                print(f"[WARN] No name column in boundary file {path}, skipped")
+                continue
+            names.extend(gdf[field].astype(str))
+            geoms.extend(gdf.geometry)
+            if with_state:
+                fips = gdf["STATEFP"].astype(str) if "STATEFP" in gdf.columns else [None] * len(gdf)
+                states.extend(STATE_FIPS.get(f) for f in fips)
+        if not names:
+            return None
+        return cls(names, geoms, states if with_state else None)
+
+    def __len__(self):
+        return len(self.names)
+
+    def lookup(self, lat: float, lng: float) -> Optional[int]:
+        hits = self.tree.query(shapely.Point(lng, lat))            # bbox candidates
+        hits = hits[shapely.intersects_xy(self.geometries[hits], lng, lat)]
+        if hits.size == 0:
+            return None
+        return int(hits[np.argmin(self.areas[hits])])
+
+
+_layers = None
+_layers_lock = threading.Lock()
+
+
+def _files(kind: str):
+    return sorted(p for ext in _EXTENSIONS for p in glob.glob(os.path.join(BOUNDARIES_DIR, kind, ext)))
+
+
+def get_layers():
+    """(places, neighborhoods) layers, loaded on first use; either is None when no files exist."""
+    global _layers
+    if _layers is None:
+        with _layers_lock:
+            if _layers is None:
+                _layers = (
+                    BoundaryLayer.from_files(_files("places"), with_state=True),
+                    BoundaryLayer.from_files(_files("neighborhoods")),
+                )
+    return _layers
+
+
+def resolve_offline(lat: float, lng: float) -> dict:
+    """
+    {"neighborhood", "city", "state"} by point‑in‑polygon against the local boundary files.
+    Fields without a matching polygon (or without data loaded) are None.
+    """
+    places, neighborhoods = get_layers()
+    out = {"neighborhood": None, "city": None, "state": None}
+    if places is not None:
+        i = places.lookup(lat, lng)
+        if i is not None:
+            out["city"], out["state"] = places.names[i], places.states[i]
+    if neighborhoods is not None:
+        i = neighborhoods.lookup(lat, lng)
+        if i is not None:
+            out["neighborhood"] = neighborhoods.names[i]
+    return out
@@ -0,0 +1,151 @@
+# api/cache_db.py
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import orjson
+import zstandard
+
+DB_PATH = Path(os.getenv("PLACES_CACHE_DB", Path(__file__).resolve().parent / "places_cache.sqlite"))
+
+WRITE_BATCH_SIZE = 256        # max statements per write transaction
+WRITE_FLUSH_INTERVAL = 0.05   # seconds the writer waits to fill a batch
+ZSTD_LEVEL = 6
+
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_local = threading.local()
+
+
+#################################################
+# Connections
+#################################################
+def _open() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")        # readers never block on the writer
+    conn.execute("PRAGMA synchronous=NORMAL")      # durable at checkpoints, no fsync per commit
+    return conn
+
+
+def connect() -> sqlite3.Connection:
+    """This thread's connection to the cache database (opened on first use)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        conn = _local.conn = _open()
+        _local.pid = os.getpid()
+    return conn
+
+
+def ensure_schema(*statements: str) -> None:
+    conn = connect()
+    with conn:
+        for sql in statements:
+            conn.execute(sql)
+
+
+#################################################
+# Payload encoding: zstd‑compressed JSON bytes
+#################################################
+def encode(obj) -> bytes:
+    cctx = getattr(_local, "cctx", None)
+    if cctx is None:
+        cctx = _local.cctx = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+    return cctx.compress(orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS))
+
+
+def decode(raw):
+    """Inverse of `encode`; also accepts the plain JSON text written by older versions."""
+    if isinstance(raw, (bytes, memoryview)):
+        raw = bytes(raw)
+        if raw[:4] == _ZSTD_MAGIC:
+            dctx = getattr(_local, "dctx", None)
+            if dctx is None:
+                dctx = _local.dctx = zstandard.ZstdDecompressor()
+            return orjson.loads(dctx.decompress(raw))
+    return json.loads(raw)
+
+
+#################################################
+# Write‑behind queue: one writer thread, many statements per transaction
+#################################################
+class _Writer:
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue()      # forked child: parent's queue isn't ours
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="cache-db-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, sql: str, rows: list) -> None:
+        self._ensure_started()
+        self._queue.put((sql, rows))
+
+    def flush(self, timeout: float = 10.0) -> None:
+        """Block until everything submitted so far is committed."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def _run(self):
+        conn = _open()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + WRITE_FLUSH_INTERVAL
+            while len(batch) < WRITE_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            waiters = [item for item in batch if isinstance(item, threading.Event)]
+            writes = [item for item in batch if not isinstance(item, threading.Event)]
+            try:
+                with conn:
+                    for item in writes:
+                        conn.executemany(*item)
+            except Exception as e:
+                # one bad statement must not take unrelated writes down with it
+                print(f"[WARN] cache write batch failed ({len(writes)} items), retrying one by one: {e}")
+                for sql, rows in writes:
+                    try:
+                        with conn:
+                            conn.executemany(sql, rows)
+                    except Exception as e:
+                        print(f"[ERROR] cache write dropped ({sql.split('(')[0].strip()}, {len(rows)} rows): {e}")
+            for w in waiters:
+                w.set()
+
+
+_writer = _Writer()
+
+
+def write(sql: str, rows: list) -> None:
+    """Queue `executemany(sql, rows)`; committed together with other pending writes."""
+    if rows:
+        _writer.submit(sql, rows)
+
+
+def flush() -> None:
+    _writer.flush()
+
+
+atexit.register(flush)
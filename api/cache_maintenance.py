@@ -0,0 +1,180 @@
+# api/cache_maintenance.py
+import os
+import threading
+import time
+
+from . import cache_db
+from .address import ADDRESS_TTL
+from .analysis_store import ANALYSIS_TTL, AREA_TTL
+from .fetcher import CACHE_TTL as PLACES_TTL
+from .insight_cache import INSIGHT_TTL
+from .rent_agent import RENT_LABEL_TTL
+from .zip_cache import CACHE_TTL as ZIP_TTL
+
+# table → (payload column, TTL); every cache table keys its age on `created_at`
+CACHE_TABLES = {
+    "places_cache":       ("json_response", PLACES_TTL),
+    "zip_analysis_cache": ("json_result",   ZIP_TTL),
+    "address_cache":      ("json_result",   ADDRESS_TTL),
+    "rent_label_cache":   ("label",         RENT_LABEL_TTL),
+    "insight_cache":      ("insight",       INSIGHT_TTL),
+    "places_tile":        ("place_id",      PLACES_TTL),
+    "places_coverage":    ("geohash",       PLACES_TTL),
+    "analysis_result":    ("json_result",   ANALYSIS_TTL),
+    "area_result":        ("result_id",     AREA_TTL),
+}
+# tables whose payload is an encoded JSON document (the rest hold plain text / ids)
+JSON_TABLES = ("places_cache", "zip_analysis_cache", "address_cache", "analysis_result")
+
+CACHE_MAX_MB = float(os.getenv("CACHE_MAX_MB", 0)) or None      # unset → no size cap
+VACUUM_PAGES = 2000                                              # pages freed per incremental pass
+AGE_BUCKETS = [(3600, "<1h"), (86400, "<1d"), (7 * 86400, "<7d"), (30 * 86400, "<30d"), (None, "≥30d")]
+_EVICT_CHUNK = 500
+
+
+def purge_expired(now: int = None) -> dict:
+    """Delete rows older than their table's TTL; returns {table: rows_deleted}."""
+    now = now or int(time.time())
+    conn = cache_db.connect()
+    deleted = {}
+    with conn:
+        for table, (_, ttl) in CACHE_TABLES.items():
+            deleted[table] = conn.execute(f"DELETE FROM {table} WHERE created_at <= ?", (now - ttl,)).rowcount
+    return deleted
+
+
+def payload_bytes() -> int:
+    conn = cache_db.connect()
+    return sum(conn.execute(f"SELECT COALESCE(SUM(LENGTH({col})), 0) FROM {table}").fetchone()[0]
+               for table, (col, _) in CACHE_TABLES.items())
+
+
+def _evict_coverage(conn, tile_rowid: int, created_at: int) -> tuple:
+    """
+    A places_tile row is about to go: drop every coverage record of its place type
+    that may have counted on it (recorded no later than the tile), or covered_count
+    would keep answering for those circles with an undercount. → (rows, bytes).
+    """
+    row = conn.execute("SELECT place_type FROM places_tile WHERE rowid = ?", (tile_rowid,)).fetchone()
+    if row is None:
+        return 0, 0
+    where = "place_type = ? AND created_at <= ?"
+    size = conn.execute(f"SELECT COALESCE(SUM(LENGTH(geohash)), 0) FROM places_coverage WHERE {where}",
+                        (row[0], created_at)).fetchone()[0]
+    return conn.execute(f"DELETE FROM places_coverage WHERE {where}", (row[0], created_at)).rowcount, size
+
+
+def enforce_max_size(max_bytes: int) -> int:
+    """Evict the oldest rows (across all cache tables) until payloads fit in `max_bytes`."""
+    conn = cache_db.connect()
+    total, evicted = payload_bytes(), 0
+    union = " UNION ALL ".join(
+        f"SELECT '{t}' AS tbl, rowid, created_at, LENGTH({col}) AS size FROM {t}"
+        for t, (col, _) in CACHE_TABLES.items()
+    )
+    while total > max_bytes:
+        oldest = conn.execute(f"SELECT tbl, rowid, created_at, size FROM ({union}) ORDER BY created_at LIMIT ?",
+                              (_EVICT_CHUNK,)).fetchall()
+        if not oldest:
+            break
+        with conn:
+            for tbl, rowid, created_at, size in oldest:
+                if tbl == "places_tile":
+                    rows, freed = _evict_coverage(conn, rowid, created_at)
+                    total -= freed
+                    evicted += rows
+                if conn.execute(f"DELETE FROM {tbl} WHERE rowid = ?", (rowid,)).rowcount:
+                    total -= size or 0
+                    evicted += 1
+                if total <= max_bytes:
+                    break
+    return evicted
+
+
+def enable_incremental_vacuum() -> bool:
+    """Switch the file to auto_vacuum=INCREMENTAL (needs one full VACUUM); True if it changed."""
+    conn = cache_db.connect()
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    cache_db.flush()
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+
+def incremental_vacuum(pages: int = VACUUM_PAGES) -> int:
+    """Return up to `pages` free pages to the OS; returns pages released."""
+    conn = cache_db.connect()
+    before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    # executescript steps the pragma to completion; execute() would free only one page
+    conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+    return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def recompress(batch: int = 500) -> int:
+    """Rewrite rows still stored as plain JSON text into the compressed encoding."""
+    conn = cache_db.connect()
+    rewritten = 0
+    for table in JSON_TABLES:
+        col = CACHE_TABLES[table][0]
+        while True:
+            rows = conn.execute(f"SELECT rowid, {col} FROM {table} WHERE typeof({col}) = 'text' LIMIT ?",
+                                (batch,)).fetchall()
+            if not rows:
+                break
+            with conn:
+                conn.executemany(f"UPDATE {table} SET {col} = ? WHERE rowid = ?",
+                                 [(cache_db.encode(cache_db.decode(raw)), rowid) for rowid, raw in rows])
+            rewritten += len(rows)
+    return rewritten
+
+
+def report(now: int = None) -> dict:
+    """{table: {rows, bytes, ages: {bucket: rows}}} plus file‑level page stats."""
+    now = now or int(time.time())
+    conn = cache_db.connect()
+    out = {}
+    for table, (col, _) in CACHE_TABLES.items():
+        rows, size = conn.execute(f"SELECT COUNT(*), COALESCE(SUM(LENGTH({col})), 0) FROM {table}").fetchone()
+        ages, lower = {}, 0
+        for upper, label in AGE_BUCKETS:
+            if upper is None:
+                q, args = f"SELECT COUNT(*) FROM {table} WHERE created_at <= ?", (now - lower,)
+            else:
+                q = f"SELECT COUNT(*) FROM {table} WHERE created_at <= ? AND created_at > ?"
+                args = (now - lower, now - upper)
+            ages[label] = conn.execute(q, args).fetchone()[0]
+            lower = upper
+        out[table] = {"rows": rows, "bytes": size, "ages": ages}
+
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    out["_file"] = {
+        "bytes": page_size * conn.execute("PRAGMA page_count").fetchone()[0],
+        "free_bytes": page_size * conn.execute("PRAGMA freelist_count").fetchone()[0],
+    }
+    return out
+
+
+def sweep(max_bytes: int = None) -> dict:
+    """One maintenance pass: TTL purge, optional size cap, incremental vacuum."""
+    cache_db.flush()
+    result = {"purged": purge_expired()}
+    if max_bytes:
+        result["evicted"] = enforce_max_size(max_bytes)
+    result["pages_freed"] = incremental_vacuum()
+    return result
+
+
+def start_sweeper(interval: float, max_bytes: int = None) -> threading.Thread:
+    """Run `sweep` every `interval` seconds on a daemon thread."""
+    def _loop():
+        while True:
+            time.sleep(interval)
+            try:
+                sweep(max_bytes)
+            except Exception as e:
+                print(f"[ERROR] cache sweep failed: {e}")
+
+    t = threading.Thread(target=_loop, name="cache-sweeper", daemon=True)
+    t.start()
+    return t
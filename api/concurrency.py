@@ -0,0 +1,54 @@
+# api/concurrency.py
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterable, List, Optional, TypeVar
+
+from .metrics import bound
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Max ZIPs evaluated at once per rank_top_zones call
+MAX_WORKERS = int(os.getenv("ZIP_EVAL_WORKERS", 16))
+
+# Max simultaneous in-flight requests per upstream, shared by every thread
+# in the process (so two overlapping analyses still respect the same cap).
+UPSTREAM_LIMITS = {
+    "census":    int(os.getenv("CENSUS_CONCURRENCY", 4)),
+    "places":    int(os.getenv("PLACES_CONCURRENCY", 8)),
+    "geocode":   int(os.getenv("GEOCODE_CONCURRENCY", 8)),
+    "openai":    int(os.getenv("OPENAI_CONCURRENCY", 4)),
+    "nominatim": 1,   # OSM usage policy: no parallel requests
+}
+_SEMAPHORES = {name: threading.BoundedSemaphore(n) for name, n in UPSTREAM_LIMITS.items()}
+
+
+@contextmanager
+def upstream(name: str):
+    """Hold one of the `name` upstream slots for the duration of the block."""
+    with _SEMAPHORES[name]:
+        yield
+
+
+def map_ordered(fn: Callable[[T], R], items: Iterable[T], max_workers: int = MAX_WORKERS) -> List[Optional[R]]:
+    """
+    Run `fn` over `items` on a bounded thread pool.
+    Results come back in input order; an exception in one item yields None
+    for that item only. Workers see the caller's context (request timings).
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    def _safe(item):
+        try:
+            return fn(item)
+        except Exception as e:
+            print(f"[ERROR] worker failed for {item!r:.80}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as pool:
+        futures = [pool.submit(bound(_safe), item) for item in items]
+        return [f.result() for f in futures]
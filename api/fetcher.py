@@ -4,23 +4,42 @@ import os
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from dotenv import load_dotenv
-import sqlite3, hashlib, json, threading
+import copy, hashlib, threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import cache_db, metrics
+from .concurrency import upstream, UPSTREAM_LIMITS
+from .acs_store import acs_value, get_snapshot
+from .lru import TTLCache
+from .places_tiles import covered_count, record_search
+from .ratelimit import acquire, key_id, throttled
 
 
 # Caching config
 CACHE_TTL = 30 * 24 * 3600            # 30 days (Google Maps TOS)
-_CACHE_LOCK = threading.Lock()        # sqlite is threadsafe w/ a mutex
-DB = sqlite3.connect(
-    os.path.join(BASE_DIR := os.path.dirname(__file__), "places_cache.sqlite"),
-    check_same_thread=False,
+cache_db.ensure_schema(
+    """CREATE TABLE IF NOT EXISTS places_cache (
+           cache_key     TEXT PRIMARY KEY,
+           json_response TEXT NOT NULL,     -- zstd JSON blob (plain JSON text in older rows)
+           created_at    INTEGER NOT NULL
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_age ON places_cache(created_at)",
+)
+
+# In‑memory tier in front of places_cache: decoded payloads, no SQLite on a hit
+MEMORY_CACHE = TTLCache(
+    maxsize=int(os.getenv("MEMORY_CACHE_SIZE", 4096)),
+    ttl=int(os.getenv("MEMORY_CACHE_TTL", 3600)),
 )
-DB.execute("""CREATE TABLE IF NOT EXISTS places_cache (
-                cache_key     TEXT PRIMARY KEY,
-                json_response TEXT NOT NULL,
-                created_at    INTEGER NOT NULL
-             )""")
-DB.execute("CREATE INDEX IF NOT EXISTS idx_age ON places_cache(created_at)")
-DB.commit()
+
+# Lookups that would fail the same way again (INVALID_REQUEST / NOT_FOUND payloads,
+# 4xx replies) are remembered briefly in memory so a burst of identical requests
+# doesn't keep re-asking Google. Transport, throttling and quota errors are not.
+NEGATIVE_TTL = 30
+NEGATIVE_STATUSES = {"INVALID_REQUEST", "NOT_FOUND"}
+_NEGATIVE = TTLCache(maxsize=int(os.getenv("NEGATIVE_CACHE_SIZE", 1024)), ttl=NEGATIVE_TTL)
+_INFLIGHT = {}                        # cache_key → _Flight, one live upstream call per key
+_INFLIGHT_LOCK = threading.Lock()
 
 # API config
 load_dotenv()
@@ -29,6 +48,32 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 CENSUS_API_KEY = os.getenv("CENSUS_API_KEY")
 CENSUS_YEAR = 2022
 
+# rate‑limit bucket per upstream: quotas belong to the API key, not the process
+THROTTLE_RETRIES = 3
+RATE_KEYS = {
+    "places":  key_id(GOOGLE_API_KEY),
+    "geocode": key_id(GOOGLE_API_KEY),
+    "census":  key_id(CENSUS_API_KEY),
+}
+
+# Point every upstream at a stand-in server (`python -m api.upstream_stub`) for offline runs.
+# Cache keys keep using the real URLs, so cached data stays valid either way.
+UPSTREAM_BASE_URL = os.getenv("UPSTREAM_BASE_URL")
+_UPSTREAM_HOSTS = (
+    "https://maps.googleapis.com",
+    "https://api.census.gov",
+    "https://nominatim.openstreetmap.org",
+)
+
+
+def route_url(url: str) -> str:
+    """`url` with its upstream host swapped for UPSTREAM_BASE_URL, when set."""
+    if UPSTREAM_BASE_URL:
+        for host in _UPSTREAM_HOSTS:
+            if url.startswith(host):
+                return UPSTREAM_BASE_URL.rstrip("/") + url[len(host):]
+    return url
+
 
 def _mk_cache_key(endpoint: str, params: dict) -> str:
     """Stable SHA‑256 hash of endpoint + sorted params **excluding the API key**."""
@@ -37,45 +82,193 @@ def _mk_cache_key(endpoint: str, params: dict) -> str:
     return hashlib.sha256(blob.encode()).hexdigest()
 
 
+def _upstream_for(endpoint: str) -> str:
+    """Name of the concurrency bucket a Google endpoint belongs to."""
+    return "geocode" if "/geocode/" in endpoint else "places"
+
+
+def _cache_load(key: str, ttl: int = CACHE_TTL):
+    """
+    Decoded cached payload for `key`, or None if absent / older than `ttl`.
+    The returned object may be shared with other callers — don't mutate it.
+    """
+    data = MEMORY_CACHE.get(key, max_age=ttl)
+    if data is not None:
+        return data
+
+    row = cache_db.connect().execute(
+        "SELECT json_response, created_at FROM places_cache WHERE cache_key = ?",
+        (key,),
+    ).fetchone()
+    if row and int(time.time()) - row[1] < ttl:
+        data = cache_db.decode(row[0])
+        MEMORY_CACHE.put(key, data, created_at=row[1])
+        return data
+    return None
+
+
+def _cache_store(key: str, data) -> None:
+    _cache_store_many({key: data})
+
+
+def _cache_store_many(items: dict) -> None:
+    """Queue {cache_key: payload} for the batched writer; visible in-process immediately."""
+    now = int(time.time())
+    cache_db.write(
+        "INSERT OR REPLACE INTO places_cache VALUES (?,?,?)",
+        [(key, cache_db.encode(data), now) for key, data in items.items()],
+    )
+    for key, data in items.items():
+        MEMORY_CACHE.put(key, data, created_at=now)
+
+
+def cache_stats() -> dict:
+    """Hit / miss / eviction counters of the in‑memory cache tier."""
+    return MEMORY_CACHE.stats()
+
+
+def _deterministic_failure(value) -> bool:
+    """True for a payload / exception that a retry would only repeat."""
+    if isinstance(value, Exception):
+        status = getattr(getattr(value, "response", None), "status_code", None)
+        return status is not None and 400 <= status < 500 and status != 429
+    return isinstance(value, dict) and value.get("status") in NEGATIVE_STATUSES
+
+
+def _negative_get(key: str):
+    return _NEGATIVE.get(key)
+
+
+def _negative_put(key: str, value) -> None:
+    """Remember a failed lookup (payload or exception) for NEGATIVE_TTL, if it is deterministic."""
+    if _deterministic_failure(value):
+        _NEGATIVE.put(key, value)
+
+
+def _fresh(error: Exception) -> Exception:
+    """A new instance of a shared `error`, so callers in other threads don't raise one object."""
+    if hasattr(error, "request") and hasattr(error, "response"):
+        return type(error)(str(error), request=error.request, response=error.response)
+    return copy.copy(error)
+
+
+class _Flight:
+    """An upstream call in progress; followers wait on `done` and reuse its outcome."""
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
 def cached_get(endpoint: str, params: dict, ttl: int = CACHE_TTL) -> dict:
-    """Return JSON payload from cache or live request, transparently."""
+    """
+    Return JSON payload from cache or live request, transparently.
+    Concurrent misses on the same key share a single upstream call.
+    """
     key = _mk_cache_key(endpoint, params)
-    now = int(time.time())
 
     # ---- lookup
-    with _CACHE_LOCK:
-        row = DB.execute(
-            "SELECT json_response, created_at FROM places_cache WHERE cache_key = ?",
-            (key,),
-        ).fetchone()
-
-    if row and now - row[1] < ttl:
-        print(f"[CACHE‑HIT] {endpoint.split('/')[-1]}  params={params}")
-        return json.loads(row[0])            # HIT ✅
-    
-    print(f"[CACHE‑MISS] {endpoint.split('/')[-1]}  params={params}")
+    data = _cache_load(key, ttl)
+    if data is not None:
+        metrics.cache_result("places", True)
+        return data                          # HIT ✅
+
+    neg = _negative_get(key)
+    if neg is not None:
+        if isinstance(neg, Exception):
+            raise _fresh(neg)
+        return neg
+
+    # ---- single‑flight: first caller fetches, the rest wait for its result
+    with _INFLIGHT_LOCK:
+        flight = _INFLIGHT.get(key)
+        leader = flight is None
+        if leader:
+            flight = _INFLIGHT[key] = _Flight()
+
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise _fresh(flight.error) from flight.error
+        return flight.result
+
+    try:
+        # a previous leader may have stored the row between our lookup and taking the flight
+        data = _cache_load(key, ttl)
+        if data is None:
+            metrics.cache_result("places", False)
+            data = _fetch_and_store(endpoint, params, key)
+        flight.result = data
+        return data
+    except Exception as e:
+        flight.error = e
+        _negative_put(key, e)
+        raise
+    finally:
+        with _INFLIGHT_LOCK:
+            _INFLIGHT.pop(key, None)
+        flight.done.set()
+
+
+def is_throttled(resp) -> bool:
+    """HTTP 429, or Google's 200 + OVER_QUERY_LIMIT."""
+    if resp.status_code == 429:
+        return True
+    if resp.status_code == 200 and "json" in resp.headers.get("Content-Type", ""):
+        body = resp.json()
+        return isinstance(body, dict) and body.get("status") == "OVER_QUERY_LIMIT"
+    return False
+
+
+def limited_get(url: str, params: dict, api: str, timeout: float):
+    """
+    GET through the shared rate limiter and `api` upstream slots. A throttled reply
+    cuts the shared rate and is retried once the limiter grants capacity again.
+    """
+    rate_key = RATE_KEYS.get(api, "default")
+    for attempt in range(THROTTLE_RETRIES + 1):
+        acquire(api, rate_key)
+        metrics.inc("upstream_requests_total", api=api)
+        try:
+            with upstream(api), metrics.span("upstream", api=api):
+                resp = session.get(route_url(url), params=params, timeout=timeout)
+        except requests.RequestException:
+            metrics.inc("upstream_errors_total", api=api, reason="transport")
+            raise
+        if not is_throttled(resp):
+            break
+        metrics.inc("upstream_errors_total", api=api, reason="throttled")
+        throttled(api, rate_key)
+    if resp.status_code >= 400:
+        metrics.inc("upstream_errors_total", api=api, reason=str(resp.status_code))
+    return resp
 
+
+def _fetch_and_store(endpoint: str, params: dict, key: str) -> dict:
     # ---- miss → hit Google
-    resp = session.get(endpoint, params=params, timeout=5)
+    resp = limited_get(endpoint, params, _upstream_for(endpoint), timeout=5)
     resp.raise_for_status()
     data = resp.json()
 
-    # cache only successful responses (status=OK | ZERO_RESULTS)
+    # cache only successful responses (status=OK | ZERO_RESULTS); remember deterministic failures briefly
     if data.get("status") in {"OK", "ZERO_RESULTS"}:
-        with _CACHE_LOCK:
-            DB.execute(
-                "INSERT OR REPLACE INTO places_cache VALUES (?,?,?)",
-                (key, json.dumps(data), now),
-            )
-            DB.commit()
+        _cache_store(key, data)
+    else:
+        metrics.inc("upstream_errors_total", api=_upstream_for(endpoint), reason=str(data.get("status")))
+        _negative_put(key, data)
 
     return data
 
 # Configure retry session
 def requests_session_with_retries():
     session = requests.Session()
-    retries = Retry(total=5, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
-    adapter = HTTPAdapter(max_retries=retries)
+    # 429 is left to the shared rate limiter (limited_get), which paces every process
+    retries = Retry(total=5, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
+    # pool must cover every thread allowed in flight at once, or urllib3 drops connections
+    pool_size = sum(UPSTREAM_LIMITS.values())
+    adapter = HTTPAdapter(max_retries=retries, pool_connections=pool_size, pool_maxsize=pool_size)
     session.mount('https://', adapter)
     session.mount('http://', adapter)
     return session
@@ -84,125 +277,189 @@ session = requests_session_with_retries()
 
 # --- Reverse geocoding --- #
 def reverse_geocode_to_zip(lat: float, lng: float):
-    url = "https://maps.googleapis.com/maps/api/geocode/json"
-    params = {
-        "latlng": f"{lat},{lng}",
-        "key": GOOGLE_API_KEY
-    }
-    try:
-        print(f"[DEBUG] Requesting ZIP for ({lat}, {lng})")
-        #response = session.get(url, params=params)
+    from .address import resolve_address     # address.py builds on this module
+    zip_code = resolve_address(lat, lng)["zip"]
+    if zip_code is None:
+        print(f"[WARN] No ZIP found in geocode response for ({lat}, {lng})")
+    return zip_code
 
-        # print(f"[DEBUG] Status Code: {response.status_code}")
-        # print(f"[DEBUG] Response Text: {response.text[:300]}...")  # Print partial text to avoid overflow
 
-        data = cached_get(url, params)
+# --- Census Fetching (ZIP-Based) --- #
+CENSUS_URL = f"https://api.census.gov/data/{CENSUS_YEAR}/acs/acs5"
+CENSUS_VARS = {
+    "population":    "B01003_001E",   # Total population
+    "median_income": "B19013_001E",   # Median household income
+}
+CENSUS_BATCH_SIZE = 250               # ZCTAs per request (keeps the URL well under 8 KB)
+_ZCTA_FIELD = "zip code tabulation area"
 
-        if response.status_code == 200 and "results" in data:
-            for result in data["results"]:
-                for component in result["address_components"]:
-                    if "postal_code" in component["types"]:
-                        return component["short_name"]
 
-        print(f"[WARN] No ZIP found in geocode response for ({lat}, {lng})")
-        return None
+def _census_key(zip_code: str) -> str:
+    return _mk_cache_key(CENSUS_URL, {"get": ",".join(CENSUS_VARS.values()), "zcta": zip_code})
 
-    except Exception as e:
-        print(f"[ERROR] reverse_geocode_to_zip failed for ({lat}, {lng}): {e}")
-        return None
 
+def _census_value(raw):
+    val = acs_value(raw)
+    return None if val is None else int(val)
 
-# --- Census Fetching (ZIP-Based) --- #
-def fetch_population(zip_code):
 
-    url = f"https://api.census.gov/data/{CENSUS_YEAR}/acs/acs5"
-    params = {
-        "get": "B01003_001E",  # Total population
-        "for": f"zip code tabulation area:{zip_code}",
+def _census_params(chunk) -> dict:
+    """ACS query for every CENSUS_VARS variable of the ZCTAs in `chunk`."""
+    return {
+        "get": ",".join(CENSUS_VARS.values()),
+        "for": f"{_ZCTA_FIELD}:{','.join(chunk)}",
         "key": CENSUS_API_KEY
     }
-    try:
-        response = session.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        return int(data[1][0])
-    except Exception as e:
-        print(f"Error fetching population for ZIP {zip_code}: {e}")
-        return None
 
-def fetch_median_income(zip_code):
 
-    url = f"https://api.census.gov/data/{CENSUS_YEAR}/acs/acs5"
-    params = {
-        "get": "B19013_001E",  # Median household income
-        "for": f"zip code tabulation area:{zip_code}",
-        "key": CENSUS_API_KEY
-    }
-    try:
-        response = session.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        income_val = int(data[1][0])
-        if income_val < 0:
-            income_val = None
-        return income_val
+def _parse_census_rows(rows) -> dict:
+    """{zcta: {name: int|None}} from an ACS reply (header row first; empty → {})."""
+    if not rows:
+        return {}
+    header = rows[0]
+    zip_idx = header.index(_ZCTA_FIELD)
+    var_idx = {name: header.index(var) for name, var in CENSUS_VARS.items()}
+    return {row[zip_idx]: {name: _census_value(row[j]) for name, j in var_idx.items()}
+            for row in rows[1:]}
+
+
+def fetch_census_batch(zip_codes) -> dict:
+    """
+    {zip: {"population": int|None, "median_income": int|None}} for the given ZCTAs.
+    ZCTAs the local ACS snapshot (`manage.py ingest_acs`) holds both variables for are
+    answered from memory; otherwise cached ZCTAs are served from places_cache and the rest are fetched with
+    a single ACS request per CENSUS_BATCH_SIZE ZCTAs and cached one row per ZCTA.
+    ZCTAs the Census has no row for are left out of the result.
+    """
+    zip_codes = list(dict.fromkeys(str(z) for z in zip_codes))
+    out = get_snapshot(CENSUS_YEAR).lookup(zip_codes, CENSUS_VARS)
+    missing = []
+    for zip_code in zip_codes:
+        if zip_code in out:
+            continue
+        hit = _cache_load(_census_key(zip_code))
+        if hit is not None:
+            out[zip_code] = hit
+        else:
+            missing.append(zip_code)
+    metrics.cache_result("census", True, len(zip_codes) - len(missing))
+    metrics.cache_result("census", False, len(missing))
 
-    except Exception as e:
-        print(f"Error fetching median income for ZIP {zip_code}: {e}")
-        return None
+    for i in range(0, len(missing), CENSUS_BATCH_SIZE):
+        chunk = missing[i:i + CENSUS_BATCH_SIZE]
+        try:
+            response = limited_get(CENSUS_URL, _census_params(chunk), "census", timeout=15)
+            response.raise_for_status()
+            rows = response.json() if response.status_code != 204 else []   # 204 → no matching ZCTAs
+        except Exception as e:
+            print(f"Error fetching Census batch ({len(chunk)} ZIPs): {e}")
+            continue
+
+        fetched = _parse_census_rows(rows)
+        if not fetched:
+            continue
+        out.update(fetched)
+        _cache_store_many({_census_key(z): rec for z, rec in fetched.items()})
+
+    return out
+
+
+def fetch_population(zip_code):
+    return fetch_census_batch([zip_code]).get(str(zip_code), {}).get("population")
+
+
+def fetch_median_income(zip_code):
+    return fetch_census_batch([zip_code]).get(str(zip_code), {}).get("median_income")
 
 # --- Google Places Metrics --- #
-def fetch_competitor_count(location: tuple, radius: int, place_type: str):
-    endpoint_url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+NEARBY_URL = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+NEARBY_MAX_RESULTS = 60               # Google stops after 3 pages of 20, with no next_page_token
+
+
+def nearby_count(lat: float, lng: float, radius_m: int, place_type: str, paginate: bool = False) -> int:
+    """
+    Number of `place_type` places Google reports within `radius_m` of the point.
+    Answered from the places tile store when earlier complete searches cover the
+    circle; otherwise fetched (first page, or all pages if `paginate`) and recorded.
+    """
+    local = covered_count(lat, lng, radius_m, place_type, ttl=CACHE_TTL)
+    metrics.cache_result("places_tile", local is not None)
+    if local is not None:
+        return local
+
     params = {
-        "location": f"{location[0]},{location[1]}",
-        "radius": radius,
+        "location": f"{lat},{lng}",
+        "radius": radius_m,
         "type": place_type,
         "key": GOOGLE_API_KEY
     }
-    competitor_count = 0
+    results, complete = [], False
     while True:
-
-        # res = requests.get(endpoint_url, params=params).json()
-        res = cached_get(endpoint_url, params)
-        if res.get("status") != "OK":
-            print(f"Google Places API Error: {res.get('status')}")
+        res = cached_get(NEARBY_URL, params)
+        status = res.get("status")
+        if paginate and status != "OK":
+            if status != "ZERO_RESULTS":
+                print(f"Google Places API Error: {status}")
+            complete = status == "ZERO_RESULTS"
             break
 
-        competitor_count += len(res.get("results", []))
+        results.extend(res.get("results", []))
+        complete = (status in {"OK", "ZERO_RESULTS"} and "next_page_token" not in res
+                    and len(results) < NEARBY_MAX_RESULTS)
 
-        if "next_page_token" in res:
+        if paginate and "next_page_token" in res:
             time.sleep(2)
             params["pagetoken"] = res["next_page_token"]
         else:
             break
-    return competitor_count
+
+    record_search(lat, lng, radius_m, place_type, results, complete)
+    return len(results)
+
+
+def fetch_competitor_count(location: tuple, radius: int, place_type: str):
+    return nearby_count(location[0], location[1], radius, place_type, paginate=True)
+
+TRAFFIC_TYPES = ("transit_station", "bus_station", "train_station")
+
+# Per-location Places fan-out runs on its own pool: callers are usually
+# map_ordered workers, and submitting back into their pool could deadlock.
+# Real concurrency is still capped by the shared "places" upstream slots.
+_PLACES_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PLACES_FANOUT_WORKERS", 4 * UPSTREAM_LIMITS["places"])),
+    thread_name_prefix="places",
+)
+
+
+def fetch_location_metrics(lat: float, lng: float, radius_m: int = 300,
+                           competitor_types=(), base: bool = True) -> dict:
+    """
+    Every Places count for one point, fetched concurrently:
+    {"traffic_score", "parking_score", "competitors": {place_type: count}}.
+    `base=False` skips traffic / parking (only competitor counts are needed).
+    """
+    jobs = {("competitors", t): (t, True) for t in competitor_types}
+    if base:
+        jobs.update({("traffic_score", t): (t, False) for t in TRAFFIC_TYPES})
+        jobs[("parking_score", "parking")] = ("parking", False)
+
+    futures = {key: _PLACES_POOL.submit(metrics.bound(nearby_count), lat, lng, radius_m, t, paginate)
+               for key, (t, paginate) in jobs.items()}
+
+    out = {"competitors": {}}
+    if base:
+        out["traffic_score"], out["parking_score"] = 0, 0
+    for (field, t), fut in futures.items():
+        if field == "competitors":
+            out["competitors"][t] = fut.result()
+        else:
+            out[field] += fut.result()
+    return out
+
 
 def fetch_traffic_score(lat: float, lng: float, radius_m: int = 300) -> int:
-    types = ["transit_station", "bus_station", "train_station"]
-    count = 0
-    for place_type in types:
-        url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-        params = {
-            "location": f"{lat},{lng}",
-            "radius": radius_m,
-            "type": place_type,
-            "key": GOOGLE_API_KEY
-        }
-        # response = requests.get(url, params=params).json()
-        response = cached_get(url, params) 
-        count += len(response.get("results", []))
-        time.sleep(0.1)
-    return count
+    futures = [_PLACES_POOL.submit(metrics.bound(nearby_count), lat, lng, radius_m, t) for t in TRAFFIC_TYPES]
+    return sum(f.result() for f in futures)
 
 def fetch_parking_score(lat: float, lng: float, radius_m: int = 300) -> int:
-    url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-    params = {
-        "location": f"{lat},{lng}",
-        "radius": radius_m,
-        "type": "parking",
-        "key": GOOGLE_API_KEY
-    }
-    # response = requests.get(url, params=params).json()
-    response = cached_get(url, params) 
-    return len(response.get("results", []))
+    return nearby_count(lat, lng, radius_m, "parking")
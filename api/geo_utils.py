@@ -1,10 +1,21 @@
 import requests
 
+from . import metrics
+from .concurrency import upstream
+from .ratelimit import acquire
+from .fetcher import route_url
+from .boundaries import resolve_offline
+
 def reverse_geocode(lat: float, lng: float) -> tuple[str, str]:
     """
     Given latitude and longitude, return (neighborhood, city).
     Falls back to city only if neighborhood not available.
+    Answers from the local boundary files when they cover the point; Nominatim otherwise.
     """
+    offline = resolve_offline(lat, lng)
+    if offline["city"]:
+        return (offline["neighborhood"] or offline["city"], offline["city"])
+
     try:
         url = f"https://nominatim.openstreetmap.org/reverse"
         params = {
@@ -17,7 +28,10 @@ def reverse_geocode(lat: float, lng: float) -> tuple[str, str]:
         headers = {
             "User-Agent": "YourAppName (your_email@example.com)"  # Optional but recommended
         }
-        response = requests.get(url, params=params, headers=headers)
+        acquire("nominatim")
+        metrics.inc("upstream_requests_total", api="nominatim")
+        with upstream("nominatim"), metrics.span("upstream", api="nominatim"):
+            response = requests.get(route_url(url), params=params, headers=headers)
         data = response.json()
         address = data.get("address", {})
 
@@ -42,5 +56,6 @@ def reverse_geocode(lat: float, lng: float) -> tuple[str, str]:
         return (neighborhood or city, city)
 
     except Exception as e:
+        metrics.inc("upstream_errors_total", api="nominatim", reason=type(e).__name__)
         print(f"[Reverse Geocode Error] ({lat}, {lng}): {e}")
         return ("Unknown", "Unknown")
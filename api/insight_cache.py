@@ -0,0 +1,78 @@
+# api/insight_cache.py
+import hashlib, os, time
+
+from . import cache_db, metrics
+from .lru import TTLCache
+
+INSIGHT_TTL = 30 * 24 * 3600
+# How long this process trusts its in‑memory copy: invalidate_insights (e.g. the
+# management command) can only clear the memo of the process that runs it.
+INSIGHT_MEMO_TTL = int(os.getenv("INSIGHT_MEMO_TTL", 300))
+# Bump whenever the fetch_lifestyle_fit prompt changes meaningfully; old rows stop matching.
+INSIGHT_PROMPT_VERSION = 1
+LABEL_KEYS = ["population", "median_income", "rent_cost", "competitor_count", "traffic_score", "parking_score"]
+
+cache_db.ensure_schema(
+    """CREATE TABLE IF NOT EXISTS insight_cache (
+           cache_key      TEXT PRIMARY KEY,
+           zip_code       TEXT NOT NULL,
+           business_type  TEXT NOT NULL,
+           prompt_version INTEGER NOT NULL,
+           insight        TEXT NOT NULL,
+           created_at     INTEGER NOT NULL
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_insight_zip ON insight_cache(zip_code, business_type)",
+    "CREATE INDEX IF NOT EXISTS idx_insight_age ON insight_cache(created_at)",
+)
+_MEMO = TTLCache(maxsize=2048, ttl=INSIGHT_MEMO_TTL)
+
+
+def _norm_type(business_type: str) -> str:
+    return " ".join(str(business_type).lower().split())
+
+
+def insight_key(zone: dict, business_type: str, version: int = INSIGHT_PROMPT_VERSION) -> str:
+    """(zip, business type, Low/Medium/High bucket of every metric, prompt version) → key."""
+    buckets = ",".join(str(zone.get(f"{k}_label")) for k in LABEL_KEYS)
+    blob = f"{zone.get('zip')}|{_norm_type(business_type)}|{buckets}|v{version}"
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def load_insight(zone: dict, business_type: str, ttl: int = INSIGHT_TTL):
+    key = insight_key(zone, business_type)
+    insight = _MEMO.get(key, max_age=ttl)
+    if insight is not None:
+        metrics.cache_result("insight", True)
+        return insight
+    row = cache_db.connect().execute(
+        "SELECT insight, created_at FROM insight_cache WHERE cache_key=?", (key,)
+    ).fetchone()
+    hit = bool(row) and int(time.time()) - row[1] < ttl
+    metrics.cache_result("insight", hit)
+    if hit:
+        _MEMO.put(key, row[0], created_at=row[1])
+        return row[0]
+    return None
+
+
+def save_insight(zone: dict, business_type: str, insight: str) -> None:
+    key, now = insight_key(zone, business_type), int(time.time())
+    _MEMO.put(key, insight, created_at=now)
+    cache_db.write("INSERT OR REPLACE INTO insight_cache VALUES (?,?,?,?,?,?)",
+                   [(key, str(zone.get("zip")), _norm_type(business_type), INSIGHT_PROMPT_VERSION, insight, now)])
+
+
+def invalidate_insights(zip_code: str = None, business_type: str = None) -> int:
+    """Drop cached insights for a ZIP and/or business type (both None → everything)."""
+    where, args = [], []
+    if zip_code is not None:
+        where.append("zip_code = ?"); args.append(str(zip_code))
+    if business_type is not None:
+        where.append("business_type = ?"); args.append(_norm_type(business_type))
+    cache_db.flush()
+    conn = cache_db.connect()
+    with conn:
+        n = conn.execute("DELETE FROM insight_cache" + (" WHERE " + " AND ".join(where) if where else ""),
+                         args).rowcount
+    _MEMO.clear()
+    return n
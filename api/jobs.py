@@ -0,0 +1,177 @@
+# api/jobs.py
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import connection
+from django.utils import timezone
+
+from .analysis_store import area_key
+from .location_utils import iter_insights, rank_and_store
+from .models import AnalysisJob
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))                     # analyses run at once per process
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", 24 * 3600))      # identical requests reuse a finished job
+JOB_STALE_AFTER = int(os.getenv("JOB_STALE_AFTER", 300))          # no heartbeat this long → worker died
+PROGRESS_INTERVAL = 0.5                                            # min seconds between progress writes
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+#################################################
+# Submitting
+#################################################
+def request_key(params: dict) -> str:
+    """Identical analyses (same area cell, radius, type, weights, top N) share one key."""
+    weights = {k: float(v) for k, v in sorted((params.get("weights") or {}).items()) if v}
+    blob = json.dumps([
+        area_key(params["lat"], params["lng"], params["radius_km"], params["business_type"]),
+        weights, params["top_n"],
+    ])
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def submit(params: dict, refresh: bool = False):
+    """
+    (job, created). Returns the queued / running job for the same request, or a finished
+    one younger than JOB_RESULT_TTL, instead of starting another; `refresh` always starts one.
+    """
+    key = request_key(params)
+    if not refresh:
+        cutoff = timezone.now() - timedelta(seconds=JOB_RESULT_TTL)
+        existing = (AnalysisJob.objects
+                    .filter(request_key=key, status__in=[AnalysisJob.QUEUED, AnalysisJob.RUNNING])
+                    .order_by("-created_at").first()
+                    or AnalysisJob.objects
+                    .filter(request_key=key, status=AnalysisJob.DONE, finished_at__gte=cutoff)
+                    .order_by("-finished_at").first())
+        if existing is not None:
+            _ensure_pool()
+            return existing, False
+
+    job = AnalysisJob.objects.create(request_key=key, params={**params, "refresh": refresh},
+                                     progress={"stage": "queued"})
+    _ensure_pool().submit(run_job, job.id)
+    return job, True
+
+
+def _ensure_pool() -> ThreadPoolExecutor:
+    """Start the worker pool on first use and pick up jobs orphaned by a dead process."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="analysis-job")
+                for job_id in recover_stale_jobs():
+                    _pool.submit(run_job, job_id)
+    return _pool
+
+
+def recover_stale_jobs() -> list:
+    """Re‑queue running jobs whose heartbeat stopped; returns every job id waiting to run."""
+    stale = timezone.now() - timedelta(seconds=JOB_STALE_AFTER)
+    AnalysisJob.objects.filter(status=AnalysisJob.RUNNING, updated_at__lt=stale).update(
+        status=AnalysisJob.QUEUED, progress={"stage": "queued", "recovered": True}, updated_at=timezone.now())
+    return list(AnalysisJob.objects.filter(status=AnalysisJob.QUEUED).values_list("id", flat=True))
+
+
+#################################################
+# Running
+#################################################
+class JobProgress:
+    """
+    The `progress` callback handed to rank_and_store: keeps the job's stage, counters
+    and per‑ZIP partial results, written to the row at most every PROGRESS_INTERVAL
+    seconds (and on every stage change). Called from many worker threads.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._owner = threading.current_thread()
+        self.state = {"stage": "running", "zips_done": 0, "zips_total": None}
+        self.partial = []
+        self._lock = threading.Lock()
+        self._last_write = 0.0
+
+    def __call__(self, stage: str, **info):
+        with self._lock:
+            changed = False
+            if stage == "zip":
+                self.state["zips_done"] += 1
+                if info.get("zone"):
+                    self.partial.append(dict(info["zone"]))
+            elif stage == "insight":
+                self.state["insights_done"] = self.state.get("insights_done", 0) + 1
+            else:
+                changed = stage != self.state["stage"]
+                self.state["stage"] = stage
+                self.state.update(info)
+            if changed or time.monotonic() - self._last_write >= PROGRESS_INTERVAL:
+                self._write()
+
+    def _write(self):
+        self._last_write = time.monotonic()
+        AnalysisJob.objects.filter(pk=self.job_id).update(
+            progress=dict(self.state), partial=list(self.partial), updated_at=timezone.now())
+        if threading.current_thread() is not self._owner:
+            connection.close()                # short‑lived pool thread: don't leak its connection
+
+
+def run_job(job_id) -> None:
+    """Claim a queued job and run the full analysis + insights; the result lands on the row."""
+    try:
+        claimed = AnalysisJob.objects.filter(pk=job_id, status=AnalysisJob.QUEUED).update(
+            status=AnalysisJob.RUNNING, started_at=timezone.now(), updated_at=timezone.now(),
+            progress={"stage": "running"})
+        if not claimed:                       # another worker / process got it first
+            return
+        job = AnalysisJob.objects.get(pk=job_id)
+        p = job.params
+        progress = JobProgress(job_id)
+
+        result_id, zones = rank_and_store(
+            center_lat=p["lat"],
+            center_lng=p["lng"],
+            radius_km=p["radius_km"],
+            weights=p.get("weights") or {},
+            place_type=p["business_type"],
+            top_n=p["top_n"],
+            use_cache=not p.get("refresh"),
+            progress=progress,
+        )
+
+        progress("insights", insights_total=len(zones), insights_done=0)
+        for i, insight in iter_insights(zones, p["business_type"]):
+            zones[i]["gpt_insight"] = insight
+            progress("insight", index=i)
+
+        progress.state["stage"] = "done"
+        AnalysisJob.objects.filter(pk=job_id).update(
+            status=AnalysisJob.DONE, progress=dict(progress.state), partial=list(progress.partial),
+            result={"result_id": result_id, "results": zones},
+            finished_at=timezone.now(), updated_at=timezone.now())
+    except Exception as e:
+        print(f"[ERROR] analysis job {job_id} failed: {e}")
+        AnalysisJob.objects.filter(pk=job_id).update(
+            status=AnalysisJob.FAILED, error=str(e), finished_at=timezone.now(), updated_at=timezone.now())
+    finally:
+        connection.close()
+
+
+def job_payload(job: AnalysisJob, partial_from: int = 0) -> dict:
+    """JSON view of a job for polling / progress events (partial results from `partial_from` on)."""
+    return {
+        "job_id": str(job.id),
+        "status": job.status,
+        "progress": job.progress,
+        "partial": job.partial[partial_from:],
+        "result": job.result,
+        "error": job.error or None,
+        "created_at": job.created_at.isoformat(),
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
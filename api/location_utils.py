@@ -2,99 +2,97 @@
 # location_utils.py
 ########################
 import math
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Iterator, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import geopandas as gpd
 import requests
-from shapely.geometry import Point
 from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 import os
+import threading
 
-from .fetcher import (
-    fetch_competitor_count,
-    fetch_population,
-    fetch_median_income,
-    fetch_traffic_score,
-    fetch_parking_score,
-    cached_get
-)
-from .rent_agent import get_rent_score_from_coordinates
+from .fetcher import fetch_census_batch, fetch_location_metrics
+from .rent_agent import get_rent_score_from_coordinates, prefetch_rent_scores
+from .address import resolve_address
+from .insight_cache import load_insight, save_insight
 from .zip_cache import load_zip, save_zip
+from . import metrics
+from .concurrency import map_ordered
+from .ratelimit import invoke_llm
+from .zcta_index import ZctaIndex
+from .scoring import METRIC_KEYS, ZoneTable
+from .analysis_store import area_key, area_lock, find_area, load_analysis, remember_area, save_analysis, snap_area
 
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
+# One client for every insight request (keeps its HTTP connection pool warm)
+insight_llm = ChatOpenAI(model="gpt-4", temperature=0.5, openai_api_key=OPENAI_API_KEY)
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 shapefile_path = os.path.join(BASE_DIR, "data", "tl_2020_us_zcta520.shp")
+zcta_index_dir = os.getenv("ZCTA_INDEX_DIR", os.path.join(BASE_DIR, "data", "zcta_index"))
+
+_zip_index = None
+_zip_index_lock = threading.Lock()
 
 
-zip_gdf = gpd.read_file(shapefile_path)
-if zip_gdf.crs != "EPSG:4326":
-    zip_gdf = zip_gdf.to_crs(epsg=4326)
+def get_zip_index() -> ZctaIndex:
+    """
+    Load the ZCTA index on first use.
+    Prefers the prebuilt, memory‑mapped artifact (`manage.py build_zcta_index`);
+    falls back to parsing the TIGER shapefile if it has not been built yet.
+    """
+    global _zip_index
+    if _zip_index is None:
+        with _zip_index_lock:
+            if _zip_index is None:
+                if ZctaIndex.exists(zcta_index_dir):
+                    _zip_index = ZctaIndex.load(zcta_index_dir)
+                else:
+                    print("[WARN] No prebuilt ZCTA index, parsing shapefile (run `manage.py build_zcta_index`)")
+                    zip_gdf = gpd.read_file(shapefile_path, columns=["ZCTA5CE20"])
+                    if zip_gdf.crs != "EPSG:4326":
+                        zip_gdf = zip_gdf.to_crs(epsg=4326)
+                    _zip_index = ZctaIndex.from_gdf(zip_gdf)
+    return _zip_index
 
 #################################################
 # 1. HELPER: get_zip_codes_within_radius
 #################################################
 def get_zip_codes_within_radius(lat, lng, radius_km):
-    center_point = Point(lng, lat)
-    deg_radius = radius_km / 111.0
-    bounding_circle = center_point.buffer(deg_radius)
-    intersecting = zip_gdf[zip_gdf.geometry.intersects(bounding_circle)]
-    return intersecting[["ZCTA5CE20", "geometry"]]
+    return zip_frame(get_zip_index().query_radius(lat, lng, radius_km))
 
 
-def reverse_geocode_to_neighborhood(lat: float, lng: float) -> str | None:
-    url = "https://maps.googleapis.com/maps/api/geocode/json"
-    params = {
-        "latlng": f"{lat},{lng}",
-        "key": GOOGLE_API_KEY
-    }
+def zip_frame(positions) -> gpd.GeoDataFrame:
+    """GeoDataFrame (ZCTA5CE20, geometry) for rows of the ZCTA index."""
+    zip_index = get_zip_index()
+    return gpd.GeoDataFrame(
+        {"ZCTA5CE20": zip_index.zip_codes[positions]},
+        geometry=zip_index.geometries_at(positions),
+        crs="EPSG:4326",
+    )
 
-    try:
-        data = cached_get(url, params)
-
-        for result in data.get("results", []):
-            for component in result.get("address_components", []):
-                if "neighborhood" in component["types"]:
-                    return component["long_name"]
-                if "sublocality" in component["types"]:
-                    return component["long_name"]
-                if "locality" in component["types"]:
-                    return component["long_name"]
-        return None
 
-    except Exception as e:
-        print(f"[ERROR] reverse_geocode_to_neighborhood failed for ({lat}, {lng}): {e}")
-        return None
-    
-
-def reverse_geocode_to_city(lat: float, lng: float) -> str | None:
-    url = "https://maps.googleapis.com/maps/api/geocode/json"
-    params = {
-        "latlng": f"{lat},{lng}",
-        "key": GOOGLE_API_KEY
-    }
-
-    try:
-        data = cached_get(url, params)
+def reverse_geocode_to_neighborhood(lat: float, lng: float, zip_code: Optional[str] = None) -> str | None:
+    return resolve_address(lat, lng, zip_code)["neighborhood"]
 
-        for result in data.get("results", []):
-            for component in result.get("address_components", []):
-                if "locality" in component["types"]:  # This is the city
-                    return component["long_name"]
-        return None
 
-    except Exception as e:
-        print(f"[ERROR] reverse_geocode_to_city failed for ({lat}, {lng}): {e}")
-        return None
+def reverse_geocode_to_city(lat: float, lng: float, zip_code: Optional[str] = None) -> str | None:
+    return resolve_address(lat, lng, zip_code)["city"]
 
 
 #################################################
 # 2. HELPER: Evaluate single ZIP
 #################################################
 def evaluate_zip(zip_record, place_type: str = "restaurant", radius_m: int = 1000):
+    with metrics.span("evaluate_zip"):
+        return _evaluate_zip(zip_record, place_type, radius_m)
+
+
+def _evaluate_zip(zip_record, place_type: str, radius_m: int):
     try:
         centroid  = zip_record.geometry.centroid
         lat, lng  = centroid.y, centroid.x
@@ -102,26 +100,34 @@ def evaluate_zip(zip_record, place_type: str = "restaurant", radius_m: int = 100
 
         cached = load_zip(zip_code)   # <-- single‑arg call
         if cached is None:
+            with metrics.span("zip_metric", metric="census"):
+                census = fetch_census_batch([zip_code]).get(zip_code, {})
+            with metrics.span("zip_metric", metric="places"):
+                places = fetch_location_metrics(lat, lng, radius_m, competitor_types=[place_type])
+            with metrics.span("zip_metric", metric="rent"):
+                rent = get_rent_score_from_coordinates(lat, lng, zip_code)
             cached = {
                 "zip":           zip_code,
                 "lat":           lat,
                 "lng":           lng,
-                "population":    fetch_population(zip_code),
-                "median_income": fetch_median_income(zip_code),
-                "rent_cost":     get_rent_score_from_coordinates(lat, lng),
-                "traffic_score": fetch_traffic_score(lat, lng, radius_m),
-                "parking_score": fetch_parking_score(lat, lng, radius_m),
-                "competitors":   {},
+                "population":    census.get("population"),
+                "median_income": census.get("median_income"),
+                "rent_cost":     rent,
+                "traffic_score": places["traffic_score"],
+                "parking_score": places["parking_score"],
+                "competitors":   places["competitors"],
             }
-
-        if place_type in cached["competitors"]:
-            comp_cnt = cached["competitors"][place_type]
-        else:
-            comp_cnt = fetch_competitor_count((lat, lng), radius_m, place_type)
-            cached["competitors"][place_type] = comp_cnt
             save_zip(zip_code, cached)        # <-- two‑arg call
+        elif place_type not in cached["competitors"]:
+            with metrics.span("zip_metric", metric="competitors"):
+                places = fetch_location_metrics(lat, lng, radius_m, competitor_types=[place_type], base=False)
+            cached["competitors"].update(places["competitors"])
+            save_zip(zip_code, cached)
+
+        comp_cnt = cached["competitors"][place_type]
 
-        city = reverse_geocode_to_city(lat, lng)
+        with metrics.span("zip_metric", metric="city"):
+            city = reverse_geocode_to_city(lat, lng, zip_code)
 
         return {
             "zip":              zip_code,
@@ -144,94 +150,18 @@ def evaluate_zip(zip_record, place_type: str = "restaurant", radius_m: int = 100
 # 3. HELPER: min-max normalize + compute final "score"
 #################################################
 def normalize_and_score(zones: List[Dict], weights: Dict[str, float]) -> List[Dict]:
-    keys_positive = ["traffic_score", "parking_score", "population", "median_income"]
-    keys_negative = ["rent_cost", "competitor_count"]
-
-    valid_zones = [z for z in zones if all(z.get(k) is not None for k in keys_positive + keys_negative)]
-    if not valid_zones:
-        print("[DEBUG] No valid_zones found in normalize_and_score. Possibly missing data.")
-        return []
-
-    metric_ranges = {}
-    for k in (keys_positive + keys_negative):
-        vals = [z[k] for z in valid_zones]
-        mn, mx = min(vals), max(vals)
-        metric_ranges[k] = (mn, mx)
-
-    for z in zones:
-        if any(z.get(k) is None for k in keys_positive + keys_negative):
-            z["score"] = None
-            continue
-
-        total_score = 0.0
-
-        for k in keys_positive:
-            mn, mx = metric_ranges[k]
-            raw_norm = (z[k] - mn) / (mx - mn) if mx > mn else 1.0
-            z[f"{k}_labelnorm"] = raw_norm
-            z[f"{k}_label"] = label_score(raw_norm)
-            total_score += raw_norm * weights.get(k.replace("_score", "").replace("competitor_count", "competition"), 0)
-
-        for k in keys_negative:
-            mn, mx = metric_ranges[k]
-            if mx == mn:
-                raw_norm = 0.0
-            else:
-                raw_norm = (z[k] - mn) / (mx - mn)
-            inv_norm = 1 - raw_norm
-            z[f"{k}_norm"] = inv_norm
-            z[f"{k}_labelnorm"] = raw_norm
-            total_score += inv_norm * weights.get(k.replace("_score", "").replace("competitor_count", "competition"), 0)
-
-            if k == "rent_cost":
-                print(f"[DEBUG] Normalized rent_cost for ZIP {z['zip']}: raw={z[k]}, inv_norm={inv_norm}, raw_norm={raw_norm}")
-
-        z["score"] = round(total_score, 4)
-
-    scored = [z for z in zones if z["score"] is not None]
-    return sorted(scored, key=lambda x: x["score"], reverse=True)
-
-
-
-#################################################
-# 4. HELPER: Label each normalized metric ("Low","Med","High")
-#################################################
-def label_score(n: float) -> str:
-    if n >= 0.66:
-        return "High"
-    elif n >= 0.33:
-        return "Medium"
-    else:
-        return "Low"
-
-def label_zone_metrics(zones: List[Dict]) -> None:
     """
-    For each zone, read the "xxx_labelnorm" fields, produce "xxx_label" as Low/Medium/High
-    e.g. competitor_count_labelnorm => competitor_count_label
+    Min‑max normalize every metric across `zones`, label it and compute the weighted
+    "score"; returns scored copies, best first. Zones missing a metric are dropped.
     """
-    metric_keys = ["traffic_score", "parking_score", "population", "median_income", "rent_cost", "competitor_count"]
-    for z in zones:
-        for k in metric_keys:
-            labelnorm = z.get(f"{k}_labelnorm")
-            if labelnorm is not None:
-                z[f"{k}_label"] = label_score(labelnorm)
-            else:
-                z[f"{k}_label"] = None
+    return ZoneTable(zones).rank(weights)
+
 
 #################################################
-# 5. GPT: More positive-first commentary
+# 4. GPT: More positive-first commentary
 #################################################
-def fetch_lifestyle_fit(zone: Dict, business_type: str) -> Optional[str]:
-    neighborhood = reverse_geocode_to_neighborhood(zone["lat"], zone["lng"])
-
-    if neighborhood:
-        zone_name = neighborhood
-    else:
-        zone_name = f"ZIP code {zone.get('zip', 'Unknown')}"
-
-    llm = ChatOpenAI(model="gpt-4", temperature=0.5, openai_api_key=OPENAI_API_KEY)
-
-    prompt = f"""
+def insight_prompt(zone: Dict, business_type: str, zone_name: str) -> str:
+    return f"""
     You are helping assess whether a ZIP code or neighborhood is a good location to open a {business_type}.
 
     Base your assessment on the following metrics (normalized between 0 and 1):
@@ -254,67 +184,169 @@ def fetch_lifestyle_fit(zone: Dict, business_type: str) -> Optional[str]:
     You are encouraged to add real-world context about the area based on the name and location. Be practical but constructive.
     """
 
+
+def fetch_lifestyle_fit(zone: Dict, business_type: str) -> Optional[str]:
+    cached = load_insight(zone, business_type)
+    if cached is not None:
+        return cached
+
+    neighborhood = reverse_geocode_to_neighborhood(zone["lat"], zone["lng"], zone.get("zip"))
+
+    if neighborhood:
+        zone_name = neighborhood
+    else:
+        zone_name = f"ZIP code {zone.get('zip', 'Unknown')}"
+
+    prompt = insight_prompt(zone, business_type, zone_name)
+
     try:
-        response = llm.invoke(prompt)
-        return response.content.strip()
+        response = invoke_llm(insight_llm, prompt)
+        insight = response.content.strip()
+        save_insight(zone, business_type, insight)
+        return insight
     except Exception as e:
         print(f"Error fetching lifestyle fit: {e}")
         return None
 
+
+def generate_insights(zones: List[Dict], business_type: str) -> List[Optional[str]]:
+    """fetch_lifestyle_fit for every zone concurrently; results follow `zones` order."""
+    return map_ordered(lambda z: fetch_lifestyle_fit(z, business_type), zones)
+
+
+def iter_insights(zones: List[Dict], business_type: str) -> Iterator[Tuple[int, Optional[str]]]:
+    """Yield (zone index, insight) for every zone as soon as each one is ready."""
+    if not zones:
+        return
+    with ThreadPoolExecutor(max_workers=len(zones)) as pool:
+        futures = {pool.submit(metrics.bound(fetch_lifestyle_fit), z, business_type): i for i, z in enumerate(zones)}
+        for fut in as_completed(futures):
+            try:
+                yield futures[fut], fut.result()
+            except Exception as e:
+                print(f"Error fetching lifestyle fit: {e}")
+                yield futures[fut], None
+
 #################################################
-# 6. The main rank_top_zones function
+# 5. The main rank_top_zones function
 #################################################
 
 def construct_loopnet_url(zip_code: str, lat: float, lng: float) -> Optional[str]:
-    url = "https://maps.googleapis.com/maps/api/geocode/json"
-    params = {
-        "latlng": f"{lat},{lng}",
-        "key": GOOGLE_API_KEY
-    }
-    try:
-        data = cached_get(url, params)
-        results = data.get("results", [])
-
-        city = state = None
-        for result in results:
-            for comp in result.get("address_components", []):
-                if "locality" in comp["types"] and not city:
-                    city = comp["short_name"]
-                if "administrative_area_level_1" in comp["types"] and not state:
-                    state = comp["short_name"]
-            if city and state:
-                break
-
-        if city and state:
-            slug = f"{city.lower().replace(' ', '-')}-{state.lower()}-{zip_code}"
-            return f"https://www.loopnet.com/search/commercial-real-estate/{slug}/for-lease/"
-        else:
-            print(f"[WARN] Could not resolve city/state for ZIP {zip_code}")
-            return None
-    except Exception as e:
-        print(f"[ERROR] Failed to construct LoopNet URL for ZIP {zip_code}: {e}")
+    address = resolve_address(lat, lng, zip_code)
+    city, state = address["city_short"], address["state"]
+
+    if city and state:
+        slug = f"{city.lower().replace(' ', '-')}-{state.lower()}-{zip_code}"
+        return f"https://www.loopnet.com/search/commercial-real-estate/{slug}/for-lease/"
+    else:
+        print(f"[WARN] Could not resolve city/state for ZIP {zip_code}")
         return None
 
-def rank_top_zones(center_lat: float, center_lng: float, radius_km: float, weights: Dict[str, float], place_type: str = "restaurant", top_n: int = 5) -> List[Dict]:
+def _no_progress(stage: str, **info) -> None:
+    pass
+
+
+def collect_zones(center_lat: float, center_lng: float, radius_km: float, place_type: str = "restaurant",
+                  progress: Callable = None) -> Tuple[List[Dict], int]:
+    """
+    (zones, failed): raw (unweighted) metrics, city and LoopNet link for every scorable
+    ZIP in the radius, and how many candidate ZIPs errored out of evaluation.
+    `progress(stage, **info)` is called as each stage starts and after every ZIP
+    (from worker threads).
+    """
+    progress = progress or _no_progress
+
     # 1) Identify candidate ZIPs
-    zip_candidates = get_zip_codes_within_radius(center_lat, center_lng, radius_km)
+    with metrics.span("candidates"):
+        zip_candidates = get_zip_codes_within_radius(center_lat, center_lng, radius_km)
+    progress("census", zips_total=len(zip_candidates))
+
+    # 2) Warm the Census cache for every candidate with one ACS request
+    with metrics.span("census_batch"):
+        fetch_census_batch(zip_candidates["ZCTA5CE20"].tolist())
+
+    # 3) Resolve addresses + classify rent for every candidate in one LLM round-trip
+    progress("rent")
+    records = [row for _, row in zip_candidates.iterrows()]
+    centroids = [row.geometry.centroid for row in records]
+    with metrics.span("rent_batch"):
+        prefetch_rent_scores([(c.y, c.x, row["ZCTA5CE20"]) for c, row in zip(centroids, records)])
 
-    # 2) Evaluate each ZIP
-    zones = []
-    for _, row in zip_candidates.iterrows():
-        result = evaluate_zip(row, place_type=place_type)
-        if result:
-            zones.append(result)
+    # 4) Evaluate every ZIP concurrently (order follows zip_candidates)
+    progress("zips")
 
-    # 3) Normalize metrics + compute final 'score'
-    scored_zones = normalize_and_score(zones, weights)
+    def _evaluate(row):
+        zone = evaluate_zip(row, place_type=place_type)
+        progress("zip", zip=row["ZCTA5CE20"], zone=zone)
+        return zone
 
-    # 4) Label each metric with Low/Med/High
-    label_zone_metrics(scored_zones)
+    results = map_ordered(_evaluate, records)
+    zones = [r for r in results if r and all(r.get(k) is not None for k in METRIC_KEYS)]
 
     # 5) Add LoopNet commercial listing URLs
-    for z in scored_zones:
-        z["loopnet_url"] = construct_loopnet_url(z["zip"], z["lat"], z["lng"])
+    for z in zones:
+        with metrics.span("loopnet_url"):
+            z["loopnet_url"] = construct_loopnet_url(z["zip"], z["lat"], z["lng"])
+    return zones, sum(r is None for r in results)
+
 
-    # 6) Return top N scored zones
-    return scored_zones[:top_n]
+def rank_and_store(center_lat: float, center_lng: float, radius_km: float, weights: Dict[str, float],
+                   place_type: str = "restaurant", top_n: int = 5, use_cache: bool = True,
+                   progress: Callable = None) -> Tuple[str, List[Dict]]:
+    """
+    rank_top_zones, also keeping the raw metrics so the same analysis can be
+    re‑weighted later by its result_id (see reweight_zones).
+
+    The unweighted analysis is shared per area: the centre is snapped to a small grid
+    and (centre, radius, business type) maps to the latest stored result, so repeat
+    requests for an area only pay for scoring with their own weights.
+    `use_cache=False` forces a fresh analysis (which then replaces the cached one).
+    Only complete analyses are shared: if any ZIP failed, the result is not cached.
+    `progress` is passed to collect_zones; it also sees "cached" and "scoring".
+    """
+    progress = progress or _no_progress
+    key = area_key(center_lat, center_lng, radius_km, place_type)
+    with area_lock(key):
+        result_id = find_area(key) if use_cache else None
+        stored = load_analysis(result_id) if result_id else None
+        if use_cache:
+            metrics.cache_result("area", stored is not None)
+        if stored is not None:
+            table = stored[1]
+            progress("cached", result_id=result_id)
+        else:
+            lat, lng, radius = snap_area(center_lat, center_lng, radius_km)
+            zones, failed = collect_zones(lat, lng, radius, place_type, progress)
+            # Normalize + label every zone in one columnar pass
+            progress("scoring")
+            with metrics.span("scoring"):
+                table = ZoneTable(zones)
+            meta = {"lat": lat, "lng": lng, "radius_km": radius, "business_type": place_type, "top_n": top_n}
+            result_id = save_analysis(table, meta)
+            # A partial analysis (upstream errors, nothing scorable) is returned but
+            # not shared: the next request for the area recomputes it.
+            if zones and not failed:
+                remember_area(key, result_id)
+            else:
+                print(f"[WARN] area {key}: {failed} ZIP(s) failed, {len(zones)} scorable; not cached")
+
+    # Score with this request's weights + keep the top N
+    with metrics.span("ranking"):
+        return result_id, table.rank(weights, top_n)
+
+
+def rank_top_zones(center_lat: float, center_lng: float, radius_km: float, weights: Dict[str, float], place_type: str = "restaurant", top_n: int = 5) -> List[Dict]:
+    return rank_and_store(center_lat, center_lng, radius_km, weights, place_type, top_n)[1]
+
+
+def reweight_zones(result_id: str, weights: Dict[str, float], top_n: int = None) -> Optional[Tuple[dict, List[Dict]]]:
+    """
+    (meta, top zones) of a stored analysis rescored with new `weights`; no upstream
+    calls. None when the result_id is unknown or expired.
+    """
+    stored = load_analysis(result_id)
+    if stored is None:
+        return None
+    meta, table = stored
+    with metrics.span("ranking"):
+        return meta, table.rank(weights, top_n or meta.get("top_n", 5))
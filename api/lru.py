@@ -0,0 +1,70 @@
+# api/lru.py
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Bounded in‑process LRU with per‑entry expiry.
+
+    Values are stored as given (already decoded), so callers must treat what
+    `get` returns as read‑only. Each entry also remembers when its payload was
+    originally created, letting callers apply their own, stricter TTL.
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()           # key → (value, created_at, expires_at)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key, max_age: float = None):
+        """Value for `key`, or None if absent, expired, or older than `max_age` seconds."""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, created_at, expires_at = entry
+            if now >= expires_at or (max_age is not None and now - created_at >= max_age):
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, created_at: float = None) -> None:
+        now = time.time()
+        created_at = now if created_at is None else created_at
+        with self._lock:
+            self._data[key] = (value, created_at, now + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,107 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmark import (
+    BASELINE_PATH, FIXTURE_PATH, LATENCY_TOLERANCE, LLM_LATENCY_MS, MEMORY_TOLERANCE, REPEAT,
+    UPSTREAM_LATENCY_MS, WARM_RUNS, compare, fixture_signature, in_fresh_process, load_baseline,
+    record_fixture, run_suite, save_baseline, scenarios,
+)
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the ranking pipeline offline against recorded fixtures (stub upstreams, fake "
+            "LLM): latency percentiles, upstream calls and peak memory per scenario. Exits non‑zero "
+            "when a scenario regresses against the stored baseline, or when there is no baseline.")
+    requires_system_checks = []      # the pipeline is only imported inside the sample processes
+
+    def add_arguments(self, parser):
+        parser.add_argument("--metros", nargs="+", help="Subset of metros (default suite when no filter is given)")
+        parser.add_argument("--radii", nargs="+", type=float, help="Radii in km")
+        parser.add_argument("--types", nargs="+", help="Business types")
+        parser.add_argument("--pipeline", choices=["sync", "async"], default="sync")
+        parser.add_argument("--repeat", type=int, default=REPEAT, help="Cold samples per scenario")
+        parser.add_argument("--warm", type=int, default=WARM_RUNS, help="Area‑cache hits timed per sample")
+        parser.add_argument("--upstream-latency-ms", type=float, default=UPSTREAM_LATENCY_MS)
+        parser.add_argument("--llm-latency-ms", type=float, default=LLM_LATENCY_MS)
+        parser.add_argument("--fixture", default=FIXTURE_PATH)
+        parser.add_argument("--baseline", default=BASELINE_PATH)
+        parser.add_argument("--latency-tolerance", type=float, default=LATENCY_TOLERANCE)
+        parser.add_argument("--memory-tolerance", type=float, default=MEMORY_TOLERANCE)
+        parser.add_argument("--record", action="store_true",
+                            help="(Re)build the fixture by running every scenario once")
+        parser.add_argument("--seed", help="places_cache.sqlite snapshot to record the fixture from")
+        parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+        parser.add_argument("--allow-missing-baseline", action="store_true",
+                            help="Only report when there is no baseline to compare against (default: fail)")
+        parser.add_argument("--json", help="Also write the full report to this file")
+
+    def handle(self, *args, **opts):
+        try:
+            suite = scenarios(opts["metros"], opts["radii"], opts["types"])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if opts["record"]:
+            if opts["seed"] and not os.path.exists(opts["seed"]):
+                raise CommandError(f"No such snapshot: {opts['seed']}")
+            self.stdout.write(f"Recording {len(suite)} scenarios into {opts['fixture']}"
+                              f"{' from ' + opts['seed'] if opts['seed'] else ''} …")
+            counts = in_fresh_process(record_fixture, suite, opts["fixture"], opts["seed"], opts["pipeline"])
+            self.stdout.write(self.style.SUCCESS(f"Fixture written: {counts}"))
+            return
+
+        if not os.path.exists(opts["fixture"]):
+            raise CommandError(f"No fixture at {opts['fixture']}: run `manage.py benchmark --record` first")
+
+        def progress(name, i, sample):
+            self.stdout.write(f"  {name} [{i}/{opts['repeat']}] cold {sample['cold_ms']:.0f} ms")
+
+        report = run_suite(suite, opts["fixture"], opts["pipeline"], opts["repeat"], opts["warm"],
+                           opts["upstream_latency_ms"], opts["llm_latency_ms"], progress=progress)
+        self._print_report(report)
+
+        if opts["json"]:
+            with open(opts["json"], "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+
+        if opts["save_baseline"]:
+            save_baseline(report, opts["baseline"])
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {opts['baseline']}"))
+            return
+
+        baseline = load_baseline(opts["baseline"])
+        if baseline is None:
+            if not opts["allow_missing_baseline"]:
+                raise CommandError(f"No baseline at {opts['baseline']}: run with --save-baseline first "
+                                   f"(or pass --allow-missing-baseline)")
+            self.stdout.write(self.style.WARNING(f"No baseline at {opts['baseline']}, nothing to compare"))
+            return
+        if baseline["meta"].get("fixture") != fixture_signature(opts["fixture"]):
+            self.stdout.write(self.style.WARNING("Baseline was recorded against a different fixture"))
+        for key in ("pipeline", "upstream_latency_ms", "llm_latency_ms"):
+            if baseline["meta"].get(key) != report["meta"][key]:
+                self.stdout.write(self.style.WARNING(
+                    f"Baseline {key}={baseline['meta'].get(key)!r}, this run {report['meta'][key]!r}"))
+
+        problems = compare(report, baseline, opts["latency_tolerance"], opts["memory_tolerance"])
+        if problems:
+            for p in problems:
+                self.stdout.write(self.style.ERROR(f"REGRESSION {p}"))
+            raise CommandError(f"{len(problems)} regression(s) against {opts['baseline']}")
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {opts['baseline']}"))
+
+    def _print_report(self, report):
+        self.stdout.write(
+            f"\n{'scenario':<28} {'zones':>5} {'cold p50/p95':>15} {'recompute':>10} {'warm p50':>9} "
+            f"{'insights':>9} {'peak MB':>8}  upstream calls"
+        )
+        for name, s in report["scenarios"].items():
+            calls = ", ".join(f"{api}={n}" for api, n in s["upstream"].items()) or "-"
+            self.stdout.write(
+                f"{name:<28} {s['zones']:>5} {s['cold_ms']['p50']:>7.0f}/{s['cold_ms']['p95']:<7.0f} "
+                f"{s['recompute_ms']['p50']:>10.0f} {s['warm_ms']['p50']:>9.2f} {s['insights_ms']['p50']:>9.0f} "
+                f"{s['peak_rss_mb']:>8.0f}  {calls}"
+            )
+        self.stdout.write("")
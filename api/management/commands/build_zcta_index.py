@@ -0,0 +1,25 @@
+import time
+
+import geopandas as gpd
+from django.core.management.base import BaseCommand
+
+from api.location_utils import shapefile_path, zcta_index_dir
+from api.zcta_index import ZctaIndex
+
+
+class Command(BaseCommand):
+    help = "Convert the TIGER ZCTA shapefile into the memory‑mapped index loaded by location_utils."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shapefile", default=shapefile_path)
+        parser.add_argument("--out", default=zcta_index_dir)
+
+    def handle(self, *args, **opts):
+        t0 = time.time()
+        gdf = gpd.read_file(opts["shapefile"], columns=["ZCTA5CE20"])
+        if gdf.crs != "EPSG:4326":
+            gdf = gdf.to_crs(epsg=4326)
+        self.stdout.write(f"Read {len(gdf)} ZCTAs in {time.time() - t0:.1f}s")
+
+        ZctaIndex.from_gdf(gdf).save(opts["out"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote ZCTA index to {opts['out']} ({time.time() - t0:.1f}s total)"))
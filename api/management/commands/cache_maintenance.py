@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from api import cache_db, cache_maintenance as cm
+
+
+class Command(BaseCommand):
+    help = "Purge expired cache rows, enforce a size cap, vacuum incrementally and report cache usage."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-mb", type=float, default=cm.CACHE_MAX_MB,
+                            help="Evict oldest rows until cached payloads fit (default: $CACHE_MAX_MB)")
+        parser.add_argument("--vacuum-pages", type=int, default=cm.VACUUM_PAGES)
+        parser.add_argument("--recompress", action="store_true",
+                            help="Rewrite legacy plain‑JSON rows in the compressed encoding")
+        parser.add_argument("--report-only", action="store_true")
+
+    def handle(self, *args, **opts):
+        cache_db.flush()
+        if not opts["report_only"]:
+            if cm.enable_incremental_vacuum():
+                self.stdout.write("Switched cache DB to auto_vacuum=INCREMENTAL (full VACUUM done)")
+            for table, n in cm.purge_expired().items():
+                self.stdout.write(f"Purged {n} expired rows from {table}")
+            if opts["max_mb"]:
+                n = cm.enforce_max_size(int(opts["max_mb"] * 1024 * 1024))
+                self.stdout.write(f"Evicted {n} oldest rows to stay under {opts['max_mb']} MB")
+            if opts["recompress"]:
+                self.stdout.write(f"Recompressed {cm.recompress()} rows")
+            self.stdout.write(f"Freed {cm.incremental_vacuum(opts['vacuum_pages'])} pages")
+
+        stats = cm.report()
+        for table, s in stats.items():
+            if table == "_file":
+                continue
+            ages = "  ".join(f"{k}:{v}" for k, v in s["ages"].items())
+            self.stdout.write(f"{table:<20} rows={s['rows']:<8} bytes={s['bytes']:<12} ages[{ages}]")
+        f = stats["_file"]
+        self.stdout.write(f"file bytes={f['bytes']} free={f['free_bytes']}")
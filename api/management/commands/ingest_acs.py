@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.acs_store import ACS_VARIABLES, acs_value, get_snapshot, save_snapshot
+from api.fetcher import CENSUS_API_KEY, CENSUS_YEAR, route_url, session
+
+_ZCTA_FIELD = "zip code tabulation area"
+_VARS_PER_REQUEST = 45        # ACS API caps a query at 50 fields
+
+
+class Command(BaseCommand):
+    help = "Load the full ACS 5‑year ZCTA extract for CENSUS_YEAR into the local acs_snapshot table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--year", type=int, default=CENSUS_YEAR)
+        parser.add_argument("--variables", nargs="*", choices=sorted(ACS_VARIABLES),
+                            help="Subset of ACS_VARIABLES to load (default: all)")
+
+    def handle(self, *args, **opts):
+        year = opts["year"]
+        codes = [ACS_VARIABLES[n] for n in (opts["variables"] or ACS_VARIABLES)]
+        url = f"https://api.census.gov/data/{year}/acs/acs5"
+
+        total = 0
+        for i in range(0, len(codes), _VARS_PER_REQUEST):
+            chunk = codes[i:i + _VARS_PER_REQUEST]
+            t0 = time.time()
+            params = {"get": ",".join(chunk), "for": f"{_ZCTA_FIELD}:*", "key": CENSUS_API_KEY}
+            try:
+                response = session.get(route_url(url), params=params, timeout=120)
+                response.raise_for_status()
+                rows = response.json()
+            except Exception as e:
+                raise CommandError(f"ACS download failed for {chunk}: {e}")
+
+            header = rows[0]
+            zip_idx = header.index(_ZCTA_FIELD)
+            var_idx = [(var, header.index(var)) for var in chunk]
+            records = [(var, row[zip_idx], acs_value(row[j])) for row in rows[1:] for var, j in var_idx]
+            total += save_snapshot(year, records)
+            self.stdout.write(f"{len(chunk)} variables × {len(rows) - 1} ZCTAs in {time.time() - t0:.1f}s")
+
+        snap = get_snapshot(year)
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {total} values; snapshot {year} now has {len(snap)} ZCTAs × {len(snap.variables)} variables"
+        ))
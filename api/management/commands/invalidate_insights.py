@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.insight_cache import invalidate_insights
+
+
+class Command(BaseCommand):
+    help = "Delete cached GPT insights for a ZIP and/or business type (or all with --all)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--zip")
+        parser.add_argument("--business-type")
+        parser.add_argument("--all", action="store_true")
+
+    def handle(self, *args, **opts):
+        if not (opts["zip"] or opts["business_type"] or opts["all"]):
+            raise CommandError("Pass --zip, --business-type, or --all")
+        n = invalidate_insights(opts["zip"], opts["business_type"])
+        self.stdout.write(self.style.SUCCESS(f"Removed {n} cached insights"))
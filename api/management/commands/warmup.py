@@ -0,0 +1,66 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.concurrency import MAX_WORKERS
+from api.fetcher import cache_stats
+from api.location_utils import get_zip_index
+from api.warmup import WARMUP_CHUNK, job_signature, run_warmup, select_positions
+
+
+def _fmt_seconds(s):
+    if s is None:
+        return "?"
+    h, rem = divmod(int(s), 3600)
+    return f"{h}h{rem // 60:02d}m" if h else f"{rem // 60}m{rem % 60:02d}s"
+
+
+class Command(BaseCommand):
+    help = ("Prefetch Census / Places / geocode / rent data for every ZCTA in an area so the "
+            "first analysis there is served from cache. Resumable; meant for nightly runs.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bbox", nargs=4, type=float, metavar=("MIN_LAT", "MIN_LNG", "MAX_LAT", "MAX_LNG"))
+        parser.add_argument("--state", help="Two‑letter state, e.g. NY (selected by ZIP prefix)")
+        parser.add_argument("--zctas", nargs="*", help="Explicit ZCTAs")
+        parser.add_argument("--types", nargs="+", default=["restaurant"], help="Business types to warm")
+        parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+        parser.add_argument("--chunk", type=int, default=WARMUP_CHUNK, help="ZIPs per checkpoint")
+        parser.add_argument("--checkpoint", help="Progress file (default: one per job in the temp dir)")
+        parser.add_argument("--restart", action="store_true", help="Ignore any saved progress")
+
+    def handle(self, *args, **opts):
+        if not (opts["bbox"] or opts["state"] or opts["zctas"]):
+            raise CommandError("Give at least one of --bbox, --state or --zctas")
+        try:
+            positions = select_positions(bbox=opts["bbox"], state=opts["state"], zctas=opts["zctas"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if len(positions) == 0:
+            raise CommandError("No ZCTAs match the selection")
+
+        types = opts["types"]
+        checkpoint = opts["checkpoint"]
+        if checkpoint is None:
+            zips = [str(z) for z in get_zip_index().zip_codes[positions]]
+            checkpoint = os.path.join(tempfile.gettempdir(), f"warmup-{job_signature(zips, types)}.json")
+        if opts["restart"] and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        self.stdout.write(f"Warming {len(positions)} ZCTAs × {len(types)} types (checkpoint {checkpoint})")
+
+        def report(s):
+            self.stdout.write(
+                f"{s['done']}/{s['total']} done ({s['resumed']} resumed, {s['failed']} failed) · "
+                f"{s['rate']:.1f} ZIP‑types/s · elapsed {_fmt_seconds(s['elapsed'])} · ETA {_fmt_seconds(s['eta'])}"
+            )
+
+        stats = run_warmup(positions, types, checkpoint=checkpoint, workers=opts["workers"],
+                           chunk_size=opts["chunk"], progress=report)
+
+        style = self.style.SUCCESS if stats["failed"] == 0 else self.style.WARNING
+        self.stdout.write(style(
+            f"Warmed {stats['done'] - stats['resumed']} ZIP‑types in {_fmt_seconds(stats['elapsed'])}; "
+            f"{stats['failed']} failed (rerun to retry) · places cache: {cache_stats()}"
+        ))
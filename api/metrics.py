@@ -0,0 +1,188 @@
+# api/metrics.py
+#
+# In‑process instrumentation: counters, timing spans and a Prometheus text
+# rendering of both. Everything is per process; scrape each worker separately.
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+PREFIX = "firestore_"
+# Upper bounds (seconds) of the span histograms
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Counter help texts; counters not listed here are still exported
+COUNTERS = {
+    "cache_requests_total":    "Cache lookups by cache and result (hit / miss)",
+    "upstream_requests_total": "Requests sent to an upstream API (every attempt)",
+    "upstream_errors_total":   "Failed or throttled upstream requests by API and reason",
+}
+
+_LOCK = threading.Lock()
+_COUNTS = {}            # (name, labels) → float
+_SPANS = {}             # (name, labels) → [count, sum, per‑bucket counts]
+_CURRENT = contextvars.ContextVar("metrics_timings", default=None)
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+#################################################
+# Recording
+#################################################
+def inc(name: str, n: float = 1, **labels) -> None:
+    """Add `n` to the counter `name` with these labels."""
+    key = (name, _labels(labels))
+    with _LOCK:
+        _COUNTS[key] = _COUNTS.get(key, 0) + n
+
+
+def cache_result(cache: str, hit: bool, n: int = 1) -> None:
+    if n:
+        inc("cache_requests_total", n, cache=cache, result="hit" if hit else "miss")
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    """Record one finished span of `seconds` (also into the active request breakdown)."""
+    key = (name, _labels(labels))
+    with _LOCK:
+        entry = _SPANS.get(key)
+        if entry is None:
+            entry = _SPANS[key] = [0, 0.0, [0] * len(BUCKETS)]
+        entry[0] += 1
+        entry[1] += seconds
+        i = bisect_left(BUCKETS, seconds)
+        if i < len(BUCKETS):
+            entry[2][i] += 1
+    timings = _CURRENT.get()
+    if timings is not None:
+        timings.add(":".join([name, *(v for _, v in key[1])]), seconds)
+
+
+@contextmanager
+def span(name: str, **labels):
+    """Time the block as one `name` span."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t0, **labels)
+
+
+#################################################
+# Per‑request breakdown
+#################################################
+class Timings:
+    """Span totals for one request. Spans in worker threads add up, so they can exceed wall time."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            entry = self.spans.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            spans = {name: {"count": n, "ms": round(s * 1000, 2)} for name, (n, s) in sorted(self.spans.items())}
+        return {"total_ms": round((time.perf_counter() - self.started) * 1000, 2), "spans": spans}
+
+
+@contextmanager
+def collect_timings():
+    """
+    Collect every span recorded inside the block into a Timings: this thread, tasks
+    it starts and work run through map_ordered / bound() keep the same collector.
+    """
+    timings = Timings()
+    token = _CURRENT.set(timings)
+    try:
+        yield timings
+    finally:
+        _CURRENT.reset(token)
+
+
+def bound(fn):
+    """`fn` wrapped to run in a copy of the caller's context (for pool.submit)."""
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+#################################################
+# Export
+#################################################
+def snapshot() -> dict:
+    """{"counters": {...}, "spans": {...}} keyed by name{label="value",...}."""
+    with _LOCK:
+        counts = dict(_COUNTS)
+        spans = {k: (v[0], v[1]) for k, v in _SPANS.items()}
+    return {
+        "counters": {_series(n, l): v for (n, l), v in counts.items()},
+        "spans": {_series(n, l): {"count": c, "sum": s} for (n, l), (c, s) in spans.items()},
+    }
+
+
+def reset() -> None:
+    with _LOCK:
+        _COUNTS.clear()
+        _SPANS.clear()
+
+
+def _series(name: str, labels: tuple, extra: Optional[tuple] = None) -> str:
+    pairs = list(labels) + list(extra or ())
+    if not pairs:
+        return name
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return f"{name}{{{body}}}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def render(gauges: Dict[str, float] = None) -> str:
+    """Prometheus text exposition (format 0.0.4) of every counter, span and the given gauges."""
+    with _LOCK:
+        counts = sorted(_COUNTS.items())
+        spans = sorted((k, (v[0], v[1], list(v[2]))) for k, v in _SPANS.items())
+
+    lines, seen = [], set()
+    for (name, labels), value in counts:
+        metric = PREFIX + name
+        if metric not in seen:
+            seen.add(metric)
+            if name in COUNTERS:
+                lines.append(f"# HELP {metric} {COUNTERS[name]}")
+            lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{_series(metric, labels)} {_num(value)}")
+
+    # every span is one series of the span_seconds histogram, labelled by span name
+    metric = PREFIX + "span_seconds"
+    if spans:
+        lines.append(f"# HELP {metric} Time spent per instrumented stage")
+        lines.append(f"# TYPE {metric} histogram")
+    for (name, labels), (count, total, buckets) in spans:
+        series = (("span", name),) + labels
+        cumulative = 0
+        for le, n in zip(BUCKETS, buckets):
+            cumulative += n
+            lines.append(f"{_series(metric + '_bucket', series, (('le', repr(le)),))} {cumulative}")
+        lines.append(f"{_series(metric + '_bucket', series, (('le', '+Inf'),))} {count}")
+        lines.append(f"{_series(metric + '_sum', series)} {_num(total)}")
+        lines.append(f"{_series(metric + '_count', series)} {count}")
+
+    for name, value in sorted((gauges or {}).items()):
+        lines.append(f"# TYPE {PREFIX}{name} gauge")
+        lines.append(f"{PREFIX}{name} {_num(value)}")
+    return "\n".join(lines) + "\n"
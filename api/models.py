@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 
 # Create your models here.
@@ -11,3 +13,25 @@ class Review(models.Model):
 
     def __str__(self):
         return f"{self.name} ({self.rating})"
+
+
+class AnalysisJob(models.Model):
+    """One /api/jobs/ analysis, run by the local worker pool in api/jobs.py."""
+    QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+    STATUS_CHOICES = [(s, s) for s in (QUEUED, RUNNING, DONE, FAILED)]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    request_key = models.CharField(max_length=64, db_index=True)   # identical requests share a job
+    params = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    progress = models.JSONField(default=dict)       # {"stage", "zips_done", "zips_total", …}
+    partial = models.JSONField(default=list)        # per‑ZIP metrics as they finish
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)   # doubles as the worker heartbeat
+
+    def __str__(self):
+        return f"{self.id} ({self.status})"
@@ -0,0 +1,136 @@
+# api/places_tiles.py
+import math
+import time
+from typing import Optional
+
+import numpy as np
+
+from . import cache_db
+from .zcta_index import EARTH_RADIUS_M, haversine_m
+
+PLACE_PRECISION = 6           # geohash cell of a stored place (~1.2 km × 0.6 km)
+COVERAGE_PRECISION = 5        # geohash cell of a coverage circle centre (~4.9 km × 4.9 km)
+MAX_COVER_RADIUS_M = 5000     # searches wider than this are never recorded as coverage
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+cache_db.ensure_schema(
+    """CREATE TABLE IF NOT EXISTS places_tile (
+           place_type  TEXT    NOT NULL,
+           place_id    TEXT    NOT NULL,
+           geohash     TEXT    NOT NULL,
+           lat         REAL    NOT NULL,
+           lng         REAL    NOT NULL,
+           created_at  INTEGER NOT NULL,
+           PRIMARY KEY (place_type, place_id)
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_tile_cell ON places_tile(place_type, geohash)",
+    "CREATE INDEX IF NOT EXISTS idx_tile_age ON places_tile(created_at)",
+    # one row per nearby search whose full result set we have seen
+    """CREATE TABLE IF NOT EXISTS places_coverage (
+           place_type  TEXT    NOT NULL,
+           geohash     TEXT    NOT NULL,
+           lat         REAL    NOT NULL,
+           lng         REAL    NOT NULL,
+           radius_m    REAL    NOT NULL,
+           created_at  INTEGER NOT NULL
+       )""",
+    "CREATE INDEX IF NOT EXISTS idx_coverage_cell ON places_coverage(place_type, geohash)",
+    "CREATE INDEX IF NOT EXISTS idx_coverage_age ON places_coverage(created_at)",
+)
+
+
+#################################################
+# Geohash helpers
+#################################################
+def geohash(lat: float, lng: float, precision: int) -> str:
+    lat_rng, lng_rng = [-90.0, 90.0], [-180.0, 180.0]
+    out, bits, ch, even = [], 0, 0, True
+    while len(out) < precision:
+        rng, val = (lng_rng, lng) if even else (lat_rng, lat)
+        mid = (rng[0] + rng[1]) / 2
+        ch <<= 1
+        if val >= mid:
+            ch |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(out)
+
+
+def _cell_size(precision: int):
+    """(lat degrees, lng degrees) of one geohash cell."""
+    n = 5 * precision
+    return 180.0 / 2 ** (n // 2), 360.0 / 2 ** ((n + 1) // 2)
+
+
+def cells_covering(lat: float, lng: float, radius_m: float, precision: int) -> list:
+    """Every geohash cell that intersects the bounding box of the circle."""
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    dlng = math.degrees(radius_m / (EARTH_RADIUS_M * max(math.cos(math.radians(lat)), 1e-6)))
+    step_lat, step_lng = _cell_size(precision)
+    lats = np.append(np.arange(lat - dlat, lat + dlat, step_lat), lat + dlat)
+    lngs = np.append(np.arange(lng - dlng, lng + dlng, step_lng), lng + dlng)
+    return sorted({geohash(a, b, precision) for a in lats for b in lngs})
+
+
+def _in_clause(values) -> str:
+    return ",".join("?" * len(values))
+
+
+#################################################
+# Store / query
+#################################################
+def record_search(lat: float, lng: float, radius_m: float, place_type: str, results: list, complete: bool) -> None:
+    """
+    Store every returned place in its tile; if `complete` (Google returned the whole
+    result set, no truncation), also record the circle as covered for `place_type`.
+    """
+    now = int(time.time())
+    rows = []
+    for r in results:
+        loc = (r.get("geometry") or {}).get("location") or {}
+        if r.get("place_id") and "lat" in loc and "lng" in loc:
+            rows.append((place_type, r["place_id"], geohash(loc["lat"], loc["lng"], PLACE_PRECISION),
+                         loc["lat"], loc["lng"], now))
+    cache_db.write("INSERT OR REPLACE INTO places_tile VALUES (?,?,?,?,?,?)", rows)
+    if complete and radius_m <= MAX_COVER_RADIUS_M:
+        cache_db.write("INSERT INTO places_coverage VALUES (?,?,?,?,?,?)",
+                       [(place_type, geohash(lat, lng, COVERAGE_PRECISION), lat, lng, float(radius_m), now)])
+
+
+def is_covered(lat: float, lng: float, radius_m: float, place_type: str, ttl: int) -> bool:
+    """True if a recorded complete search of `place_type` fully contains this circle."""
+    cells = cells_covering(lat, lng, MAX_COVER_RADIUS_M, COVERAGE_PRECISION)
+    rows = cache_db.connect().execute(
+        f"SELECT lat, lng, radius_m FROM places_coverage "
+        f"WHERE place_type = ? AND created_at > ? AND geohash IN ({_in_clause(cells)})",
+        (place_type, int(time.time()) - ttl, *cells),
+    ).fetchall()
+    if not rows:
+        return False
+    cov = np.asarray(rows, dtype=float)
+    return bool(np.any(haversine_m(lat, lng, cov[:, 0], cov[:, 1]) + radius_m <= cov[:, 2] + 1.0))
+
+
+def covered_count(lat: float, lng: float, radius_m: float, place_type: str, ttl: int) -> Optional[int]:
+    """
+    Number of known `place_type` places within `radius_m` of the point, or None when
+    the circle is not fully covered by earlier searches (caller must ask Google).
+    """
+    if not is_covered(lat, lng, radius_m, place_type, ttl):
+        return None
+    cells = cells_covering(lat, lng, radius_m, PLACE_PRECISION)
+    rows = cache_db.connect().execute(
+        f"SELECT lat, lng FROM places_tile "
+        f"WHERE place_type = ? AND created_at > ? AND geohash IN ({_in_clause(cells)})",
+        (place_type, int(time.time()) - ttl, *cells),
+    ).fetchall()
+    if not rows:
+        return 0
+    pts = np.asarray(rows, dtype=float)
+    return int(np.count_nonzero(haversine_m(lat, lng, pts[:, 0], pts[:, 1]) <= radius_m))
@@ -0,0 +1,193 @@
+# api/ratelimit.py
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from . import metrics
+from .concurrency import upstream
+
+# Token buckets shared by every process on the host: one row per (api, key) in a
+# small SQLite file, updated inside BEGIN IMMEDIATE so concurrent workers see one
+# consistent balance.
+RATE_DB_PATH = Path(os.getenv("RATE_LIMIT_DB", Path(__file__).resolve().parent / "ratelimit.sqlite"))
+
+
+def _limit(name: str, qps: float, daily: Optional[int]):
+    quota = os.getenv(f"{name}_DAILY_QUOTA")
+    return (float(os.getenv(f"{name}_QPS", qps)),
+            int(quota) if quota else daily)
+
+
+# api → (sustained requests per second, requests per UTC day or None)
+RATE_LIMITS = {
+    "places":    _limit("PLACES", 50, None),
+    "geocode":   _limit("GEOCODE", 50, None),
+    "census":    _limit("CENSUS", 10, None),
+    "openai":    _limit("OPENAI", 5, None),
+    "nominatim": _limit("NOMINATIM", 1, None),    # OSM usage policy: ≤ 1 req/s
+}
+
+THROTTLE_FACTOR = 0.5          # rate multiplier on every 429 / OVER_QUERY_LIMIT
+MIN_RATE_FRACTION = 0.05       # never throttle below 5 % of the configured QPS
+RECOVERY_SECONDS = 60.0        # time for a throttled bucket to climb back to full QPS
+
+_local = threading.local()
+
+
+class QuotaExceeded(Exception):
+    """The daily quota for this API / key is used up."""
+
+
+def key_id(secret: Optional[str]) -> str:
+    """Short stable bucket id for an API key (the key itself is never stored)."""
+    return hashlib.sha1(secret.encode()).hexdigest()[:12] if secret else "default"
+
+
+#################################################
+# Store
+#################################################
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        conn = sqlite3.connect(RATE_DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")     # losing a bucket on power loss is harmless
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS rate_bucket (
+                   bucket      TEXT PRIMARY KEY,     -- "api:key"
+                   tokens      REAL NOT NULL,
+                   rate        REAL NOT NULL,        -- current (possibly throttled) tokens / s
+                   updated_at  REAL NOT NULL,
+                   day         TEXT NOT NULL,        -- UTC day `used` counts against
+                   used        INTEGER NOT NULL
+               )"""
+        )
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+
+def _today(now: float) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(now))
+
+
+def _refill(row, qps: float, now: float):
+    """(tokens, rate, day, used) brought forward to `now`."""
+    tokens, rate, updated_at, day, used = row
+    elapsed = max(0.0, now - updated_at)
+    rate = min(qps, rate + (qps - rate) * min(1.0, elapsed / RECOVERY_SECONDS))
+    tokens = min(max(1.0, qps), tokens + elapsed * rate)
+    if day != _today(now):
+        day, used = _today(now), 0
+    return tokens, rate, day, used
+
+
+def _update(api: str, key: str, fn):
+    """Run fn(tokens, rate, day, used, qps, quota) → (new_state, result) in one transaction."""
+    qps, quota = RATE_LIMITS[api]
+    bucket, now = f"{api}:{key}", time.time()
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT tokens, rate, updated_at, day, used FROM rate_bucket WHERE bucket = ?",
+                           (bucket,)).fetchone()
+        state = _refill(row, qps, now) if row else (max(1.0, qps), qps, _today(now), 0)
+        (tokens, rate, day, used), result = fn(*state, qps, quota)
+        conn.execute("INSERT OR REPLACE INTO rate_bucket VALUES (?,?,?,?,?,?)",
+                     (bucket, tokens, rate, now, day, used))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return result
+
+
+def try_acquire(api: str, key: str = "default", n: int = 1) -> float:
+    """
+    Take `n` tokens if available. Returns 0.0 on success, otherwise the number of
+    seconds until they will be. Raises QuotaExceeded when the daily quota is spent.
+    """
+    def _take(tokens, rate, day, used, qps, quota):
+        if quota is not None and used + n > quota:
+            raise QuotaExceeded(f"{api} daily quota of {quota} requests used up")
+        if tokens >= n:
+            return (tokens - n, rate, day, used + n), 0.0
+        return (tokens, rate, day, used), (n - tokens) / rate
+
+    return _update(api, key, _take)
+
+
+#################################################
+# Public API
+#################################################
+def acquire(api: str, key: str = "default", n: int = 1, timeout: float = None) -> None:
+    """
+    Block until `n` requests to `api` may be sent under the shared limit, sleeping
+    exactly as long as the bucket needs to refill. Raises QuotaExceeded, or
+    TimeoutError if capacity isn't available within `timeout` seconds.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        wait = try_acquire(api, key, n)
+        if wait <= 0:
+            return
+        if deadline is not None and time.monotonic() + wait > deadline:
+            raise TimeoutError(f"{api} rate limit: no capacity within {timeout}s")
+        time.sleep(wait)
+
+
+async def aacquire(api: str, key: str = "default", n: int = 1, timeout: float = None) -> None:
+    """`acquire` for coroutines: the store is touched off‑loop and waits use asyncio.sleep."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        wait = await asyncio.to_thread(try_acquire, api, key, n)
+        if wait <= 0:
+            return
+        if deadline is not None and time.monotonic() + wait > deadline:
+            raise TimeoutError(f"{api} rate limit: no capacity within {timeout}s")
+        await asyncio.sleep(wait)
+
+
+def throttled(api: str, key: str = "default") -> None:
+    """
+    The upstream pushed back (HTTP 429, OVER_QUERY_LIMIT, …): cut the shared rate and
+    drain the bucket so every process pauses, then let the rate recover gradually.
+    """
+    def _cut(tokens, rate, day, used, qps, quota):
+        return (0.0, max(qps * MIN_RATE_FRACTION, rate * THROTTLE_FACTOR), day, used), None
+
+    _update(api, key, _cut)
+    print(f"[RATE] {api} throttled by upstream, backing off")
+
+
+def usage(api: str, key: str = "default") -> dict:
+    """Current bucket state: {"tokens", "rate", "qps", "used_today", "daily_quota"}."""
+    def _peek(tokens, rate, day, used, qps, quota):
+        return (tokens, rate, day, used), {"tokens": tokens, "rate": rate, "qps": qps,
+                                           "used_today": used, "daily_quota": quota}
+
+    return _update(api, key, _peek)
+
+
+#################################################
+# LLM calls
+#################################################
+def invoke_llm(model, prompt):
+    """`model.invoke(prompt)` under the shared OpenAI rate limit and upstream slots."""
+    rate_key = key_id(os.getenv("OPENAI_API_KEY"))
+    acquire("openai", rate_key)
+    metrics.inc("upstream_requests_total", api="openai")
+    try:
+        with upstream("openai"), metrics.span("llm"):
+            return model.invoke(prompt)
+    except Exception as e:
+        if type(e).__name__ == "RateLimitError":       # openai.RateLimitError (HTTP 429)
+            metrics.inc("upstream_errors_total", api="openai", reason="throttled")
+            throttled("openai", rate_key)
+        else:
+            metrics.inc("upstream_errors_total", api="openai", reason=type(e).__name__)
+        raise
@@ -1,8 +1,11 @@
-import os
+import os, re, json, time
 from langchain_openai import ChatOpenAI
-from functools import lru_cache
 from dotenv import load_dotenv
-from .geo_utils import reverse_geocode
+from . import cache_db
+from .address import resolve_address
+from .concurrency import map_ordered
+from .ratelimit import invoke_llm
+from .lru import TTLCache
 
 load_dotenv()
 
@@ -16,13 +19,30 @@ label_to_score = {
     "expensive": 0.2
 }
 
-@lru_cache(maxsize=512)
-def get_rent_affordability_score(neighborhood: str, city: str) -> float:
-    """
-    Uses GPT to classify the rent level of a neighborhood as 'affordable', 'moderate', or 'expensive'.
-    Returns a corresponding numeric score.
-    """
-    prompt = f"""
+RENT_LABEL_TTL = 90 * 24 * 3600       # rent tiers move slowly
+RENT_BATCH_SIZE = 40                  # neighborhoods per prompt
+# Pairs whose prompt failed or came back unlabelled resolve to 0.5 for this long
+# instead of being re-prompted one by one (e.g. by evaluate_zip after a prefetch).
+RENT_FAILURE_TTL = int(os.getenv("RENT_FAILURE_TTL", 300))
+
+cache_db.ensure_schema(
+    """CREATE TABLE IF NOT EXISTS rent_label_cache (
+           pair_key    TEXT PRIMARY KEY,      -- lower(neighborhood) | lower(city)
+           label       TEXT NOT NULL,
+           created_at  INTEGER NOT NULL
+       )""",
+)
+_MEMO = TTLCache(maxsize=20_000, ttl=RENT_LABEL_TTL)
+_FAILED = TTLCache(maxsize=20_000, ttl=RENT_FAILURE_TTL)   # pair_key → True, this process only
+
+
+def _pair_key(neighborhood: str, city: str) -> str:
+    return f"{neighborhood.strip().lower()}|{city.strip().lower()}"
+
+
+def _build_batch_prompt(pairs) -> str:
+    listing = "\n".join(f"    {i}. '{n}', {c}" for i, (n, c) in enumerate(pairs, 1))
+    return f"""
     You are a commercial real estate market expert with deep knowledge of neighborhood-level rent trends across major U.S. cities.
 
     Classify the *commercial rent level* of the following neighborhoods relative to others in the same city:
@@ -36,29 +56,142 @@ def get_rent_affordability_score(neighborhood: str, city: str) -> float:
     - 'Hialeah', Miami → affordable
 
     Now classify:
-    - '{neighborhood}', {city} →
+{listing}
 
-    Return only one word: affordable, moderate, or expensive.
+    Return only a JSON object mapping each number to one word (affordable, moderate, or expensive),
+    e.g. {{"1": "moderate", "2": "expensive"}}.
     """
 
-    try:
-        response = llm.invoke(prompt)
-        label = response.content.strip().lower()
-        return label_to_score.get(label, 0.5)  # fallback to 'moderate' score if unexpected
-    except Exception as e:
-        print(f"Error fetching affordability score for {neighborhood}, {city}: {e}")
-        return 0.5  # neutral default on failure
 
+def _parse_batch_labels(text: str, n: int) -> dict:
+    """{index: label} from the model's reply; tolerates prose around the JSON or 'N: label' lines."""
+    labels = {}
+    match = re.search(r"\{.*\}", text, re.S)
+    if match:
+        try:
+            labels = {int(k): str(v).strip().lower() for k, v in json.loads(match.group(0)).items()}
+        except (ValueError, AttributeError):
+            labels = {}
+    if not labels:
+        for i, label in re.findall(r"(\d+)\W+(affordable|moderate|expensive)", text, re.I):
+            labels[int(i)] = label.lower()
+    return {i: l for i, l in labels.items() if 1 <= i <= n and l in label_to_score}
+
+
+def _load_labels(keys) -> dict:
+    found, missing = {}, []
+    for key in keys:
+        label = _MEMO.get(key)
+        if label is not None:
+            found[key] = label
+        else:
+            missing.append(key)
+    if missing:
+        cutoff = int(time.time()) - RENT_LABEL_TTL
+        conn = cache_db.connect()
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i + 500]
+            rows = conn.execute(
+                f"SELECT pair_key, label, created_at FROM rent_label_cache "
+                f"WHERE created_at > ? AND pair_key IN ({','.join('?' * len(chunk))})",
+                (cutoff, *chunk),
+            ).fetchall()
+            for key, label, created_at in rows:
+                found[key] = label
+                _MEMO.put(key, label, created_at=created_at)
+    return found
+
+
+def _pending_pairs(pairs):
+    """
+    (pairs, {pair: key}, cached labels, distinct uncached pairs) for a labelling request.
+    Pairs that recently failed to classify are left out of the uncached ones.
+    """
+    pairs = list(dict.fromkeys(pairs))
+    keys = {pair: _pair_key(*pair) for pair in pairs}
+    labels = _load_labels(list(dict.fromkeys(keys.values())))
+    todo = [p for p in pairs if keys[p] not in labels and _FAILED.get(keys[p]) is None]
+    todo = list({keys[p]: p for p in todo}.values())          # one prompt line per distinct key
+    return pairs, keys, labels, todo
+
+
+def _remember_failed(batch, keys) -> None:
+    """Keep the pairs of a failed prompt batch from being re-prompted for RENT_FAILURE_TTL."""
+    for pair in batch:
+        _FAILED.put(keys[pair], True)
+
+
+def _remember_labels(batch, keys, parsed) -> dict:
+    """
+    Memoize + persist the labels parsed for one prompt batch; returns {pair_key: label}.
+    Pairs the reply left unlabelled are remembered as failed.
+    """
+    now = int(time.time())
+    fresh = {keys[batch[j - 1]]: label for j, label in parsed.items()}
+    _remember_failed([p for p in batch if keys[p] not in fresh], keys)
+    for key, label in fresh.items():
+        _MEMO.put(key, label, created_at=now)
+    cache_db.write("INSERT OR REPLACE INTO rent_label_cache VALUES (?,?,?)",
+                   [(key, label, now) for key, label in fresh.items()])
+    return fresh
+
+
+def get_rent_affordability_scores(pairs) -> dict:
+    """
+    {(neighborhood, city): score} for many neighborhoods at once.
+    Labels are cached persistently (rent_label_cache) and shared by all workers;
+    uncached pairs are classified in one GPT prompt per RENT_BATCH_SIZE pairs.
+    Pairs the model fails to classify get the neutral 0.5 and are not cached; they are
+    not re-prompted for RENT_FAILURE_TTL seconds either.
+    """
+    pairs, keys, labels, todo = _pending_pairs(pairs)
+    for i in range(0, len(todo), RENT_BATCH_SIZE):
+        batch = todo[i:i + RENT_BATCH_SIZE]
+        try:
+            response = invoke_llm(llm, _build_batch_prompt(batch))
+            parsed = _parse_batch_labels(response.content, len(batch))
+        except Exception as e:
+            print(f"Error fetching affordability scores for {len(batch)} neighborhoods: {e}")
+            _remember_failed(batch, keys)
+            continue
+
+        labels.update(_remember_labels(batch, keys, parsed))
+
+    # fallback to 'moderate' score if missing or unexpected
+    return {pair: label_to_score.get(labels.get(keys[pair]), 0.5) for pair in pairs}
+
+
+def get_rent_affordability_score(neighborhood: str, city: str) -> float:
+    """
+    Uses GPT to classify the rent level of a neighborhood as 'affordable', 'moderate', or 'expensive'.
+    Returns a corresponding numeric score.
+    """
+    return get_rent_affordability_scores([(neighborhood, city)])[(neighborhood, city)]
+
+
+def _rent_pair(address: dict) -> tuple:
+    city = address["city"] or "Unknown"
+    return (address["neighborhood"] or city, city)
 
-def get_rent_score_from_coordinates(lat: float, lng: float) -> float:
+
+def get_rent_score_from_coordinates(lat: float, lng: float, zip_code: str = None) -> float:
     try:
-        neighborhood, city = reverse_geocode(lat, lng)
-        return get_rent_affordability_score(neighborhood, city)
+        return get_rent_affordability_score(*_rent_pair(resolve_address(lat, lng, zip_code)))
     except Exception as e:
         print(f"Error resolving rent score for ({lat}, {lng}): {e}")
         return 0.5
 
 
+def prefetch_rent_scores(locations) -> None:
+    """
+    Warm the address and rent caches for [(lat, lng, zip_code), …]:
+    addresses are resolved concurrently, then every uncached neighborhood is
+    classified in a single LLM round-trip.
+    """
+    addresses = map_ordered(lambda loc: resolve_address(*loc), locations)
+    get_rent_affordability_scores([_rent_pair(a) for a in addresses if a])
+
+
 # --- Simple test run ---
 if __name__ == "__main__":
     test_inputs = [
@@ -0,0 +1,75 @@
+# api/scoring.py
+from typing import Dict, List
+
+import numpy as np
+
+# (zone field, weight name, direction): +1 → more is better, −1 → less is better
+METRICS = [
+    ("traffic_score",    "traffic",       +1),
+    ("parking_score",    "parking",       +1),
+    ("population",       "population",    +1),
+    ("median_income",    "median_income", +1),
+    ("rent_cost",        "rent_cost",     -1),
+    ("competitor_count", "competition",   -1),
+]
+METRIC_KEYS = [k for k, _, _ in METRICS]
+WEIGHT_NAMES = [w for _, w, _ in METRICS]
+_POSITIVE = np.array([d > 0 for _, _, d in METRICS])
+
+LABEL_EDGES = (0.33, 0.66)                  # [0, .33) Low · [.33, .66) Medium · [.66, 1] High
+LABELS = np.array(["Low", "Medium", "High"], dtype=object)
+
+
+class ZoneTable:
+    """
+    Zones as columns: raw metrics (n × 6), their min‑max normalization and labels,
+    all computed once. Scoring for a set of weights is then a single pass over the
+    normalized matrix, so re‑weighting never touches the zone dicts.
+    """
+
+    def __init__(self, zones: List[Dict]):
+        self.zones = [z for z in zones if all(z.get(k) is not None for k in METRIC_KEYS)]
+        self.raw = np.array([[z[k] for k in METRIC_KEYS] for z in self.zones], dtype=float).reshape(-1, len(METRICS))
+
+        if len(self.zones):
+            mn, mx = self.raw.min(axis=0), self.raw.max(axis=0)
+        else:
+            mn = mx = np.zeros(len(METRICS))
+        span = mx - mn
+        flat = span == 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            norm = (self.raw - mn) / np.where(flat, 1.0, span)
+        # a metric with no spread counts as best for "more is better", worst otherwise
+        self.labelnorm = np.where(flat, np.where(_POSITIVE, 1.0, 0.0), norm)
+        # score contribution: positives as is, negatives inverted
+        self.contrib = np.where(_POSITIVE, self.labelnorm, 1.0 - self.labelnorm)
+        self.labels = LABELS[np.searchsorted(LABEL_EDGES, self.labelnorm, side="right")]
+
+    def __len__(self):
+        return len(self.zones)
+
+    def scores(self, weights: Dict[str, float]) -> np.ndarray:
+        w = np.array([float(weights.get(name, 0) or 0) for name in WEIGHT_NAMES])
+        total = np.zeros(len(self.zones))
+        for j in range(len(METRICS)):               # metric order keeps sums bit‑identical
+            total += self.contrib[:, j] * w[j]
+        return np.round(total, 4)
+
+    def rank(self, weights: Dict[str, float], top_n: int = None) -> List[Dict]:
+        """Scored copies of the zones, best first, with *_labelnorm / *_label / *_norm fields."""
+        scores = self.scores(weights)
+        order = np.argsort(-scores, kind="stable")
+        if top_n is not None:
+            order = order[:top_n]
+
+        out = []
+        for i in order:
+            z = dict(self.zones[i])
+            for j, (k, _, direction) in enumerate(METRICS):
+                z[f"{k}_labelnorm"] = float(self.labelnorm[i, j])
+                z[f"{k}_label"] = self.labels[i, j]
+                if direction < 0:
+                    z[f"{k}_norm"] = float(self.contrib[i, j])
+            z["score"] = float(scores[i])
+            out.append(z)
+        return out
@@ -1,3 +1,610 @@
-from django.test import TestCase
+import os
+import tempfile
 
-# Create your tests here.
+# Keep the sqlite caches and rate buckets of a test run out of the working tree;
+# set before any api module opens them.
+_TMP = tempfile.mkdtemp(prefix="firestore-tests-")
+os.environ.setdefault("PLACES_CACHE_DB", os.path.join(_TMP, "places_cache.sqlite"))
+os.environ.setdefault("RATE_LIMIT_DB", os.path.join(_TMP, "ratelimit.sqlite"))
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import asyncio
+import json
+import random
+import uuid
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+import requests
+
+from . import (acs_store, async_fetcher, async_pipeline, cache_db, cache_maintenance, fetcher, insight_cache,
+               location_utils, ratelimit, rent_agent, upstream_stub, views)
+from .analysis_store import area_key, find_area
+from .models import AnalysisJob
+from .places_tiles import covered_count, record_search
+from .scoring import METRIC_KEYS, ZoneTable
+from .upstream_stub import serve_in_thread
+
+
+def _places(lat, lng, n, step=0.0001):
+    """`n` fake Nearby Search results on a short line north of the point."""
+    return [{"place_id": f"p{lat}:{lng}:{i}", "geometry": {"location": {"lat": lat + i * step, "lng": lng}}}
+            for i in range(n)]
+
+
+#################################################
+# Write-behind queue
+#################################################
+class WriterTests(SimpleTestCase):
+    def test_bad_statement_only_loses_itself(self):
+        key = "writer-test"
+        cache_db.write("INSERT OR REPLACE INTO area_result VALUES (?,?,?)", [(key + "-1", "r1", 1)])
+        cache_db.write("INSERT INTO no_such_table VALUES (?)", [(1,)])
+        cache_db.write("INSERT OR REPLACE INTO area_result VALUES (?,?,?)", [(key + "-2", "r2", 1)])
+        cache_db.flush()
+        rows = cache_db.connect().execute(
+            "SELECT result_id FROM area_result WHERE area_key LIKE ? ORDER BY result_id", (key + "%",)
+        ).fetchall()
+        self.assertEqual(rows, [("r1",), ("r2",)])
+
+
+#################################################
+# Places tile store
+#################################################
+class CoveredCountTests(SimpleTestCase):
+    def test_complete_search_answers_smaller_circle(self):
+        record_search(40.0, -75.0, 500, "cafe", _places(40.0, -75.0, 5), complete=True)
+        cache_db.flush()
+        # points are 0, 11, 22, 33, 44 m north of the centre
+        self.assertEqual(covered_count(40.0, -75.0, 25, "cafe", ttl=3600), 3)
+        self.assertEqual(covered_count(40.0, -75.0, 500, "cafe", ttl=3600), 5)
+
+    def test_incomplete_or_outside_is_not_covered(self):
+        record_search(41.0, -75.0, 500, "bar", _places(41.0, -75.0, 5), complete=False)
+        record_search(42.0, -75.0, 500, "bar", _places(42.0, -75.0, 5), complete=True)
+        cache_db.flush()
+        self.assertIsNone(covered_count(41.0, -75.0, 100, "bar", ttl=3600))
+        self.assertIsNone(covered_count(42.0, -75.0, 600, "bar", ttl=3600))      # larger than the search
+        self.assertIsNone(covered_count(42.0, -75.0, 100, "gym", ttl=3600))      # other place type
+
+    def test_empty_complete_search_counts_zero(self):
+        record_search(43.0, -75.0, 500, "zoo", [], complete=True)
+        cache_db.flush()
+        self.assertEqual(covered_count(43.0, -75.0, 200, "zoo", ttl=3600), 0)
+
+
+class TileEvictionTests(SimpleTestCase):
+    def _search(self, lat, place_type, created_at, n=3):
+        """A complete search recorded at `created_at`: its tiles plus its coverage row."""
+        with mock.patch("api.places_tiles.time.time", return_value=created_at):
+            record_search(lat, -70.0, 500, place_type, _places(lat, -70.0, n), complete=True)
+        cache_db.flush()
+
+    def test_evicting_a_tile_drops_the_coverage_it_backed(self):
+        self._search(46.0, "museum", 1000)
+        self._search(47.0, "museum", 2000)
+        conn = cache_db.connect()
+        rowid = conn.execute("SELECT rowid FROM places_tile WHERE place_id = ?", ("p46.0:-70.0:1",)).fetchone()[0]
+        with conn:
+            self.assertEqual(cache_maintenance._evict_coverage(conn, rowid, 1000)[0], 1)
+        self.assertIsNone(covered_count(46.0, -70.0, 100, "museum", ttl=10 ** 10))
+        self.assertEqual(covered_count(47.0, -70.0, 100, "museum", ttl=10 ** 10), 3)
+
+    def test_size_cap_never_leaves_a_partial_covered_search(self):
+        self._search(48.0, "library", 500)
+        self._search(49.0, "library", 3000)
+        self.assertEqual(covered_count(48.0, -70.0, 100, "library", ttl=10 ** 10), 3)
+        cache_maintenance.enforce_max_size(cache_maintenance.payload_bytes() - 1)    # evict one row
+        self.assertIsNone(covered_count(48.0, -70.0, 100, "library", ttl=10 ** 10))
+        self.assertEqual(covered_count(49.0, -70.0, 100, "library", ttl=10 ** 10), 3)
+
+
+class NearbyCountTests(SimpleTestCase):
+    def _pages(self, lat, lng, sizes):
+        pages = []
+        for i, n in enumerate(sizes):
+            page = {"status": "OK", "results": _places(lat + i * 0.001, lng, n)}
+            if i < len(sizes) - 1:
+                page["next_page_token"] = f"t{i}"
+            pages.append(page)
+        return pages
+
+    def _count(self, lat, lng, pages):
+        with mock.patch.object(fetcher, "cached_get", side_effect=pages) as get, \
+                mock.patch.object(fetcher.time, "sleep"):
+            n = fetcher.nearby_count(lat, lng, 1000, "store", paginate=True)
+        cache_db.flush()
+        return n, get.call_count
+
+    def test_saturated_search_is_not_recorded_as_covered(self):
+        # Google stops after 3 × 20 results and the last page carries no token
+        n, calls = self._count(44.0, -75.0, self._pages(44.0, -75.0, [20, 20, 20]))
+        self.assertEqual((n, calls), (60, 3))
+        self.assertIsNone(covered_count(44.0, -75.0, 500, "store", ttl=3600))
+
+    def test_exhausted_search_is_recorded_as_covered(self):
+        n, calls = self._count(45.0, -75.0, self._pages(45.0, -75.0, [20, 7]))
+        self.assertEqual((n, calls), (27, 2))
+        self.assertEqual(covered_count(45.0, -75.0, 1000, "store", ttl=3600), 27)
+
+
+class CensusRowsTests(SimpleTestCase):
+    def test_parse_census_rows(self):
+        rows = [["B19013_001E", "B01003_001E", "zip code tabulation area"],
+                ["52000", "1200", "10001"], ["-666666666", "0", "10002"]]
+        self.assertEqual(fetcher._parse_census_rows(rows), {
+            "10001": {"population": 1200, "median_income": 52000},
+            "10002": {"population": 0, "median_income": None},
+        })
+        self.assertEqual(fetcher._parse_census_rows([]), {})
+
+    def test_census_params(self):
+        params = fetcher._census_params(["10001", "10002"])
+        self.assertEqual(params["for"], "zip code tabulation area:10001,10002")
+        self.assertEqual(params["get"], ",".join(fetcher.CENSUS_VARS.values()))
+
+
+class AcsSnapshotTests(SimpleTestCase):
+    YEAR = fetcher.CENSUS_YEAR
+
+    def test_partial_ingest_falls_back_to_the_census_cache(self):
+        acs_store.save_snapshot(self.YEAR, [("B01002_001E", "00601", 41.0), ("B01003_001E", "00602", 900.0)])
+        cached = {"population": 17000, "median_income": 21000}
+        fetcher._cache_store(fetcher._census_key("00601"), cached)
+        fetcher._cache_store(fetcher._census_key("00602"), cached)
+        with mock.patch.object(fetcher, "limited_get") as get:
+            out = fetcher.fetch_census_batch(["00601", "00602"])
+        self.assertEqual(out, {"00601": cached, "00602": cached})
+        get.assert_not_called()
+
+    def test_ingested_not_available_is_an_answer(self):
+        acs_store.save_snapshot(self.YEAR, [("B01003_001E", "00603", 0.0), ("B19013_001E", "00603", None)])
+        with mock.patch.object(fetcher, "limited_get") as get:
+            out = fetcher.fetch_census_batch(["00603"])
+        self.assertEqual(out, {"00603": {"population": 0, "median_income": None}})
+        get.assert_not_called()
+
+    def test_ingest_from_another_process_is_picked_up(self):
+        year = 1999
+        acs_store.save_snapshot(year, [("B01003_001E", "00604", 1.0)])
+        self.assertEqual(len(acs_store.get_snapshot(year)), 1)
+        conn = cache_db.connect()                  # another process: no invalidate() here
+        with conn:
+            conn.execute("INSERT INTO acs_snapshot VALUES (?,?,?,?,?)",
+                         (year, "B01003_001E", "00605", 2.0, int(time.time()) + 10))
+        self.assertEqual(len(acs_store.get_snapshot(year)), 1)
+        later = time.time() + acs_store.ACS_RECHECK_INTERVAL + 1
+        with mock.patch.object(acs_store.time, "time", return_value=later):
+            self.assertEqual(len(acs_store.get_snapshot(year)), 2)
+
+
+class TrafficScoreTests(SimpleTestCase):
+    def test_only_transit_types_are_searched(self):
+        counts = {"transit_station": 1, "bus_station": 2, "train_station": 4, "parking": 100}
+        with mock.patch.object(fetcher, "nearby_count", side_effect=lambda lat, lng, r, t: counts[t]) as nearby:
+            self.assertEqual(fetcher.fetch_traffic_score(40.0, -75.0), 7)
+        self.assertEqual(sorted(c.args[3] for c in nearby.call_args_list), sorted(fetcher.TRAFFIC_TYPES))
+
+
+def _zone(zip_code, value):
+    return {"zip": zip_code, "lat": 40.0, "lng": -75.0, "city": "X", **{k: value for k in METRIC_KEYS}}
+
+
+#################################################
+# Area cache
+#################################################
+class AreaCacheTests(SimpleTestCase):
+    def _rank(self, lat, collected):
+        with mock.patch.object(location_utils, "collect_zones", return_value=collected):
+            return location_utils.rank_and_store(lat, -75.0, 2, {}, "cafe")
+
+    def test_complete_analysis_is_shared(self):
+        result_id, top = self._rank(30.0, ([_zone("1", 1), _zone("2", 2)], 0))
+        self.assertEqual(len(top), 2)
+        self.assertEqual(find_area(area_key(30.0, -75.0, 2, "cafe")), result_id)
+
+    def test_partial_or_empty_analysis_is_not_shared(self):
+        result_id, top = self._rank(31.0, ([_zone("1", 1)], 1))
+        self.assertEqual(len(top), 1)
+        self.assertIsNone(find_area(area_key(31.0, -75.0, 2, "cafe")))
+        self._rank(32.0, ([], 0))
+        self.assertIsNone(find_area(area_key(32.0, -75.0, 2, "cafe")))
+
+
+#################################################
+# Insight cache
+#################################################
+class InsightMemoTests(SimpleTestCase):
+    def test_memo_expires_after_another_process_invalidates(self):
+        zone = _zone("19104", 1)
+        insight_cache.save_insight(zone, "Cafe", "Busy campus area.")
+        cache_db.flush()
+        # what invalidate_insights does in another process: the row goes, our memo stays
+        conn = cache_db.connect()
+        with conn:
+            conn.execute("DELETE FROM insight_cache WHERE zip_code = ?", ("19104",))
+        self.assertEqual(insight_cache.load_insight(zone, "Cafe"), "Busy campus area.")
+
+        later = time.time() + insight_cache.INSIGHT_MEMO_TTL + 1
+        with mock.patch("api.lru.time.time", return_value=later):
+            self.assertIsNone(insight_cache.load_insight(zone, "Cafe"))
+
+
+#################################################
+# Rent labels
+#################################################
+class RentFailureTests(SimpleTestCase):
+    def test_failed_batch_is_not_reprompted_per_pair(self):
+        pairs = [("Fail A", "Testville"), ("Fail B", "Testville")]
+        with mock.patch.object(rent_agent, "invoke_llm", side_effect=RuntimeError("down")) as llm:
+            self.assertEqual(rent_agent.get_rent_affordability_scores(pairs), {p: 0.5 for p in pairs})
+            for p in pairs:                             # what evaluate_zip does after the prefetch
+                self.assertEqual(rent_agent.get_rent_affordability_score(*p), 0.5)
+        self.assertEqual(llm.call_count, 1)
+
+    def test_unlabelled_pairs_are_not_reprompted(self):
+        pairs = [("Half A", "Testville"), ("Half B", "Testville")]
+        reply = mock.Mock(content='{"1": "expensive"}')
+        with mock.patch.object(rent_agent, "invoke_llm", return_value=reply) as llm:
+            self.assertEqual(rent_agent.get_rent_affordability_scores(pairs), {pairs[0]: 0.2, pairs[1]: 0.5})
+            self.assertEqual(rent_agent.get_rent_affordability_score(*pairs[1]), 0.5)
+        self.assertEqual(llm.call_count, 1)
+
+    def test_async_failed_batch_is_not_reprompted(self):
+        pairs = [("Async A", "Testville"), ("Async B", "Testville")]
+
+        async def run():
+            first = await async_pipeline.aget_rent_affordability_scores(pairs)
+            again = await async_pipeline.aget_rent_affordability_scores(pairs[:1])
+            return first, again
+
+        with mock.patch.object(async_pipeline, "ainvoke_llm",
+                               mock.AsyncMock(side_effect=RuntimeError("down"))) as llm:
+            first, again = asyncio.run(run())
+        self.assertEqual(first, {p: 0.5 for p in pairs})
+        self.assertEqual(again, {pairs[0]: 0.5})
+        self.assertEqual(llm.await_count, 1)
+
+
+#################################################
+# Scoring
+#################################################
+def _legacy_label(n):
+    return "High" if n >= 0.66 else "Medium" if n >= 0.33 else "Low"
+
+
+def _legacy_rank(zones, weights):
+    """The dict‑based normalize_and_score + label_zone_metrics that ZoneTable replaced."""
+    positive = ["traffic_score", "parking_score", "population", "median_income"]
+    negative = ["rent_cost", "competitor_count"]
+    zones = [dict(z) for z in zones if all(z.get(k) is not None for k in positive + negative)]
+    if not zones:
+        return []
+    ranges = {k: (min(z[k] for z in zones), max(z[k] for z in zones)) for k in positive + negative}
+
+    def weight(k):
+        return weights.get(k.replace("_score", "").replace("competitor_count", "competition"), 0)
+
+    for z in zones:
+        total = 0.0
+        for k in positive:
+            mn, mx = ranges[k]
+            norm = (z[k] - mn) / (mx - mn) if mx > mn else 1.0
+            z[f"{k}_labelnorm"] = norm
+            total += norm * weight(k)
+        for k in negative:
+            mn, mx = ranges[k]
+            norm = 0.0 if mx == mn else (z[k] - mn) / (mx - mn)
+            z[f"{k}_norm"] = 1 - norm
+            z[f"{k}_labelnorm"] = norm
+            total += (1 - norm) * weight(k)
+        z["score"] = round(total, 4)
+        for k in positive + negative:
+            z[f"{k}_label"] = _legacy_label(z[f"{k}_labelnorm"])
+    return sorted(zones, key=lambda x: x["score"], reverse=True)
+
+
+class ZoneTableTests(SimpleTestCase):
+    WEIGHTS = ["traffic", "parking", "population", "median_income", "rent_cost", "competition"]
+
+    def _random_zones(self, rng, n):
+        zones = []
+        for i in range(n):
+            z = {"zip": f"{i:05d}", "lat": 0.0, "lng": 0.0,
+                 "population": rng.randint(0, 60_000), "median_income": rng.choice([None, *range(20_000, 200_000, 997)]),
+                 "rent_cost": rng.choice([0.2, 0.5, 0.8]), "competitor_count": rng.randint(0, 3),
+                 "traffic_score": rng.randint(0, 40), "parking_score": rng.random() * 20}
+            if rng.random() < 0.1:
+                z["parking_score"] = None
+            zones.append(z)
+        return zones
+
+    def test_rank_matches_legacy_scoring(self):
+        rng = random.Random(19)
+        for _ in range(200):
+            zones = self._random_zones(rng, rng.randint(0, 30))
+            weights = {w: rng.choice([0, 0.5, 1, 2, rng.random()]) for w in self.WEIGHTS if rng.random() < 0.9}
+            expected = _legacy_rank(zones, weights)
+            got = ZoneTable(zones).rank(weights)
+            self.assertEqual([z["zip"] for z in got], [z["zip"] for z in expected])
+            for g, e in zip(got, expected):
+                self.assertEqual(set(g), set(e))
+                for k, v in e.items():
+                    if isinstance(v, float):
+                        self.assertAlmostEqual(g[k], v, places=12, msg=k)
+                    else:
+                        self.assertEqual(g[k], v, msg=k)
+
+    def test_top_n_and_uniform_metrics(self):
+        zones = [{"zip": str(i), "population": 10, "median_income": 1, "rent_cost": 0.5,
+                  "competitor_count": 2, "traffic_score": i, "parking_score": 3} for i in range(4)]
+        top = ZoneTable(zones).rank({"traffic": 1, "population": 1, "competition": 1}, top_n=2)
+        self.assertEqual([z["zip"] for z in top], ["3", "2"])
+        self.assertEqual((top[0]["population_label"], top[0]["competitor_count_label"]), ("High", "Low"))
+        self.assertEqual(top[0]["score"], 3.0)
+
+
+#################################################
+# Upstream HTTP (against api.upstream_stub)
+#################################################
+def _stub_failures(*rolls):
+    """upstream_stub's `random` with random() fixed to `rolls` (< error_rate → injected 503)."""
+    return mock.patch.object(upstream_stub, "random", mock.Mock(random=mock.Mock(side_effect=rolls),
+                                                                Random=random.Random))
+
+
+class UpstreamStubTests(SimpleTestCase):
+    def setUp(self):
+        self.server, self.base = serve_in_thread(error_rate=0.5)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        patcher = mock.patch.object(fetcher, "UPSTREAM_BASE_URL", self.base)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def calls(self, path="/maps/api/place/nearbysearch/json"):
+        return self.server.RequestHandlerClass.calls.get(path, 0)
+
+    def test_route_url_rewrites_known_hosts_only(self):
+        self.assertEqual(fetcher.route_url(fetcher.NEARBY_URL), self.base + "/maps/api/place/nearbysearch/json")
+        self.assertEqual(fetcher.route_url(fetcher.CENSUS_URL), self.base + "/data/2022/acs/acs5")
+        self.assertEqual(fetcher.route_url("https://example.com/x"), "https://example.com/x")
+        with mock.patch.object(fetcher, "UPSTREAM_BASE_URL", None):
+            self.assertEqual(fetcher.route_url(fetcher.NEARBY_URL), fetcher.NEARBY_URL)
+
+    def test_sync_get_retries_503(self):
+        session = fetcher.requests_session_with_retries()
+        for adapter in session.adapters.values():
+            adapter.max_retries = adapter.max_retries.new(backoff_factor=0)
+        params = {"location": "10.0,10.0", "radius": 100, "type": "cafe"}
+        with mock.patch.object(fetcher, "session", session), _stub_failures(0.1, 0.2, 0.9):
+            resp = fetcher.limited_get(fetcher.NEARBY_URL, params, "places", timeout=5)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.calls(), 3)
+
+        with mock.patch.object(fetcher, "session", session), _stub_failures(*[0.1] * 6), \
+                self.assertRaises(requests.RequestException):
+            fetcher.limited_get(fetcher.NEARBY_URL, params, "places", timeout=5)
+        self.assertEqual(self.calls(), 9)                  # 1 + 5 retries
+
+    def test_async_request_retries_503(self):
+        params = {"location": "11.0,11.0", "radius": 100, "type": "cafe"}
+
+        async def run():
+            try:
+                return await async_fetcher.request(fetcher.NEARBY_URL, params, "places")
+            finally:
+                await async_fetcher.aclose()
+
+        with mock.patch.object(async_fetcher, "_retry_delay", return_value=0), _stub_failures(0.1, 0.9):
+            resp = asyncio.run(run())
+        self.assertIn(resp.json()["status"], {"OK", "ZERO_RESULTS"})
+        self.assertEqual(self.calls(), 2)
+
+
+class AsyncCachedGetTests(SimpleTestCase):
+    def setUp(self):
+        self.server, self.base = serve_in_thread(latency_ms=100)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        patcher = mock.patch.object(fetcher, "UPSTREAM_BASE_URL", self.base)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def calls(self, path):
+        return self.server.RequestHandlerClass.calls.get(path, 0)
+
+    @staticmethod
+    def _run(*calls):
+        async def run():
+            try:
+                return await asyncio.gather(*calls, return_exceptions=True)
+            finally:
+                await async_fetcher.aclose()
+        return asyncio.run(run())
+
+    def test_concurrent_misses_share_one_request(self):
+        params = {"location": "12.0,12.0", "radius": 100, "type": "cafe"}
+        results = self._run(*(async_fetcher.async_cached_get(fetcher.NEARBY_URL, dict(params)) for _ in range(5)))
+        self.assertEqual(self.calls("/maps/api/place/nearbysearch/json"), 1)
+        self.assertTrue(all(r == results[0] for r in results))
+        # and the answer is cached for the sync path too
+        self.assertEqual(fetcher.cached_get(fetcher.NEARBY_URL, dict(params)), results[0])
+        self.assertEqual(self.calls("/maps/api/place/nearbysearch/json"), 1)
+
+    def test_failures_are_negatively_cached(self):
+        url = "https://maps.googleapis.com/maps/api/unknown/json"     # stub answers 404
+        first, = self._run(async_fetcher.async_cached_get(url, {"q": "neg"}))
+        self.assertIsInstance(first, Exception)
+        again = self._run(*(async_fetcher.async_cached_get(url, {"q": "neg"}) for _ in range(3)))
+        self.assertTrue(all(type(e) is type(first) and e is not first for e in again))
+        self.assertTrue(all(e.response.status_code == 404 for e in again))
+        self.assertEqual(self.calls("/maps/api/unknown/json"), 1)
+
+        # ... for NEGATIVE_TTL seconds only
+        later = time.time() + fetcher.NEGATIVE_TTL + 1
+        with mock.patch.object(fetcher.time, "time", return_value=later):
+            self._run(async_fetcher.async_cached_get(url, {"q": "neg"}))
+        self.assertEqual(self.calls("/maps/api/unknown/json"), 2)
+
+
+class NegativeCacheTests(SimpleTestCase):
+    def _get(self, params, **patch):
+        with mock.patch.object(fetcher, "_fetch_and_store", **patch) as fetch:
+            try:
+                return fetcher.cached_get("https://maps.googleapis.com/maps/api/neg/json", params), fetch
+            except Exception as e:
+                return e, fetch
+
+    def test_transient_errors_are_not_cached(self):
+        for i, error in enumerate([requests.ConnectionError("reset"), TimeoutError("slow"),
+                                   ratelimit.QuotaExceeded("spent")]):
+            first, _ = self._get({"q": f"transient{i}"}, side_effect=error)
+            self.assertIs(first, error)
+            again, fetch = self._get({"q": f"transient{i}"}, return_value={"status": "OK"})
+            self.assertEqual(again, {"status": "OK"})
+            fetch.assert_called_once()
+
+    def test_client_errors_are_cached_and_raised_as_new_objects(self):
+        resp = requests.Response()
+        resp.status_code = 400
+        error = requests.HTTPError("400 Client Error", response=resp)
+        first, _ = self._get({"q": "http400"}, side_effect=error)
+        self.assertIs(first, error)
+        again, fetch = self._get({"q": "http400"}, return_value={"status": "OK"})
+        fetch.assert_not_called()
+        self.assertIsInstance(again, requests.HTTPError)
+        self.assertIsNot(again, error)
+        self.assertEqual(again.response.status_code, 400)
+
+    def test_only_deterministic_payloads_are_cached(self):
+        self.assertTrue(fetcher._deterministic_failure({"status": "INVALID_REQUEST"}))
+        self.assertTrue(fetcher._deterministic_failure({"status": "NOT_FOUND"}))
+        self.assertFalse(fetcher._deterministic_failure({"status": "UNKNOWN_ERROR"}))
+        self.assertFalse(fetcher._deterministic_failure({"status": "OVER_QUERY_LIMIT"}))
+        resp = requests.Response()
+        resp.status_code = 429
+        self.assertFalse(fetcher._deterministic_failure(requests.HTTPError(response=resp)))
+
+    def test_negative_cache_is_bounded(self):
+        self.assertIsNotNone(fetcher._NEGATIVE.maxsize)
+        for i in range(fetcher._NEGATIVE.maxsize + 10):
+            fetcher._negative_put(f"bounded{i}", {"status": "NOT_FOUND"})
+        self.assertLessEqual(len(fetcher._NEGATIVE), fetcher._NEGATIVE.maxsize)
+
+
+#################################################
+# Rate limiter
+#################################################
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_then_wait(self):
+        with mock.patch.dict(ratelimit.RATE_LIMITS, {"census": (4.0, None)}):
+            waits = [ratelimit.try_acquire("census", "burst") for _ in range(5)]
+        self.assertEqual(waits[:4], [0.0] * 4)
+        self.assertGreater(waits[4], 0.2)
+        self.assertLessEqual(waits[4], 0.25)
+
+    def test_throttled_cuts_rate_and_drains(self):
+        ratelimit.try_acquire("places", "cut")
+        ratelimit.throttled("places", "cut")
+        state = ratelimit.usage("places", "cut")
+        self.assertLess(state["tokens"], 1.0)
+        self.assertAlmostEqual(state["rate"], state["qps"] * ratelimit.THROTTLE_FACTOR, delta=1.0)
+        for _ in range(10):
+            ratelimit.throttled("places", "cut")
+        self.assertAlmostEqual(ratelimit.usage("places", "cut")["rate"],
+                               state["qps"] * ratelimit.MIN_RATE_FRACTION, delta=0.5)
+
+    def test_daily_quota(self):
+        with mock.patch.dict(ratelimit.RATE_LIMITS, {"geocode": (100.0, 2)}):
+            ratelimit.try_acquire("geocode", "quota")
+            ratelimit.try_acquire("geocode", "quota")
+            with self.assertRaises(ratelimit.QuotaExceeded):
+                ratelimit.try_acquire("geocode", "quota")
+            self.assertEqual(ratelimit.usage("geocode", "quota")["used_today"], 2)
+
+    def test_acquire_timeout(self):
+        with mock.patch.dict(ratelimit.RATE_LIMITS, {"nominatim": (0.1, None)}):
+            ratelimit.acquire("nominatim", "slow")
+            with self.assertRaises(TimeoutError):
+                ratelimit.acquire("nominatim", "slow", timeout=0.5)
+
+
+#################################################
+# Views
+#################################################
+class ReweightViewTests(SimpleTestCase):
+    def _post(self, body):
+        return self.client.post("/api/reweight/", data=body, content_type="application/json")
+
+    def test_invalid_top_n_is_rejected(self):
+        for top_n in (0, -3, 2.5, "5", True, [1]):
+            resp = self._post({"result_id": "x", "top_n": top_n})
+            self.assertEqual(resp.status_code, 400, top_n)
+            self.assertFalse(resp.json()["success"])
+
+    def test_valid_top_n_reaches_the_store(self):
+        self.assertEqual(self._post({"result_id": "missing", "top_n": 3}).status_code, 404)
+        self.assertEqual(self._post({"result_id": "missing"}).status_code, 404)
+
+
+class JobEventsViewTests(TestCase):
+    def _job(self, **fields):
+        return AnalysisJob.objects.create(request_key="k", params={}, **fields)
+
+    @staticmethod
+    def _decode(chunks):
+        return [json.loads(line) for line in b"".join(chunks).decode().splitlines()]
+
+    def _fail(self, job):
+        job.partial, job.status, job.error = [{"zip": "1"}, {"zip": "2"}], AnalysisJob.FAILED, "boom"
+        job.save()
+
+    def _check_followed(self, events):
+        self.assertEqual([e["type"] for e in events], ["progress", "progress", "error", "done"])
+        self.assertEqual(events[0]["partial"], [{"zip": "1"}])
+        self.assertEqual(events[1]["partial"], [{"zip": "2"}])        # only what is new
+        self.assertEqual(events[2]["error"], "boom")
+
+    def test_wsgi_streams_a_sync_generator(self):
+        job = self._job(status=AnalysisJob.DONE, partial=[{"zip": "1"}], result={"results": [], "result_id": "r"})
+        resp = self.client.get(f"/api/jobs/{job.pk}/events/", {"format": "ndjson"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(resp.is_async)
+        events = self._decode(list(resp.streaming_content))
+        self.assertEqual([e["type"] for e in events], ["progress", "result", "done"])
+        self.assertEqual(events[1]["result_id"], "r")
+
+    async def test_asgi_streams_an_async_generator(self):
+        job = await AnalysisJob.objects.acreate(request_key="k", params={}, status=AnalysisJob.DONE,
+                                                result={"results": [], "result_id": "r"})
+        resp = await self.async_client.get(f"/api/jobs/{job.pk}/events/", {"format": "ndjson"})
+        self.assertTrue(resp.is_async)
+        events = self._decode([chunk async for chunk in resp.streaming_content])
+        self.assertEqual([e["type"] for e in events], ["progress", "result", "done"])
+
+    def test_running_job_is_followed_until_it_fails(self):
+        job = self._job(status=AnalysisJob.RUNNING, partial=[{"zip": "1"}])
+        events = views._job_events(job.pk, "ndjson")
+        with mock.patch.object(views, "JOB_EVENT_POLL", 0):
+            first = next(events)
+            self._fail(job)
+            rest = list(events)
+        self._check_followed(self._decode([c.encode() for c in [first, *rest]]))
+
+    async def test_async_running_job_is_followed_until_it_fails(self):
+        job = await AnalysisJob.objects.acreate(request_key="k", params={}, status=AnalysisJob.RUNNING,
+                                                partial=[{"zip": "1"}])
+        events = views._ajob_events(job.pk, "ndjson")
+        with mock.patch.object(views, "JOB_EVENT_POLL", 0):
+            first = await events.__anext__()
+            job.partial, job.status, job.error = [{"zip": "1"}, {"zip": "2"}], AnalysisJob.FAILED, "boom"
+            await job.asave()
+            rest = [c async for c in events]
+        self._check_followed(self._decode([c.encode() for c in [first, *rest]]))
+
+    async def test_unknown_job(self):
+        resp = await self.async_client.get(f"/api/jobs/{uuid.uuid4()}/events/")
+        self.assertEqual(resp.status_code, 404)
@@ -0,0 +1,135 @@
+# api/upstream_stub.py
+"""
+Offline stand-in for the Google Maps, Census ACS and Nominatim endpoints.
+
+    python -m api.upstream_stub --port 8765 --latency-ms 80 --error-rate 0.05
+    UPSTREAM_BASE_URL=http://127.0.0.1:8765 python manage.py runserver
+
+Responses are deterministic functions of the request parameters, so repeated
+runs see identical data. Latency and 503 errors can be injected to exercise
+the pooling and retry behaviour of fetcher / async_fetcher.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+def _seed(*parts) -> int:
+    return int(hashlib.sha256("|".join(map(str, parts)).encode()).hexdigest()[:12], 16)
+
+
+def _nearby(q: dict) -> dict:
+    lat, lng = map(float, q["location"].split(","))
+    rnd = random.Random(_seed(q["location"], q.get("radius"), q.get("type"), q.get("pagetoken")))
+    n = rnd.randint(0, 20)
+    results = [{
+        "place_id": f"stub-{q.get('type')}-{rnd.getrandbits(48):x}",
+        "name": f"Stub {q.get('type')} {i}",
+        "geometry": {"location": {"lat": lat + rnd.uniform(-0.003, 0.003),
+                                  "lng": lng + rnd.uniform(-0.003, 0.003)}},
+        "types": [q.get("type")],
+    } for i in range(n)]
+    return {"status": "OK" if results else "ZERO_RESULTS", "results": results}
+
+
+def _geocode(q: dict) -> dict:
+    lat, lng = map(float, q["latlng"].split(","))
+    cell = f"{round(lat, 2)},{round(lng, 2)}"
+    rnd = random.Random(_seed(cell))
+    city = f"Stubville {rnd.randint(1, 40)}"
+    return {"status": "OK", "results": [{"address_components": [
+        {"long_name": f"Quarter {rnd.randint(1, 200)}", "short_name": "Q", "types": ["neighborhood", "political"]},
+        {"long_name": city, "short_name": city, "types": ["locality", "political"]},
+        {"long_name": "Stub State", "short_name": "ST", "types": ["administrative_area_level_1", "political"]},
+        {"long_name": f"{rnd.randint(10000, 99999)}", "short_name": f"{rnd.randint(10000, 99999)}", "types": ["postal_code"]},
+    ]}]}
+
+
+def _census(q: dict):
+    variables = q["get"].split(",")
+    geo, _, zips = q["for"].rpartition(":")
+    rows = [variables + [geo]]
+    for z in zips.split(","):
+        rnd = random.Random(_seed("acs", z))
+        rows.append([str(rnd.randint(500, 80000) if v != "B19013_001E" else rnd.randint(25000, 200000))
+                     for v in variables] + [z])
+    return rows
+
+
+def _nominatim(q: dict) -> dict:
+    cell = f"{round(float(q['lat']), 2)},{round(float(q['lon']), 2)}"
+    rnd = random.Random(_seed(cell))
+    return {"address": {"neighbourhood": f"Quarter {rnd.randint(1, 200)}",
+                        "city": f"Stubville {rnd.randint(1, 40)}"}}
+
+
+ROUTES = {
+    "/maps/api/place/nearbysearch/json": _nearby,
+    "/maps/api/geocode/json": _geocode,
+    "/reverse": _nominatim,
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    error_rate = 0.0
+    calls = {}
+    _calls_lock = threading.Lock()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        q = {k: v[0] for k, v in parse_qs(url.query).items()}
+        with self._calls_lock:
+            self.calls[url.path] = self.calls.get(url.path, 0) + 1
+
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            return self._send(503, {"error": "injected failure"})
+
+        handler = ROUTES.get(url.path)
+        if handler is None and url.path.endswith("/acs/acs5"):
+            handler = _census
+        if handler is None:
+            return self._send(404, {"error": f"no stub for {url.path}"})
+        self._send(200, handler(q))
+
+    def _send(self, status: int, body) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_in_thread(port: int = 0, latency_ms: float = 0, error_rate: float = 0.0):
+    """Start the stub on a daemon thread; returns (server, base_url). Stop with server.shutdown()."""
+    handler = type("Handler", (StubHandler,), {
+        "latency": latency_ms / 1000.0, "error_rate": error_rate, "calls": {},
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency-ms", type=float, default=0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    args = ap.parse_args()
+    server, base = serve_in_thread(args.port, args.latency_ms, args.error_rate)
+    print(f"Upstream stub listening on {base}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -4,5 +4,10 @@ from .views import ReviewListCreateView
 
 urlpatterns = [
     path('analyze/', views.analyze_location),
+    path('analyze/async/', views.analyze_location_async),
+    path('reweight/', views.reweight_location),
+    path('jobs/', views.create_job),
+    path('jobs/<uuid:job_id>/', views.job_status),
+    path('jobs/<uuid:job_id>/events/', views.job_events),
     path('reviews/', ReviewListCreateView.as_view(), name='review-list-create'),
 ]
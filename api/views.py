@@ -1,13 +1,74 @@
+from django.core.handlers.asgi import ASGIRequest
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from rest_framework import generics
+import asyncio
 import json
+import time
 
-from .location_utils import rank_top_zones, fetch_lifestyle_fit
-from .models import Review
+from . import metrics
+from .async_pipeline import agenerate_insights, aiter_insights, arank_and_store
+from .fetcher import cache_stats
+from .insight_cache import load_insight
+from .location_utils import rank_and_store, reweight_zones, generate_insights, iter_insights
+from .jobs import job_payload, submit
+from .models import AnalysisJob, Review
 from .serializers import ReviewSerializer
 
-from sqlite3 import connect, Row
+
+def _ndjson(kind: str, payload: dict) -> str:
+    return json.dumps({"type": kind, **payload}) + "\n"
+
+
+def _sse(kind: str, payload: dict) -> str:
+    return f"event: {kind}\ndata: {json.dumps(payload)}\n\n"
+
+
+def _zones_payload(top_zips, result_id, timings=None):
+    payload = {"success": True, "result_id": result_id, "results": top_zips}
+    if timings is not None:
+        payload["timings"] = timings.as_dict()
+    return payload
+
+
+def _stream_insights(top_zips, business_type, fmt, result_id=None, timings=None):
+    """Scored zones first, then one event per GPT insight as it completes, then 'done'."""
+    encode = _sse if fmt == "sse" else _ndjson
+    yield encode("zones", _zones_payload(top_zips, result_id, timings))
+    try:
+        for i, insight in iter_insights(top_zips, business_type):
+            yield encode("insight", {"index": i, "zip": top_zips[i]["zip"], "gpt_insight": insight})
+    except Exception as e:
+        yield encode("error", {"error": str(e)})
+    yield encode("done", {})
+
+
+async def _astream_insights(top_zips, business_type, fmt, result_id=None, timings=None):
+    """Async twin of _stream_insights, for the ASGI view."""
+    encode = _sse if fmt == "sse" else _ndjson
+    yield encode("zones", _zones_payload(top_zips, result_id, timings))
+    try:
+        async for i, insight in aiter_insights(top_zips, business_type):
+            yield encode("insight", {"index": i, "zip": top_zips[i]["zip"], "gpt_insight": insight})
+    except Exception as e:
+        yield encode("error", {"error": str(e)})
+    yield encode("done", {})
+
+
+def _wants_timings(request, data) -> bool:
+    """`"timings": true` in the body or `?timings=1`: add a per-stage timing breakdown to the response."""
+    return bool(data.get('timings')) or request.GET.get('timings') in ('1', 'true')
+
+
+def _streaming_response(events, stream):
+    fmt = "sse" if stream == "sse" else "ndjson"
+    response = StreamingHttpResponse(
+        events(fmt),
+        content_type="text/event-stream" if fmt == "sse" else "application/x-ndjson",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"      # keep nginx from buffering the stream
+    return response
 
 
 @csrf_exempt
@@ -21,32 +82,39 @@ def analyze_location(request):
             radius_km = data.get('radius_km', 5)  # default radius
             weights = data.get('weights', {})
             business_type = data.get('business_type', 'restaurant')  # default type
+            # "ndjson" | "sse" → stream zones now and insights as they finish
+            stream = data.get('stream') or request.GET.get('stream')
+            refresh = bool(data.get('refresh'))    # skip the per-area result cache
+            timings = _wants_timings(request, data)
 
             if not center_lat or not center_lng:
                 return JsonResponse({'success': False, 'error': 'Missing coordinates'}, status=400)
-            
-
-            db = connect("api/places_cache.sqlite")
-            db.row_factory = Row
-            print("zip_analysis_cache columns →",
-                [r["name"] for r in db.execute("PRAGMA table_info(zip_analysis_cache);")])
-            db.close()
-
-            # Run the actual analysis
-            top_zips = rank_top_zones(
-                center_lat=center_lat,
-                center_lng=center_lng,
-                radius_km=radius_km,
-                weights=weights,
-                place_type=business_type,
-                top_n=5
-            )
-
-            # Add GPT commentary to each result
-            for zone in top_zips:
-                zone['gpt_insight'] = fetch_lifestyle_fit(zone, business_type)
-
-            return JsonResponse({'success': True, 'results': top_zips})
+
+            if data.get('job'):       # run in the background, answer with a job id right away
+                return _submit_job(data)
+
+            with metrics.collect_timings() as collected:
+                # Run the actual analysis
+                result_id, top_zips = rank_and_store(
+                    center_lat=center_lat,
+                    center_lng=center_lng,
+                    radius_km=radius_km,
+                    weights=weights,
+                    place_type=business_type,
+                    top_n=5,
+                    use_cache=not refresh,
+                )
+                timings = collected if timings else None
+
+                if stream:
+                    return _streaming_response(
+                        lambda fmt: _stream_insights(top_zips, business_type, fmt, result_id, timings), stream)
+
+                # Add GPT commentary to each result (all zones at once)
+                for zone, insight in zip(top_zips, generate_insights(top_zips, business_type)):
+                    zone['gpt_insight'] = insight
+
+            return JsonResponse(_zones_payload(top_zips, result_id, timings))
 
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)}, status=500)
@@ -54,6 +122,202 @@ def analyze_location(request):
     return JsonResponse({'error': 'POST request required'}, status=405)
 
 
+@csrf_exempt
+async def analyze_location_async(request):
+    """
+    analyze_location for the ASGI stack: every upstream call is awaited, so a
+    single process can hold many analyses in flight without parking threads.
+    """
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+
+            center_lat = data.get('lat')
+            center_lng = data.get('lng')
+            radius_km = data.get('radius_km', 5)  # default radius
+            weights = data.get('weights', {})
+            business_type = data.get('business_type', 'restaurant')  # default type
+            stream = data.get('stream') or request.GET.get('stream')
+            refresh = bool(data.get('refresh'))
+            timings = _wants_timings(request, data)
+
+            if not center_lat or not center_lng:
+                return JsonResponse({'success': False, 'error': 'Missing coordinates'}, status=400)
+
+            with metrics.collect_timings() as collected:
+                result_id, top_zips = await arank_and_store(
+                    center_lat=center_lat,
+                    center_lng=center_lng,
+                    radius_km=radius_km,
+                    weights=weights,
+                    place_type=business_type,
+                    top_n=5,
+                    use_cache=not refresh,
+                )
+                timings = collected if timings else None
+
+                if stream:
+                    return _streaming_response(
+                        lambda fmt: _astream_insights(top_zips, business_type, fmt, result_id, timings), stream)
+
+                for zone, insight in zip(top_zips, await agenerate_insights(top_zips, business_type)):
+                    zone['gpt_insight'] = insight
+
+            return JsonResponse(_zones_payload(top_zips, result_id, timings))
+
+        except Exception as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+    return JsonResponse({'error': 'POST request required'}, status=405)
+
+
+@csrf_exempt
+def reweight_location(request):
+    """Rescore a previous analysis (by result_id) with new weights; no data is refetched."""
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+
+            result_id = data.get('result_id')
+            weights = data.get('weights', {})
+            top_n = data.get('top_n')
+
+            timings = _wants_timings(request, data)
+
+            if not result_id:
+                return JsonResponse({'success': False, 'error': 'Missing result_id'}, status=400)
+            if top_n is not None and (isinstance(top_n, bool) or not isinstance(top_n, int) or top_n < 1):
+                return JsonResponse({'success': False, 'error': 'top_n must be a positive integer'}, status=400)
+
+            with metrics.collect_timings() as collected:
+                reweighted = reweight_zones(result_id, weights, top_n)
+                if reweighted is None:
+                    return JsonResponse({'success': False, 'error': 'Unknown or expired result_id'}, status=404)
+                meta, top_zips = reweighted
+
+                # Insights are keyed by metric buckets, not weights: reuse whatever is cached
+                for zone in top_zips:
+                    zone['gpt_insight'] = load_insight(zone, meta['business_type'])
+
+            return JsonResponse(_zones_payload(top_zips, result_id, collected if timings else None))
+
+        except Exception as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+    return JsonResponse({'error': 'POST request required'}, status=405)
+
+
+
+def _submit_job(data):
+    params = {
+        "lat": data.get('lat'),
+        "lng": data.get('lng'),
+        "radius_km": data.get('radius_km', 5),
+        "weights": data.get('weights', {}),
+        "business_type": data.get('business_type', 'restaurant'),
+        "top_n": 5,
+    }
+    job, created = submit(params, refresh=bool(data.get('refresh')))
+    return JsonResponse({'success': True, 'job_id': str(job.id), 'status': job.status,
+                         'deduplicated': not created}, status=202 if created else 200)
+
+
+@csrf_exempt
+def create_job(request):
+    """POST the /api/analyze/ body; returns a job id to poll (GET jobs/<id>/) or follow (jobs/<id>/events/)."""
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            if not data.get('lat') or not data.get('lng'):
+                return JsonResponse({'success': False, 'error': 'Missing coordinates'}, status=400)
+            return _submit_job(data)
+        except Exception as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+    return JsonResponse({'error': 'POST request required'}, status=405)
+
+
+def job_status(request, job_id):
+    job = AnalysisJob.objects.filter(pk=job_id).first()
+    if job is None:
+        return JsonResponse({'success': False, 'error': 'Unknown job'}, status=404)
+    return JsonResponse({'success': True, **job_payload(job)})
+
+
+JOB_EVENT_POLL = 0.5          # seconds between job row checks while streaming progress
+JOB_EVENT_KEEPALIVE = 15      # seconds of silence before a keep-alive comment
+
+
+def _job_frames(job, fmt, cursor):
+    """
+    (chunks, finished) for one look at the job row: a 'progress' event (with only the
+    new partial zones) when it changed, then 'result' | 'error' and 'done' once it ended.
+    `cursor` carries what was already sent between calls.
+    """
+    encode = _sse if fmt == "sse" else _ndjson
+    if job is None:
+        return [encode("error", {"error": "Unknown job"}), encode("done", {})], True
+    chunks = []
+    if job.updated_at != cursor["seen"]:
+        cursor["seen"] = job.updated_at
+        payload = job_payload(job, partial_from=cursor["sent_partial"])
+        cursor["sent_partial"] = len(job.partial)
+        chunks.append(encode("progress", {"status": job.status, "progress": job.progress,
+                                          "partial": payload["partial"]}))
+        cursor["last_sent"] = time.monotonic()
+    if job.status == AnalysisJob.DONE:
+        return chunks + [encode("result", {"success": True, **job.result}), encode("done", {})], True
+    if job.status == AnalysisJob.FAILED:
+        return chunks + [encode("error", {"error": job.error}), encode("done", {})], True
+    if fmt == "sse" and time.monotonic() - cursor["last_sent"] > JOB_EVENT_KEEPALIVE:
+        chunks.append(": keep-alive\n\n")
+        cursor["last_sent"] = time.monotonic()
+    return chunks, False
+
+
+def _job_cursor():
+    return {"seen": None, "sent_partial": 0, "last_sent": time.monotonic()}
+
+
+def _job_events(job_id, fmt):
+    """Progress events of a job until it ends (WSGI: one worker thread per open stream)."""
+    cursor = _job_cursor()
+    while True:
+        chunks, finished = _job_frames(AnalysisJob.objects.filter(pk=job_id).first(), fmt, cursor)
+        yield from chunks
+        if finished:
+            return
+        time.sleep(JOB_EVENT_POLL)
+
+
+async def _ajob_events(job_id, fmt):
+    """Async twin of _job_events, for the ASGI stack: waiting between polls costs no thread."""
+    cursor = _job_cursor()
+    while True:
+        chunks, finished = _job_frames(await AnalysisJob.objects.filter(pk=job_id).afirst(), fmt, cursor)
+        for chunk in chunks:
+            yield chunk
+        if finished:
+            return
+        await asyncio.sleep(JOB_EVENT_POLL)
+
+
+def job_events(request, job_id):
+    """
+    Follow a job as SSE / NDJSON. Under ASGI the stream is an async generator; under
+    WSGI (which would buffer an async stream to the end) a plain generator.
+    """
+    if not AnalysisJob.objects.filter(pk=job_id).exists():
+        return JsonResponse({'success': False, 'error': 'Unknown job'}, status=404)
+    events = _ajob_events if isinstance(request, ASGIRequest) else _job_events
+    return _streaming_response(lambda fmt: events(job_id, fmt), request.GET.get('format', 'sse'))
+
+
+def prometheus_metrics(request):
+    """Prometheus scrape target: counters, stage timings and in-memory cache stats of this process."""
+    gauges = {f"memory_cache_{k}": v for k, v in cache_stats().items()}
+    return HttpResponse(metrics.render(gauges), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 
 class ReviewListCreateView(generics.ListCreateAPIView):
     queryset = Review.objects.order_by('-created_at')[:10]
@@ -0,0 +1,146 @@
+# api/warmup.py
+import hashlib
+import json
+import os
+import time
+from typing import Callable, Iterable, List, Optional
+
+import numpy as np
+
+from .concurrency import MAX_WORKERS, map_ordered
+from .fetcher import fetch_census_batch
+from .location_utils import evaluate_zip, get_zip_index, zip_frame
+from .rent_agent import prefetch_rent_scores
+
+WARMUP_CHUNK = 200            # ZIPs per checkpoint (one Census batch, one rent prompt round)
+
+# USPS ZIP3 prefixes per state, as inclusive ranges. ZCTAs follow ZIP allocation,
+# so a handful of cross‑border ZCTAs can land in the neighbouring state.
+STATE_ZIP3 = {
+    "AL": [(350, 369)], "AK": [(995, 999)], "AZ": [(850, 865)], "AR": [(716, 729)],
+    "CA": [(900, 961)], "CO": [(800, 816)], "CT": [(60, 69)], "DE": [(197, 199)],
+    "DC": [(200, 200), (202, 205), (569, 569)], "FL": [(320, 339), (341, 349)],
+    "GA": [(300, 319), (398, 399)], "HI": [(967, 968)], "ID": [(832, 838)], "IL": [(600, 629)],
+    "IN": [(460, 479)], "IA": [(500, 528)], "KS": [(660, 679)], "KY": [(400, 427)],
+    "LA": [(700, 714)], "ME": [(39, 49)], "MD": [(206, 219)], "MA": [(10, 27), (55, 55)],
+    "MI": [(480, 499)], "MN": [(550, 567)], "MS": [(386, 397)], "MO": [(630, 658)],
+    "MT": [(590, 599)], "NE": [(680, 693)], "NV": [(889, 898)], "NH": [(30, 38)],
+    "NJ": [(70, 89)], "NM": [(870, 884)], "NY": [(5, 5), (100, 149)], "NC": [(270, 289)],
+    "ND": [(580, 588)], "OH": [(430, 459)], "OK": [(730, 749)], "OR": [(970, 979)],
+    "PA": [(150, 196)], "RI": [(28, 29)], "SC": [(290, 299)], "SD": [(570, 577)],
+    "TN": [(370, 385)], "TX": [(750, 799), (885, 885)], "UT": [(840, 847)], "VT": [(50, 54), (56, 59)],
+    "VA": [(201, 201), (220, 246)], "WA": [(980, 994)], "WV": [(247, 268)], "WI": [(530, 549)],
+    "WY": [(820, 831)], "PR": [(6, 9)],
+}
+
+
+#################################################
+# Selecting ZCTAs
+#################################################
+def select_positions(bbox=None, state: str = None, zctas: Iterable[str] = None) -> np.ndarray:
+    """
+    ZCTA index rows matching every given filter: bbox (min_lat, min_lng, max_lat, max_lng),
+    a state abbreviation (by ZIP prefix) and/or an explicit list of ZCTAs.
+    """
+    index = get_zip_index()
+    mask = np.ones(len(index), dtype=bool)
+    if bbox is not None:
+        in_box = np.zeros(len(index), dtype=bool)
+        in_box[index.query_bbox(*bbox)] = True
+        mask &= in_box
+    if state is not None:
+        ranges = STATE_ZIP3.get(state.upper())
+        if ranges is None:
+            raise ValueError(f"Unknown state {state!r}")
+        zip3 = np.array([int(z[:3]) for z in index.zip_codes])
+        mask &= np.any([(zip3 >= lo) & (zip3 <= hi) for lo, hi in ranges], axis=0)
+    if zctas is not None:
+        mask &= np.isin(np.asarray(index.zip_codes).astype(str), [str(z) for z in zctas])
+    return np.flatnonzero(mask)
+
+
+#################################################
+# Checkpoint
+#################################################
+def job_signature(zip_codes: List[str], business_types: List[str]) -> str:
+    blob = ",".join(sorted(zip_codes)) + "|" + ",".join(sorted(business_types))
+    return hashlib.sha256(blob.encode()).hexdigest()[:16]
+
+
+def load_checkpoint(path: str, signature: str) -> set:
+    """Units ("zip|type") already warmed by an interrupted run of the same job."""
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    return set(state.get("done", [])) if state.get("signature") == signature else set()
+
+
+def save_checkpoint(path: str, signature: str, done: set) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"signature": signature, "done": sorted(done), "updated_at": int(time.time())}, f)
+    os.replace(tmp, path)          # atomic: a crash never leaves a half‑written checkpoint
+
+
+#################################################
+# Run
+#################################################
+def run_warmup(positions, business_types: List[str], checkpoint: Optional[str] = None,
+               workers: int = MAX_WORKERS, chunk_size: int = WARMUP_CHUNK,
+               progress: Callable[[dict], None] = None) -> dict:
+    """
+    Populate zip_analysis_cache / places_cache (and the Census, address and rent
+    caches behind them) for every (ZCTA, business type) pair, `chunk_size` ZIPs at
+    a time. Upstream calls go through the usual rate limiter and upstream slots.
+    Progress is checkpointed after each chunk; a rerun with the same ZCTAs and
+    types skips finished pairs. The checkpoint is removed once everything is warm.
+    """
+    frame = zip_frame(positions)
+    zip_codes = frame["ZCTA5CE20"].astype(str).tolist()
+    signature = job_signature(zip_codes, business_types)
+    done = load_checkpoint(checkpoint, signature) if checkpoint else set()
+
+    total = len(zip_codes) * len(business_types)
+    stats = {"total": total, "done": len(done), "resumed": len(done), "failed": 0,
+             "elapsed": 0.0, "rate": 0.0, "eta": None}
+    t0 = time.time()
+
+    records = [row for _, row in frame.iterrows()]
+    pending = [r for r in records if any(f"{r['ZCTA5CE20']}|{t}" not in done for t in business_types)]
+    for i in range(0, len(pending), chunk_size):
+        chunk = pending[i:i + chunk_size]
+
+        fetch_census_batch([r["ZCTA5CE20"] for r in chunk])
+        centroids = [r.geometry.centroid for r in chunk]
+        prefetch_rent_scores([(c.y, c.x, r["ZCTA5CE20"]) for c, r in zip(centroids, chunk)])
+
+        # one worker per ZIP: its types run in turn, so the first fills zip_analysis_cache
+        # and the rest only add their competitor count (no racing writes to one row)
+        def _warm(r):
+            todo = [t for t in business_types if f"{r['ZCTA5CE20']}|{t}" not in done]
+            return [(t, evaluate_zip(r, place_type=t) is not None) for t in todo]
+
+        for r, outcome in zip(chunk, map_ordered(_warm, chunk, max_workers=workers)):
+            for t, ok in outcome or []:
+                if ok:
+                    done.add(f"{r['ZCTA5CE20']}|{t}")
+                else:
+                    stats["failed"] += 1
+
+        if checkpoint:
+            save_checkpoint(checkpoint, signature, done)
+
+        elapsed = time.time() - t0
+        warmed = len(done) - stats["resumed"]
+        rate = warmed / elapsed if elapsed > 0 else 0.0
+        stats.update(done=len(done), elapsed=elapsed, rate=rate,
+                     eta=(total - len(done) - stats["failed"]) / rate if rate > 0 else None)
+        if progress:
+            progress(dict(stats))
+
+    if checkpoint and len(done) == total and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    stats["elapsed"] = time.time() - t0
+    return stats
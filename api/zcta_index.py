@@ -0,0 +1,144 @@
+# api/zcta_index.py
+import math
+import os
+
+import numpy as np
+import shapely
+
+EARTH_RADIUS_M = 6_371_008.8   # mean Earth radius (IUGG)
+
+# Files making up a prebuilt index directory (see `manage.py build_zcta_index`)
+_ARRAYS = ("zip_codes", "bounds", "centroids", "inner_points", "wkb", "wkb_offsets")
+
+
+def haversine_m(lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """Great‑circle distance in metres from (lat, lng) to every (lats[i], lngs[i])."""
+    lat1, lng1 = math.radians(lat), math.radians(lng)
+    lat2, lng2 = np.radians(lats), np.radians(lngs)
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class ZctaIndex:
+    """
+    Prebuilt spatial index over ZCTA polygons (EPSG:4326).
+
+    Holds an STRtree of the polygon bounding boxes plus flat numpy arrays of
+    bounds, centroids and an interior point per ZCTA, so a radius query only
+    touches the handful of polygons near the search circle.
+
+    Geometries are either kept in memory (`from_geometries`) or stored as a
+    WKB blob that is memory‑mapped and decoded per candidate (`load`).
+    """
+
+    def __init__(self, zip_codes, bounds, centroids, inner_points,
+                 geometries=None, wkb=None, wkb_offsets=None):
+        self.zip_codes = zip_codes
+        self.bounds = bounds                  # (n, 4) minx, miny, maxx, maxy
+        self.centroids = centroids            # (n, 2) lat, lng
+        self.inner_points = inner_points      # (n, 2) lat, lng
+        self._geometries = geometries
+        self._wkb = wkb
+        self._wkb_offsets = wkb_offsets
+
+        self.tree = shapely.STRtree(shapely.box(*np.asarray(bounds).T))
+
+    @classmethod
+    def from_geometries(cls, zip_codes, geometries):
+        geometries = np.asarray(geometries, dtype=object)
+        centroids = shapely.centroid(geometries)
+        inner = shapely.point_on_surface(geometries)
+        return cls(
+            zip_codes=np.asarray(zip_codes).astype(str),
+            bounds=shapely.bounds(geometries),
+            centroids=np.column_stack([shapely.get_y(centroids), shapely.get_x(centroids)]),
+            inner_points=np.column_stack([shapely.get_y(inner), shapely.get_x(inner)]),
+            geometries=geometries,
+        )
+
+    @classmethod
+    def from_gdf(cls, gdf, zip_col: str = "ZCTA5CE20"):
+        return cls.from_geometries(gdf[zip_col].to_numpy(), gdf.geometry.to_numpy())
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True):
+        """Open an index written by `save`; arrays are memory‑mapped unless mmap=False."""
+        mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode)
+                  for name in _ARRAYS}
+        return cls(**arrays)
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return all(os.path.exists(os.path.join(directory, f"{name}.npy")) for name in _ARRAYS)
+
+    def save(self, directory: str) -> None:
+        """Write the index as plain .npy files (WKB geometries + offsets) into `directory`."""
+        os.makedirs(directory, exist_ok=True)
+        blobs = shapely.to_wkb(self.geometries_at(np.arange(len(self))))
+        lengths = np.fromiter((len(b) for b in blobs), dtype=np.int64, count=len(blobs))
+        arrays = {
+            "zip_codes":    np.asarray(self.zip_codes),
+            "bounds":       np.ascontiguousarray(self.bounds, dtype=np.float64),
+            "centroids":    np.ascontiguousarray(self.centroids, dtype=np.float64),
+            "inner_points": np.ascontiguousarray(self.inner_points, dtype=np.float64),
+            "wkb":          np.frombuffer(b"".join(blobs), dtype=np.uint8),
+            "wkb_offsets":  np.concatenate([[0], np.cumsum(lengths)]),
+        }
+        for name, arr in arrays.items():
+            np.save(os.path.join(directory, f"{name}.npy"), arr)
+
+    def __len__(self):
+        return len(self.zip_codes)
+
+    def geometries_at(self, positions) -> np.ndarray:
+        """Shapely geometries for the given row positions."""
+        positions = np.asarray(positions, dtype=np.int64)
+        if self._geometries is not None:
+            return self._geometries[positions]
+        offs = self._wkb_offsets
+        return shapely.from_wkb([self._wkb[offs[i]:offs[i + 1]].tobytes() for i in positions])
+
+    def query_bbox(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> np.ndarray:
+        """Positions of every ZCTA whose polygon intersects the box, sorted ascending."""
+        box = shapely.box(min_lng, min_lat, max_lng, max_lat)
+        candidates = self.tree.query(box)
+        if candidates.size == 0:
+            return candidates
+        return np.sort(candidates[shapely.intersects(self.geometries_at(candidates), box)])
+
+    def query_radius(self, lat: float, lng: float, radius_km: float) -> np.ndarray:
+        """
+        Positions of every ZCTA whose polygon comes within `radius_km` of (lat, lng),
+        sorted ascending (i.e. in source-file order).
+        """
+        radius_m = radius_km * 1000.0
+
+        # ---- bbox prefilter (latitude‑corrected degree extents)
+        dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+        coslat = max(math.cos(math.radians(lat)), 1e-6)
+        dlng = min(math.degrees(radius_m / (EARTH_RADIUS_M * coslat)), 180.0)
+        candidates = self.tree.query(shapely.box(lng - dlng, lat - dlat, lng + dlng, lat + dlat))
+        if candidates.size == 0:
+            return candidates
+
+        # ---- interior point inside the circle → polygon certainly intersects
+        pts = self.inner_points[candidates]
+        inside = haversine_m(lat, lng, pts[:, 0], pts[:, 1]) <= radius_m
+        accepted = candidates[inside]
+
+        # ---- the rest: exact distance in a local metric projection centred on the query
+        rest = candidates[~inside]
+        if rest.size:
+            kx = math.radians(1) * EARTH_RADIUS_M * coslat
+            ky = math.radians(1) * EARTH_RADIUS_M
+
+            def to_local(coords):
+                return np.column_stack([(coords[:, 0] - lng) * kx, (coords[:, 1] - lat) * ky])
+
+            local = shapely.transform(self.geometries_at(rest), to_local)
+            near = shapely.distance(local, shapely.Point(0.0, 0.0)) <= radius_m
+            accepted = np.concatenate([accepted, rest[near]])
+
+        return np.sort(accepted)